@@ -6,38 +6,83 @@ handlers (existing logic) but is implemented as a module so it can be
 replaced by a real LLM/agent (LangGraph / LangChain) later.
 
 Functions:
-- handle_message(tree, message) -> (response_text, tree_modified_flag)
+- async handle_message(tree, message, index=None, cache_key=None) -> (response_text, tree_modified_flag, new_tree)
+- handle_rules(...): the same, rule-based only and synchronous
 
+The rule-based path parses every command in the message with
+``intent_parser`` ("insert 3 left of 1 and 4 right of 1") and runs them as one
+batch.
 """
-import re
 from tree_utils import (
     calculate_height,
     find_leaf_nodes,
-    insert_node,
-    delete_node,
-    update_node,
     inorder_traversal,
     preorder_traversal,
     postorder_traversal,
-    search_node,
 )
+from tree_index import TreeIndex
+from intent_parser import parse
+from llm_cache import cache_key_for, llm_cache
+from tree_cache import tree_cache
+from metrics import observe_stage
+from starlette.concurrency import run_in_threadpool
 import os
 
 USE_LLM = os.environ.get("USE_LLM_AGENT", "0") in ("1", "true", "True")
+# Part of the answer cache key, so switching models doesn't serve old answers
+LLM_MODEL = os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo")
 
 # Try to import adapter lazily when LLMS are enabled
 _llm_adapter = None
+_invalid_tree_response = None
 if USE_LLM:
     try:
-        from ai_agent_adapter import llm_handle_message as _llm_handle
+        from ai_agent_adapter import INVALID_TREE_RESPONSE, llm_handle_message as _llm_handle
         _llm_adapter = _llm_handle
+        _invalid_tree_response = INVALID_TREE_RESPONSE
     except Exception:
         _llm_adapter = None
 
 
-def handle_message(tree, message):
+FALLBACK_RESPONSE = (
+    "Sorry, I didn't understand that. Try commands like 'insert 8 as left child of 4', "
+    "'delete 5', 'update 5 as 10', 'search for 5', 'what is the height', "
+    "or 'show inorder traversal'. Combine them with 'and'."
+)
+
+
+def _derived(tree, cache_key, key, compute):
+    """Read ``key`` from the cached analysis when a cache key is available."""
+    if cache_key is None:
+        return compute(tree)
+    return tree_cache.get_stats(*cache_key, tree)[key]
+
+
+async def _answer_cache(method, *args):
+    """Call an ``llm_cache`` method, in the threadpool when it touches disk."""
+    if llm_cache.persistent:
+        return await run_in_threadpool(getattr(llm_cache, method), *args)
+    return getattr(llm_cache, method)(*args)
+
+
+def _mutated(cache_key):
+    if cache_key is not None:
+        tree_cache.invalidate(cache_key[0])
+
+
+async def handle_message(tree, message, index=None, cache_key=None):
     """Process the incoming chat message and return a response.
 
+    ``index`` is an optional ``TreeIndex`` already built for ``tree``; node
+    lookups and mutations go through it instead of scanning the tree.
+    ``cache_key`` is ``(tree_id, tree_version)``; when given, read-only answers
+    come from the derived-result cache and mutations invalidate it.
+
+    With the LLM enabled, the provider is awaited (never blocking the event
+    loop); whenever it cannot answer, the rule-based handler answers instead.
+    Fingerprinting and the rule-based handler walk the tree, and the answer
+    cache's disk tier does blocking I/O, so they run in the threadpool.
+
     Returns: (response_text, modified, new_tree)
     - response_text: string response to show the user
     - modified: boolean indicating whether the tree was modified
@@ -48,86 +93,94 @@ def handle_message(tree, message):
 
     # If LLM adapter is enabled and available, delegate
     if USE_LLM and _llm_adapter:
+        answer_key = await run_in_threadpool(cache_key_for, tree, message, LLM_MODEL, cache_key)
+        if answer_key is not None:
+            cached = await _answer_cache("get", answer_key)
+            if cached is not None:
+                return cached, False, tree
         try:
-            resp, modified, new_tree = _llm_adapter(tree, message)
+            with observe_stage("llm"):
+                resp, modified, new_tree = await _llm_adapter(tree, message)
+            if modified:
+                _mutated(cache_key)
+            elif answer_key is not None and resp != _invalid_tree_response:
+                # A failed edit is not an answer worth repeating
+                await _answer_cache("put", answer_key, resp)
             return resp, modified, new_tree
         except Exception:
-            # If adapter fails, fall back to rule-based
+            # If adapter fails (LLMUnavailable), fall back to rule-based
             pass
 
-    user_message = (message or "").lower()
+    return await run_in_threadpool(handle_rules, tree, message, index, cache_key)
+
 
-    # Rule-based fallback (existing behavior)
+def handle_rules(tree, message, index=None, cache_key=None):
+    """Rule-based ``handle_message``: run every parsed command as one batch."""
     if tree is None:
         return "No tree selected.", False, tree
 
-    # Basic supervisor logic (keeps current behavior)
-    if "height" in user_message:
-        height = calculate_height(tree)
-        return f"The height of the tree is {height}.", False, tree
-    elif "leaf" in user_message:
-        leaves = find_leaf_nodes(tree)
-        return f"Leaf nodes are: {leaves}", False, tree
-    elif "insert" in user_message:
-        numbers = list(map(int, re.findall(r"\d+", user_message)))
-
-        if len(numbers) >= 2:
-            new_value = numbers[0]
-            parent_value = numbers[1]
-
-            position = "left" if "left" in user_message else "right"
-
-            inserted = insert_node(tree, parent_value, new_value, position)
-
-            if inserted:
-                return f"Inserted {new_value} as {position} child of {parent_value}.", True, tree
-            else:
-                return "Parent node not found.", False, tree
-        else:
-            return "Please provide the values to insert (e.g., 'Insert 8 as left child of 4').", False, tree
-    elif "delete" in user_message:
-        numbers = list(map(int, re.findall(r"\d+", user_message)))
-
-        if numbers:
-            value_to_delete = numbers[0]
-            new_tree = delete_node(tree, value_to_delete)
-            return f"Deleted node {value_to_delete}.", True, new_tree
-        else:
-            return "Please specify value to delete.", False, tree
-    elif "update" in user_message or "change" in user_message or "edit" in user_message:
-        numbers = list(map(int, re.findall(r"\d+", user_message)))
-
-        if len(numbers) >= 2:
-            old_value = numbers[0]
-            new_value = numbers[1]
-            updated_tree = update_node(tree, old_value, new_value)
-            if updated_tree and updated_tree is not False:
-                return f"Updated node {old_value} to {new_value}.", True, updated_tree
-            else:
-                return f"Node {old_value} not found.", False, tree
-        else:
-            return "Please provide both old and new values (e.g., 'update node 5 as 10' or 'change 5 to 10').", False, tree
-    elif "search" in user_message or "find" in user_message:
-        numbers = list(map(int, re.findall(r"\d+", user_message)))
-
-        if numbers:
-            value_to_search = numbers[0]
-            found = search_node(tree, value_to_search)
-            if found:
-                return f"✓ Found node {value_to_search} in the tree.", False, tree
-            else:
-                return f"✗ Node {value_to_search} not found in the tree.", False, tree
-        else:
-            return "Please specify the value to search for (e.g., 'search for 5').", False, tree
-    elif "inorder" in user_message:
-        result = inorder_traversal(tree)
-        return f"Inorder traversal: {result}", False, tree
-    elif "preorder" in user_message:
-        result = preorder_traversal(tree)
-        return f"Preorder traversal: {result}", False, tree
-    elif "postorder" in user_message:
-        result = postorder_traversal(tree)
-        return f"Postorder traversal: {result}", False, tree
-
-    # Default fallback
-    return "Sorry, I didn't understand that. Try commands like 'insert 8 as left child of 4', 'delete 5', 'update 5 as 10', 'search for 5', 'what is the height', or 'show inorder traversal'.", False, tree
+    commands = parse(message)
+    if not commands:
+        return FALLBACK_RESPONSE, False, tree
+
+    # One batch: every command goes through the same index, and /chat
+    # persists the combined change log with a single commit.
+    if index is None and any(command.action in _INDEXED_ACTIONS for command in commands):
+        index = TreeIndex(tree)
+
+    responses = []
+    modified = False
+    for command in commands:
+        current = index.tree if index is not None else tree
+        # Cached results describe the tree before this batch changed it
+        text, changed = _run_command(command, current, index, None if modified else cache_key)
+        if changed:
+            _mutated(cache_key)
+            modified = True
+        responses.append(text)
+
+    new_tree = index.tree if index is not None else tree
+    return "\n".join(responses), modified, new_tree
+
+
+_INDEXED_ACTIONS = frozenset({"insert", "delete", "update", "search"})
+
+_TRAVERSALS = {
+    "inorder": ("Inorder", inorder_traversal),
+    "preorder": ("Preorder", preorder_traversal),
+    "postorder": ("Postorder", postorder_traversal),
+}
+
+
+def _run_command(command, tree, index, cache_key):
+    """Apply one parsed command; returns ``(response_text, modified)``."""
+    if command.error is not None:
+        return command.error, False
+
+    action = command.action
+    if action == "height":
+        height = _derived(tree, cache_key, "height", calculate_height)
+        return f"The height of the tree is {height}.", False
+    if action == "leaves":
+        leaves = _derived(tree, cache_key, "leaves", find_leaf_nodes)
+        return f"Leaf nodes are: {leaves}", False
+    if action in _TRAVERSALS:
+        label, compute = _TRAVERSALS[action]
+        return f"{label} traversal: {_derived(tree, cache_key, action, compute)}", False
+
+    if action == "insert":
+        if index.insert(command.parent, command.value, command.side) is None:
+            return "Parent node not found.", False
+        return f"Inserted {command.value} as {command.side} child of {command.parent}.", True
+    if action == "delete":
+        if not index.delete(command.value):
+            return f"Node {command.value} not found.", False
+        return f"Deleted node {command.value}.", True
+    if action == "update":
+        if index.update(command.value, command.new_value) is None:
+            return f"Node {command.value} not found.", False
+        return f"Updated node {command.value} to {command.new_value}.", True
+
+    if index.search(command.value):
+        return f"✓ Found node {command.value} in the tree.", False
+    return f"✗ Node {command.value} not found in the tree.", False
@@ -1,33 +1,200 @@
 """
 LLM Adapter for AI agent integration.
 
-Uses environment variables to configure an LLM provider. Supports OpenAI API.
-If the LLM provider is not configured or packages are missing, the adapter
-raises ImportError to allow the caller to fallback to rule-based logic.
+Talks to an OpenAI-compatible ``/chat/completions`` endpoint over async httpx.
+Whenever the provider cannot answer, it raises ``LLMUnavailable`` and the
+caller falls back to the rule-based agent. That covers a missing key,
+timeouts (including a long wait for a concurrency slot), errors and an open
+circuit.
+
+Protection against a slow or failing provider:
+
+* every call has a deadline of ``LLM_TIMEOUT_SECONDS``, which includes the
+  wait for a concurrency slot
+* at most ``LLM_MAX_CONCURRENCY`` calls are in flight per process
+* after ``LLM_BREAKER_FAILURES`` consecutive failures the circuit opens and
+  calls fail immediately for ``LLM_BREAKER_RESET_SECONDS``. A single trial
+  call then decides whether it closes again.
 
 Supported env vars:
 - USE_LLM_AGENT=1 to enable LLM usage
 - OPENAI_API_KEY for OpenAI API key
 - OPENAI_MODEL defaults to 'gpt-3.5-turbo'
+- OPENAI_BASE_URL defaults to 'https://api.openai.com/v1'
+
+The tree goes into the prompt in the compact form from ``prompt_encoding``,
+within ``LLM_PROMPT_TOKEN_BUDGET``. A model that only saw a summarized tree
+may not modify it: edit requests for such trees go straight to the rule-based
+agent, and edits the model makes anyway are refused. An edit without a
+readable tree is answered with ``INVALID_TREE_RESPONSE`` and nothing changes.
 
-The adapter exposes a single function `llm_handle_message(tree, message)`
-which returns (response_text, modified, new_tree).
+The adapter exposes `async llm_handle_message(tree, message)`, which returns
+(response_text, modified, new_tree).
 """
 from __future__ import annotations
+import asyncio
 import os
 import json
 import logging
+import threading
+import time
 from typing import Tuple
 
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from intent_parser import parse
+from metrics import LLM_CALLS, LLM_CALL_SECONDS, LLM_CIRCUIT_OPEN
+from prompt_encoding import LLM_PROMPT_TOKEN_BUDGET, decode_compact, encode_for_prompt
+
 logger = logging.getLogger(__name__)
 
-def _serialize_tree(tree) -> str:
-    """Safely serialize tree to JSON string for prompt."""
-    try:
-        return json.dumps(tree, indent=2)
-    except Exception as e:
-        logger.warning(f"Failed to serialize tree to JSON: {e}")
-        return str(tree)
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", "20"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "4"))
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.environ.get("LLM_BREAKER_RESET_SECONDS", "30"))
+
+INVALID_TREE_RESPONSE = (
+    "Sorry, I couldn't apply that change: the updated tree I produced was invalid. "
+    "The tree was not modified."
+)
+
+
+class LLMUnavailable(Exception):
+    """The provider could not answer; use the rule-based agent instead."""
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open trial -> closed."""
+
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURES,
+                 reset_timeout=LLM_BREAKER_RESET_SECONDS, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if self.clock() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self):
+        """Whether a call may go out now. In half-open state only one trial may."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+        LLM_CIRCUIT_OPEN.set(0)
+
+    def release_trial(self):
+        """Free the half-open trial slot without recording an outcome."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            trial, self._trial_in_flight = self._trial_in_flight, False
+            if not trial and self.failures < self.failure_threshold:
+                return
+            if self._opened_at is None:
+                logger.warning(f"LLM circuit opened after {self.failures} failures")
+            self._opened_at = self.clock()
+        LLM_CIRCUIT_OPEN.set(1)
+
+
+class LLMClient:
+    def __init__(self, base_url=OPENAI_BASE_URL, api_key=None, model=None,
+                 timeout=LLM_TIMEOUT_SECONDS, max_concurrency=LLM_MAX_CONCURRENCY,
+                 breaker=None, transport=None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model or os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo")
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._transport = transport
+        self._client = None
+
+    def _http(self):
+        # Created on first use so it binds to the serving event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, timeout=self.timeout, transport=self._transport
+            )
+        return self._client
+
+    async def complete(self, messages, temperature=0.1, max_tokens=500):
+        """Return the content of the first choice, or raise ``LLMUnavailable``."""
+        if not self.api_key:
+            raise LLMUnavailable("OPENAI_API_KEY environment variable not set")
+        if not self.breaker.allow():
+            LLM_CALLS.labels(result="circuit_open").inc()
+            raise LLMUnavailable("LLM circuit is open")
+
+        start = time.perf_counter()
+        try:
+            content = await asyncio.wait_for(
+                self._post(messages, temperature, max_tokens), self.timeout
+            )
+        except asyncio.TimeoutError:
+            # Covers both a slow provider and waiting too long for a slot
+            result, error = "timeout", f"no answer within {self.timeout}s"
+        except (httpx.HTTPError, KeyError, IndexError, TypeError, ValueError) as exc:
+            result, error = "error", f"{type(exc).__name__}: {exc}"
+        except asyncio.CancelledError:
+            # The request went away, which says nothing about the provider;
+            # just don't leave a half-open trial hanging
+            self.breaker.release_trial()
+            raise
+        else:
+            self.breaker.record_success()
+            LLM_CALLS.labels(result="ok").inc()
+            return content
+        finally:
+            LLM_CALL_SECONDS.observe(time.perf_counter() - start)
+
+        self.breaker.record_failure()
+        LLM_CALLS.labels(result=result).inc()
+        logger.error(f"LLM call failed: {error}")
+        raise LLMUnavailable(error)
+
+    async def _post(self, messages, temperature, max_tokens):
+        async with self._semaphore:
+            response = await self._http().post(
+                "/chat/completions",
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                json={"model": self.model, "messages": messages,
+                      "temperature": temperature, "max_tokens": max_tokens},
+            )
+            response.raise_for_status()
+            return response.json()["choices"][0]["message"]["content"].strip()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+llm_client = LLMClient(api_key=os.environ.get("OPENAI_API_KEY"))
 
 
 def _parse_llm_response(response_text: str) -> dict:
@@ -50,60 +217,80 @@ def _parse_llm_response(response_text: str) -> dict:
         return {"response": response_text, "modified": False, "tree": None}
 
 
-def llm_handle_message(tree, message) -> Tuple[str, bool, dict]:
-    """Call OpenAI API to handle the message and optionally modify the tree.
+_TREE_FORMAT = (
+    "compact form: value(left,right); a leaf is just its value and an empty "
+    "child is left blank, e.g. 1(2,3(,4))"
+)
 
-    Returns: (response_text, modified_flag, new_tree)
-    Raises: ImportError if OpenAI is not available or API key is missing.
-    """
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        raise ImportError("OPENAI_API_KEY environment variable not set")
 
-    try:
-        import openai
-    except ImportError:
-        raise ImportError("openai package not installed. Install with: pip install openai")
+def build_prompt(tree, message, token_budget=LLM_PROMPT_TOKEN_BUDGET) -> str:
+    return _compose_prompt(*encode_for_prompt(tree, message, token_budget), message)
 
-    openai.api_key = api_key
-    model = os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo")
 
-    prompt = (
+def _compose_prompt(encoded_tree, summarized, message) -> str:
+    if summarized:
+        tree_note = (
+            "Subtrees written as [n=N h=H MIN..MAX] were left out to keep the prompt short: "
+            "N nodes, height H, values MIN to MAX. Lines of the form 'V at depth D: ...' "
+            "show the subtree under node V.\n\n"
+        )
+        modify_rule = (
+            "2. Only part of the tree is shown, so never modify it; always set 'modified': false.\n"
+        )
+    else:
+        tree_note = ""
+        modify_rule = "2. If the user asks to modify the tree (insert/delete), do so and set 'modified': true.\n"
+    return (
         "You are an intelligent tree assistant.\n\n"
-        "CURRENT TREE (JSON):\n" + _serialize_tree(tree) + "\n\n"
+        f"CURRENT TREE ({_TREE_FORMAT}):\n" + encoded_tree + "\n\n"
+        + tree_note +
         "USER MESSAGE: \"" + (message or "") + "\"\n\n"
         "INSTRUCTIONS:\n"
         "1. Answer the user's question about the tree (e.g., height, leaves, structure).\n"
-        "2. If the user asks to modify the tree (insert/delete), do so and set 'modified': true.\n"
+        + modify_rule +
         "3. Always respond with valid JSON containing exactly these fields:\n"
         "   - 'response': Your text answer to the user (string)\n"
         "   - 'modified': true if you modified the tree, false otherwise (boolean)\n"
-        "   - 'tree': The updated tree object if modified, null otherwise\n\n"
+        "   - 'tree': The updated tree in the same compact form (string) if modified, null otherwise\n\n"
         "EXAMPLE RESPONSE:\n"
         '{"response": "The tree has 3 nodes.", "modified": false, "tree": null}\n\n'
         "YOUR RESPONSE (JSON only):"
     )
 
-    try:
-        response = openai.ChatCompletion.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a tree data structure assistant. Respond only in valid JSON format."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1,
-            max_tokens=500,
-        )
-        out = response.choices[0].message.content.strip()
-    except Exception as e:
-        logger.error(f"OpenAI API call failed: {e}")
-        raise ImportError(f"LLM provider error: {e}")
+
+async def llm_handle_message(tree, message, client=None) -> Tuple[str, bool, dict]:
+    """Ask the LLM to handle the message and optionally modify the tree.
+
+    Returns: (response_text, modified_flag, new_tree)
+    Raises: LLMUnavailable when the provider cannot answer.
+    """
+    client = client or llm_client
+    # Encoding and decoding walk the whole tree; keep them off the event loop
+    encoded_tree, summarized = await run_in_threadpool(encode_for_prompt, tree, message)
+    if summarized and any(command.mutating for command in parse(message)):
+        # The model can't rewrite a tree it only partly sees; the rules can
+        raise LLMUnavailable("Edits to a summarized tree go to the rule-based agent")
+    out = await client.complete([
+        {"role": "system", "content": "You are a tree data structure assistant. Respond only in valid JSON format."},
+        {"role": "user", "content": _compose_prompt(encoded_tree, summarized, message)},
+    ])
 
     # Parse the model output as JSON
     payload = _parse_llm_response(out)
     response_text = payload.get("response", "I encountered an issue processing your request.")
     modified = bool(payload.get("modified", False))
-    new_tree = payload.get("tree") if modified else tree
+    new_tree = tree
+    if modified:
+        if summarized:
+            # Whatever it sent back would drop the subtrees it never saw
+            raise LLMUnavailable("LLM modified a tree it only saw in summary")
+        encoded = payload.get("tree")
+        try:
+            if not isinstance(encoded, str):
+                raise ValueError(f"expected the tree in compact form, got {type(encoded).__name__}")
+            new_tree = await run_in_threadpool(decode_compact, encoded)
+        except ValueError as exc:
+            logger.warning(f"LLM returned an unreadable tree: {exc}")
+            return INVALID_TREE_RESPONSE, False, tree
 
     return response_text, modified, new_tree
-
@@ -0,0 +1,28 @@
+"""Add revision counter to tree sessions
+
+Revision ID: 9d3f1a7c2b64
+Revises: 5b0af4feb27c
+Create Date: 2026-10-18 09:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d3f1a7c2b64'
+down_revision: Union[str, Sequence[str], None] = '5b0af4feb27c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('tree_sessions', sa.Column('revision', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('tree_sessions', 'revision')
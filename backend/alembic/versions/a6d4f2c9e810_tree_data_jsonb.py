@@ -0,0 +1,50 @@
+"""Store tree_data as jsonb on Postgres
+
+Revision ID: a6d4f2c9e810
+Revises: e7b25c9a41f3
+Create Date: 2026-10-18 14:21:37.604118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6d4f2c9e810'
+down_revision: Union[str, Sequence[str], None] = 'e7b25c9a41f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The initial migration created a json column, but path updates
+    # (tree_store.build_patch_statement) call jsonb_set on it. Other
+    # dialects have a single JSON type, so there is nothing to change.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.alter_column(
+        'tree_sessions',
+        'tree_data',
+        existing_type=sa.JSON(),
+        type_=postgresql.JSONB(),
+        existing_nullable=True,
+        postgresql_using='tree_data::jsonb',
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.alter_column(
+        'tree_sessions',
+        'tree_data',
+        existing_type=postgresql.JSONB(),
+        type_=sa.JSON(),
+        existing_nullable=True,
+        postgresql_using='tree_data::json',
+    )
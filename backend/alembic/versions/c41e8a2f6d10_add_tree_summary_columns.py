@@ -0,0 +1,69 @@
+"""Add node_count / height summary columns to tree sessions
+
+Revision ID: c41e8a2f6d10
+Revises: 9d3f1a7c2b64
+Create Date: 2026-10-18 10:03:47.815320
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from tree_utils import measure_tree
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e8a2f6d10'
+down_revision: Union[str, Sequence[str], None] = '9d3f1a7c2b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('tree_sessions', sa.Column('node_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('tree_sessions', sa.Column('height', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_tree_sessions_user_id_id', 'tree_sessions', ['user_id', 'id'], unique=False)
+
+    # Backfill the summary for existing trees
+    tree_sessions = sa.table(
+        'tree_sessions',
+        sa.column('id', sa.Integer()),
+        sa.column('tree_data', sa.JSON()),
+        sa.column('node_count', sa.Integer()),
+        sa.column('height', sa.Integer()),
+    )
+    update = (
+        tree_sessions.update()
+        .where(tree_sessions.c.id == sa.bindparam('tree_id'))
+        .values(node_count=sa.bindparam('count'), height=sa.bindparam('depth'))
+    )
+    bind = op.get_bind()
+    # Walk the table in id order a batch at a time, so only one batch of
+    # documents is held in memory
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(tree_sessions.c.id, tree_sessions.c.tree_data)
+            .where(tree_sessions.c.id > last_id)
+            .order_by(tree_sessions.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        params = []
+        for tree_id, tree_data in rows:
+            node_count, height = measure_tree(tree_data)
+            params.append({'tree_id': tree_id, 'count': node_count, 'depth': height})
+        bind.execute(update, params)
+        last_id = rows[-1][0]
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_tree_sessions_user_id_id', table_name='tree_sessions')
+    op.drop_column('tree_sessions', 'height')
+    op.drop_column('tree_sessions', 'node_count')
@@ -0,0 +1,50 @@
+"""Chat history composite index and timestamptz column
+
+Revision ID: e7b25c9a41f3
+Revises: c41e8a2f6d10
+Create Date: 2026-10-18 10:48:05.227961
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b25c9a41f3'
+down_revision: Union[str, Sequence[str], None] = 'c41e8a2f6d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing values are ISO-8601 strings with an offset, which Postgres casts directly
+    with op.batch_alter_table('chat_messages') as batch_op:
+        batch_op.alter_column(
+            'timestamp',
+            existing_type=sa.String(),
+            type_=sa.DateTime(timezone=True),
+            existing_nullable=True,
+            postgresql_using='"timestamp"::timestamptz',
+        )
+    op.create_index(
+        'ix_chat_messages_tree_id_user_id_id',
+        'chat_messages',
+        ['tree_id', 'user_id', 'id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_chat_messages_tree_id_user_id_id', table_name='chat_messages')
+    with op.batch_alter_table('chat_messages') as batch_op:
+        batch_op.alter_column(
+            'timestamp',
+            existing_type=sa.DateTime(timezone=True),
+            type_=sa.String(),
+            existing_nullable=True,
+            postgresql_using='to_char("timestamp" AT TIME ZONE \'UTC\', \'YYYY-MM-DD"T"HH24:MI:SS.US"+00:00"\')',
+        )
@@ -1,25 +1,33 @@
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from database import SessionLocal
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db
 from models import User
+from principal_cache import Principal, principal_cache
+from metrics import observe_stage
 import os
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def hash_password(password: str):
-    return pwd_context.hash(password)
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# Sync helpers for scripts; request handlers use passwords.password_hasher
+from passwords import hash_password, verify_password, pwd_context
 
 SECRET_KEY = os.environ.get("SECRET_KEY", "supersecretkey")
 ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+# Comma-separated emails allowed to use the /admin endpoints
+ADMIN_EMAILS = frozenset(
+    email.strip().lower()
+    for email in os.environ.get("ADMIN_EMAILS", "").split(",")
+    if email.strip()
+)
+
+
+def token_claims(user: User):
+    """Claims identifying ``user``; ``uid`` lets auth load it by primary key."""
+    return {"sub": user.email, "uid": user.id}
 
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
@@ -43,17 +51,67 @@ def create_refresh_token(data: dict, expires_delta: timedelta | None = None):
 
 
 def verify_refresh_token(token: str):
+    """Return the identity claims (``sub`` and, if present, ``uid``) or None."""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        return email
     except JWTError:
         return None
+    if payload.get("sub") is None:
+        return None
+    return {key: payload[key] for key in ("sub", "uid") if key in payload}
+
+def _token_identity(token: str):
+    """``(uid, email)`` of a valid token, else ``(None, None)``. Never touches the database."""
+    principal = principal_cache.peek(token)
+    if principal is not None:
+        return principal.id, principal.email
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None, None
+    return payload.get("uid"), payload.get("sub")
+
+
+def user_id_from_token(token: str):
+    """The ``uid`` claim of a valid token, else None. Never touches the database."""
+    return _token_identity(token)[0]
+
+
+def is_admin_email(email) -> bool:
+    return email is not None and email.lower() in ADMIN_EMAILS
+
+
+def is_admin_token(token: str) -> bool:
+    """Whether ``token`` is valid and belongs to an admin. Never touches the database."""
+    return is_admin_email(_token_identity(token)[1])
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme),
+                           db: AsyncSession = Depends(get_db)) -> Principal:
+    """
+    Resolve the bearer token to a ``Principal``.
+
+    Cached tokens need neither JWT decoding nor a query. On a miss the user is
+    loaded by primary key from the ``uid`` claim (by email for older tokens).
+    """
+    with observe_stage("auth"):
+        return await _authenticate(token, db)
+
+
+async def require_admin(current_user: Principal = Depends(get_current_user)) -> Principal:
+    """Dependency restricting an endpoint to ``ADMIN_EMAILS``."""
+    if not is_admin_email(current_user.email):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
+
+
+async def _authenticate(token: str, db: AsyncSession) -> Principal:
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -67,11 +125,25 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
 
-    db = SessionLocal()
-    user = db.query(User).filter(User.email == email).first()
-    db.close()
+    user_id = payload.get("uid")
+    if user_id is not None:
+        user = await db.get(User, user_id)
+        if user is not None and user.email != email:
+            user = None
+    else:
+        user = await db.scalar(select(User).where(User.email == email))
 
     if user is None:
         raise credentials_exception
 
-    return user
\ No newline at end of file
+    principal = Principal(id=user.id, email=user.email)
+    principal_cache.put(token, principal, payload["exp"])
+    return principal
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_principals(mapper, connection, target):
+    # Bulk UPDATE/DELETE statements bypass these events; call
+    # principal_cache.invalidate_user() directly after those.
+    principal_cache.invalidate_user(target.id)
\ No newline at end of file
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for ``tree_utils`` and the JSON round trip of ``tree_data``.
+
+Every operation is timed on synthetic trees of each shape and size:
+
+* ``balanced``: ``build_balanced`` over ``range(n)``
+* ``skewed``: a right-leaning chain, the worst case for depth
+* ``random``: each node attached to a uniformly random free child slot
+  (seeded, so runs are reproducible)
+
+Lookups target the last node in preorder, the worst case for the preorder
+search behind ``find_node``. Mutations are chosen so repeated runs leave the
+tree unchanged after the first call. The builders don't depend on shape and
+are only timed under ``balanced``.
+
+Usage (from ``backend/``)::
+
+    python benchmarks/bench_tree_utils.py
+    python benchmarks/bench_tree_utils.py --sizes 10 1000 100000 1000000
+    python benchmarks/bench_tree_utils.py --save benchmarks/baselines/local.json
+    python benchmarks/bench_tree_utils.py --compare benchmarks/baselines/local.json
+
+``--compare`` exits with status 1 if any operation's median exceeds
+``--threshold`` times its baseline. Baselines are only comparable on the
+same machine and Python version. Both are recorded in the file.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import tree_utils  # noqa: E402
+
+SCHEMA_VERSION = 1
+DEFAULT_SIZES = (10, 1_000, 100_000)
+SHAPES = ("balanced", "skewed", "random")
+
+
+# ---------- synthetic trees ----------
+
+def _node(value):
+    return {"value": value, "left": None, "right": None}
+
+
+def make_tree(shape, size, seed=0):
+    if size < 1:
+        raise ValueError("size must be at least 1")
+    if shape == "balanced":
+        return tree_utils.build_balanced(range(size), count=size)
+    if shape == "skewed":
+        root = current = _node(0)
+        for value in range(1, size):
+            current["right"] = current = _node(value)
+        return root
+    if shape == "random":
+        rng = random.Random(seed)
+        values = list(range(size))
+        rng.shuffle(values)
+        root = _node(values[0])
+        slots = [(root, "left"), (root, "right")]
+        for value in values[1:]:
+            index = rng.randrange(len(slots))
+            parent, side = slots[index]
+            slots[index] = slots[-1]
+            slots.pop()
+            parent[side] = child = _node(value)
+            slots.append((child, "left"))
+            slots.append((child, "right"))
+        return root
+    raise ValueError(f"Unknown shape: {shape}")
+
+
+# ---------- operations ----------
+
+def _drain(iterator):
+    for _ in iterator:
+        pass
+
+
+def operations(shape, size, tree):
+    """``{name: zero-argument callable}`` for one tree."""
+    last = tree_utils.preorder_traversal(tree)[-1]
+    leaf = tree_utils.find_leaf_nodes(tree)[-1]
+    missing = -1
+    try:
+        encoded = json.dumps(tree)
+    except RecursionError:
+        # Deep chains exceed the json module's nesting limit
+        encoded = None
+
+    def json_loads():
+        if encoded is None:
+            raise RecursionError("tree too deep to encode")
+        return json.loads(encoded)
+
+    ops = {
+        "iter_preorder": lambda: _drain(tree_utils.iter_preorder(tree)),
+        "iter_inorder": lambda: _drain(tree_utils.iter_inorder(tree)),
+        "iter_postorder": lambda: _drain(tree_utils.iter_postorder(tree)),
+        "iter_with_depth": lambda: _drain(tree_utils.iter_with_depth(tree)),
+        "preorder_traversal": lambda: tree_utils.preorder_traversal(tree),
+        "inorder_traversal": lambda: tree_utils.inorder_traversal(tree),
+        "postorder_traversal": lambda: tree_utils.postorder_traversal(tree),
+        "calculate_height": lambda: tree_utils.calculate_height(tree),
+        "measure_tree": lambda: tree_utils.measure_tree(tree),
+        "find_leaf_nodes": lambda: tree_utils.find_leaf_nodes(tree),
+        "analyze_tree": lambda: tree_utils.analyze_tree(tree),
+        "find_node": lambda: tree_utils.find_node(tree, last),
+        "search_node_missing": lambda: tree_utils.search_node(tree, missing),
+        # The first call adds a child; later calls replace it with an equal one
+        "insert_node": lambda: tree_utils.insert_node(tree, leaf, missing - 1, "left"),
+        # delete_node walks the whole tree either way; a missing value changes nothing
+        "delete_node": lambda: tree_utils.delete_node(tree, missing),
+        "update_node": lambda: tree_utils.update_node(tree, last, last),
+        "json_dumps": lambda: json.dumps(tree),
+        "json_loads": json_loads,
+    }
+    if shape == "balanced":
+        ops["build_balanced"] = lambda: tree_utils.build_balanced(range(size), count=size)
+        ops["build_from_level_order"] = lambda: tree_utils.build_from_level_order(range(size))
+    return ops
+
+
+# ---------- timing ----------
+
+def time_call(fn, repeat, min_time):
+    """
+    ``(median, min, loops)`` seconds per call over ``repeat`` rounds, where
+    each round makes ``loops`` calls and lasts at least ``min_time``.
+    """
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+    rounds = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        rounds.append((time.perf_counter() - start) / loops)
+    return statistics.median(rounds), min(rounds), loops
+
+
+def run(sizes=DEFAULT_SIZES, shapes=SHAPES, repeat=5, min_time=0.05, only=None, log=print):
+    """Time every operation; returns a list of result dicts."""
+    results = []
+    for shape in shapes:
+        for size in sizes:
+            tree = make_tree(shape, size)
+            for name, fn in operations(shape, size, tree).items():
+                if only and name not in only:
+                    continue
+                entry = {"op": name, "shape": shape, "size": size}
+                try:
+                    median, best, loops = time_call(fn, repeat, min_time)
+                except RecursionError:
+                    entry["error"] = "RecursionError"
+                    log(f"{shape:>8} {size:>9}  {name:<22}  RecursionError")
+                else:
+                    entry.update(median_s=median, min_s=best, loops=loops, repeat=repeat)
+                    log(f"{shape:>8} {size:>9}  {name:<22} {_format_seconds(median)}")
+                results.append(entry)
+    return results
+
+
+def _format_seconds(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:8.2f} {unit}"
+    return f"{seconds / 1e-9:8.2f} ns"
+
+
+# ---------- baselines ----------
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_report(results):
+    return {
+        "schema": SCHEMA_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(baseline, results, threshold):
+    """
+    Match results to the baseline by (op, shape, size). Returns rows of
+    ``(key, baseline_s, current_s, ratio, status)``.
+    """
+    previous = {
+        (entry["op"], entry["shape"], entry["size"]): entry
+        for entry in baseline["results"]
+    }
+    rows = []
+    for entry in results:
+        key = (entry["op"], entry["shape"], entry["size"])
+        old = previous.get(key)
+        if old is None or "median_s" not in old or "median_s" not in entry:
+            status = "new" if old is None else "n/a"
+            rows.append((key, old and old.get("median_s"), entry.get("median_s"), None, status))
+            continue
+        ratio = entry["median_s"] / old["median_s"]
+        if ratio > threshold:
+            status = "REGRESSION"
+        elif ratio < 1 / threshold:
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append((key, old["median_s"], entry["median_s"], ratio, status))
+    return rows
+
+
+def _print_comparison(rows):
+    for (op, shape, size), old, new, ratio, status in rows:
+        old_text = _format_seconds(old) if old is not None else " " * 11
+        new_text = _format_seconds(new) if new is not None else " " * 11
+        ratio_text = f"{ratio:6.2f}x" if ratio is not None else " " * 7
+        print(f"{shape:>8} {size:>9}  {op:<22} {old_text} -> {new_text} {ratio_text}  {status}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=list(SHAPES))
+    parser.add_argument("--ops", nargs="+", help="only run these operations")
+    parser.add_argument("--repeat", type=int, default=5, help="timed rounds per operation")
+    parser.add_argument("--min-time", type=float, default=0.05,
+                        help="minimum seconds per round (more calls per round if faster)")
+    parser.add_argument("--save", metavar="PATH", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("schema") != SCHEMA_VERSION:
+            parser.error(f"{args.compare}: unsupported baseline schema {baseline.get('schema')}")
+        if baseline.get("python") != platform.python_version():
+            print(f"warning: baseline was taken on Python {baseline.get('python')}", file=sys.stderr)
+
+    results = run(args.sizes, args.shapes, args.repeat, args.min_time, set(args.ops or ()),
+                  log=print if baseline is None else (lambda line: None))
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(make_report(results), f, indent=2)
+            f.write("\n")
+        print(f"Saved {len(results)} results to {args.save}")
+
+    if baseline is not None:
+        rows = compare(baseline, results, args.threshold)
+        _print_comparison(rows)
+        regressions = [row for row in rows if row[4] == "REGRESSION"]
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold}x", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
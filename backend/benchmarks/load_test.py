@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+HTTP load test for the register -> create tree -> insert / chat flow.
+
+Starts the app under uvicorn on a throwaway SQLite database (or the
+``--database-url`` you pass, e.g. a scratch local Postgres), or targets a
+running server with ``--url``. ``--users`` virtual users each register,
+create a tree and then send requests back to back for ``--duration``
+seconds. Each request is drawn from a weighted mix of:
+
+* ``tree``: get / insert / search / stats on the user's tree
+* ``chat``: rule-based agent commands (``USE_LLM_AGENT=0`` on the local server)
+* ``auth``: password login, which pays the bcrypt cost
+
+Usage (from ``backend/``)::
+
+    python benchmarks/load_test.py --users 20 --duration 30
+    python benchmarks/load_test.py --mix tree=60,chat=30,auth=10 --save load.json
+    python benchmarks/load_test.py --database-url postgresql://postgres@localhost/scratch
+    python benchmarks/load_test.py --url http://localhost:8000
+
+The summary lists throughput and latency percentiles per operation. Setup
+requests (register, create) are reported separately, not counted in the
+totals. ``--save`` writes the same numbers as JSON to track across releases.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+DEFAULT_MIX = {"tree": 70, "chat": 20, "auth": 10}
+TREE_OPS = {"tree_get": 30, "tree_insert": 40, "tree_search": 15, "tree_stats": 15}
+CHAT_MESSAGES = ("what is the height", "show inorder traversal", "search for {value}",
+                 "insert {new} as {side} child of {parent}")
+PASSWORD = "LoadTest123"
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown traffic kind {name!r}")
+        mix[name] = float(weight)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("mix needs at least one positive weight")
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, op, seconds, status):
+        self.latencies[op].append(seconds)
+        self.statuses[op][str(status)] += 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors[op] += 1
+
+    def summary(self, elapsed):
+        ops = {}
+        for op, latencies in sorted(self.latencies.items()):
+            ordered = sorted(latencies)
+            ops[op] = {
+                "requests": len(ordered),
+                "errors": self.errors[op],
+                "rps": len(ordered) / elapsed if elapsed else 0.0,
+                "mean_ms": 1000 * sum(ordered) / len(ordered),
+                **{
+                    f"p{label}_ms": 1000 * percentile(ordered, fraction)
+                    for label, fraction in (("50", 0.50), ("90", 0.90), ("95", 0.95), ("99", 0.99))
+                },
+                "max_ms": 1000 * ordered[-1],
+                "statuses": dict(self.statuses[op]),
+            }
+        all_latencies = sorted(x for values in self.latencies.values() for x in values)
+        total = len(all_latencies)
+        return {
+            "elapsed_s": elapsed,
+            "requests": total,
+            "errors": sum(self.errors.values()),
+            "rps": total / elapsed if elapsed else 0.0,
+            "p50_ms": 1000 * percentile(all_latencies, 0.50) if total else None,
+            "p99_ms": 1000 * percentile(all_latencies, 0.99) if total else None,
+            "ops": ops,
+        }
+
+
+class VirtualUser:
+    """One client session: its own account, token and tree."""
+
+    def __init__(self, client, rng, tree_size, setup_stats, stats):
+        self.client = client
+        self.rng = rng
+        self.tree_size = tree_size
+        self.setup_stats = setup_stats
+        self.stats = stats
+        self.email = f"load-{os.urandom(6).hex()}@example.com"
+        self.headers = {}
+        self.tree_id = None
+        # Nodes are numbered like a heap, so the free child slots are known
+        self.values = list(range(1, tree_size + 1))
+        self.open_slots = [
+            (value, side)
+            for value in self.values
+            for side, child in (("left", 2 * value), ("right", 2 * value + 1))
+            if child > tree_size
+        ]
+        self.next_value = tree_size + 1
+
+    async def _request(self, stats, op, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=self.headers, **kwargs)
+        except httpx.HTTPError as exc:
+            stats.record(op, time.perf_counter() - start, type(exc).__name__)
+            return None
+        stats.record(op, time.perf_counter() - start, response.status_code)
+        return response
+
+    async def setup(self, attempts=10):
+        for _ in range(attempts):
+            r = await self._request(self.setup_stats, "register", "POST", "/auth/register",
+                                    json={"email": self.email, "password": PASSWORD})
+            # 503 is password-hashing backpressure when many users register at once
+            if r is None or r.status_code != 503:
+                break
+            await asyncio.sleep(float(r.headers.get("Retry-After", "1")))
+        if r is None or r.status_code != 200:
+            return False
+        self.headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        r = await self._request(self.setup_stats, "create_tree", "POST", "/trees",
+                                json={"name": "load", "level_order": self.values})
+        if r is None or r.status_code != 200:
+            return False
+        self.tree_id = r.json()["id"]
+        return True
+
+    def _take_slot(self):
+        """Claim a random free child slot; returns ``(parent, side, new_value)``."""
+        index = self.rng.randrange(len(self.open_slots))
+        slot = self.open_slots[index]
+        self.open_slots[index] = self.open_slots[-1]
+        self.open_slots.pop()
+        new_value = self.next_value
+        self.next_value += 1
+        self.values.append(new_value)
+        self.open_slots += [(new_value, "left"), (new_value, "right")]
+        return slot + (new_value,)
+
+    async def tree(self):
+        op = self.rng.choices(list(TREE_OPS), weights=list(TREE_OPS.values()))[0]
+        base = f"/trees/{self.tree_id}"
+        if op == "tree_get":
+            await self._request(self.stats, op, "GET", base)
+        elif op == "tree_insert":
+            parent, side, new_value = self._take_slot()
+            await self._request(self.stats, op, "POST", f"{base}/insert",
+                                json={"parent_value": parent, "new_value": new_value, "direction": side})
+        elif op == "tree_search":
+            await self._request(self.stats, op, "POST", f"{base}/search",
+                                json={"value": self.rng.choice(self.values)})
+        else:
+            await self._request(self.stats, op, "GET", f"{base}/stats")
+
+    async def chat(self):
+        template = self.rng.choice(CHAT_MESSAGES)
+        if "{new}" in template:
+            parent, side, new_value = self._take_slot()
+            message = template.format(new=new_value, side=side, parent=parent)
+        else:
+            message = template.format(value=self.rng.choice(self.values))
+        await self._request(self.stats, "chat", "POST", "/chat",
+                            json={"message": message, "tree_id": self.tree_id})
+
+    async def auth(self):
+        await self._request(self.stats, "auth_login", "POST", "/auth/login",
+                            json={"email": self.email, "password": PASSWORD})
+
+    async def run(self, mix, deadline):
+        kinds = [kind for kind, weight in mix.items() if weight > 0]
+        weights = [mix[kind] for kind in kinds]
+        while time.perf_counter() < deadline:
+            kind = self.rng.choices(kinds, weights=weights)[0]
+            await getattr(self, kind)()
+
+
+async def run_load(client, users=10, duration=10.0, mix=None, tree_size=100, seed=0):
+    """Run the load against ``client`` (an ``httpx.AsyncClient``); returns the report dict."""
+    mix = mix or DEFAULT_MIX
+    setup_stats, stats = Stats(), Stats()
+    rng = random.Random(seed)
+    vusers = [
+        VirtualUser(client, random.Random(rng.random()), tree_size, setup_stats, stats)
+        for _ in range(users)
+    ]
+
+    setup_start = time.perf_counter()
+    ready = await asyncio.gather(*(vuser.setup() for vuser in vusers))
+    setup_elapsed = time.perf_counter() - setup_start
+    active = [vuser for vuser, ok in zip(vusers, ready) if ok]
+    if not active:
+        raise RuntimeError("No virtual user could register and create a tree")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(vuser.run(mix, start + duration) for vuser in active))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "config": {"users": users, "active_users": len(active), "duration_s": duration,
+                   "mix": mix, "tree_size": tree_size, "seed": seed},
+        "setup": setup_stats.summary(setup_elapsed),
+        "load": stats.summary(elapsed),
+    }
+
+
+# ---------- local server ----------
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url, workers, port, log_file):
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": database_url,
+        "USE_LLM_AGENT": "0",
+        # The harness measures the app, not the rate limiter
+        "RATE_LIMIT": "1000000000",
+        "AUTH_RATE_LIMIT": "1000000000",
+        "CHAT_RATE_LIMIT": "1000000000",
+    })
+    env.pop("RUNNING_TESTS", None)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Server did not become healthy within 60s")
+
+
+def _print_summary(name, summary):
+    print(f"\n{name}: {summary['requests']} requests in {summary['elapsed_s']:.1f}s "
+          f"= {summary['rps']:.1f} req/s, {summary['errors']} errors")
+    print(f"  {'op':<14} {'reqs':>7} {'err':>5} {'req/s':>8} {'mean':>8} {'p50':>8} "
+          f"{'p90':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)")
+    for op, row in summary["ops"].items():
+        print(f"  {op:<14} {row['requests']:>7} {row['errors']:>5} {row['rps']:>8.1f} "
+              + " ".join(f"{row[key]:>8.1f}" for key in
+                         ("mean_ms", "p50_ms", "p90_ms", "p95_ms", "p99_ms", "max_ms")))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="target a running server instead of starting one")
+    parser.add_argument("--database-url", help="database for the local server (default: temp SQLite)")
+    parser.add_argument("--server-workers", type=int, default=1)
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load after setup")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="relative weights, e.g. tree=70,chat=20,auth=10")
+    parser.add_argument("--tree-size", type=int, default=100, help="nodes per initial tree")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", metavar="PATH", help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    process = None
+    url = args.url
+    if url is None:
+        database_url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "load.db")
+        log_path = os.path.join(tempfile.mkdtemp(), "server.log")
+        log_file = open(log_path, "w")
+        process, url = start_server(database_url, args.server_workers, _free_port(), log_file)
+        print(f"Started server at {url} on {database_url} (log: {log_path})")
+
+    async def go():
+        limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+            return await run_load(client, args.users, args.duration, args.mix,
+                                  args.tree_size, args.seed)
+
+    try:
+        report = asyncio.run(go())
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+            log_file.close()
+
+    _print_summary("Setup", report["setup"])
+    _print_summary("Load", report["load"])
+
+    if args.save:
+        report.update({
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "target": args.url or ("local:" + (args.database_url or "sqlite")),
+        })
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nSaved report to {args.save}")
+    return 1 if report["load"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
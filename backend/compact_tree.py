@@ -0,0 +1,262 @@
+"""
+Array-backed tree representation.
+
+``CompactTree`` stores a binary tree as three parallel ``array('q')`` buffers
+(values, left child index, right child index) instead of nested dicts. A node
+costs 24 bytes instead of a few hundred, and walks run over contiguous memory
+rather than chasing dict pointers.
+
+It converts losslessly to and from the nested ``{"value","left","right"}``
+format stored in ``TreeSession.tree_data`` (values must be 64-bit integers),
+and mirrors every helper in ``tree_utils`` as a method.
+"""
+from array import array
+
+NIL = -1
+
+
+class CompactTree:
+    __slots__ = ("values", "left", "right", "root")
+
+    def __init__(self):
+        self.values = array("q")
+        self.left = array("q")
+        self.right = array("q")
+        self.root = NIL
+
+    # ---------- conversion ----------
+
+    @classmethod
+    def from_dict(cls, tree):
+        """Build a CompactTree from a nested-dict tree (or None)."""
+        compact = cls()
+        if tree is None:
+            return compact
+
+        # Slots are allocated as nodes are popped, so the layout is preorder
+        # (the same one _compact produces): pushing right before left makes
+        # the left subtree come out first.
+        stack = [(tree, None)]
+        while stack:
+            node, link = stack.pop()
+            index = compact._append(node)
+            if link is None:
+                compact.root = index
+            else:
+                buffer, parent = link
+                buffer[parent] = index
+            for side, buffer in (("right", compact.right), ("left", compact.left)):
+                child = node.get(side)
+                if child is not None:
+                    stack.append((child, (buffer, index)))
+        return compact
+
+    def to_dict(self):
+        """Return the nested-dict form of this tree (None when empty)."""
+        if self.root == NIL:
+            return None
+
+        nodes = [None] * len(self.values)
+        for index in self.iter_postorder():
+            left = self.left[index]
+            right = self.right[index]
+            nodes[index] = {
+                "value": self.values[index],
+                "left": nodes[left] if left != NIL else None,
+                "right": nodes[right] if right != NIL else None,
+            }
+        return nodes[self.root]
+
+    def _append(self, node):
+        value = node.get("value")
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise TypeError(f"CompactTree values must be integers, got {value!r}")
+        return self._new_node(value)
+
+    def _new_node(self, value):
+        self.values.append(value)
+        self.left.append(NIL)
+        self.right.append(NIL)
+        return len(self.values) - 1
+
+    def _compact(self):
+        """Drop unreachable slots and re-lay the live nodes out in preorder."""
+        values, left, right = array("q"), array("q"), array("q")
+        if self.root == NIL:
+            self.values, self.left, self.right = values, left, right
+            return
+
+        remap = {}
+        for index in self.iter_preorder():
+            remap[index] = len(values)
+            values.append(self.values[index])
+        left.extend([NIL] * len(values))
+        right.extend([NIL] * len(values))
+        for old, new in remap.items():
+            if self.left[old] != NIL:
+                left[new] = remap[self.left[old]]
+            if self.right[old] != NIL:
+                right[new] = remap[self.right[old]]
+
+        self.values, self.left, self.right = values, left, right
+        self.root = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    # ---------- traversal engine ----------
+
+    def iter_preorder(self):
+        """Yield node indices in preorder."""
+        left, right = self.left, self.right
+        stack = [self.root] if self.root != NIL else []
+        while stack:
+            index = stack.pop()
+            yield index
+            if right[index] != NIL:
+                stack.append(right[index])
+            if left[index] != NIL:
+                stack.append(left[index])
+
+    def iter_inorder(self):
+        """Yield node indices in inorder."""
+        left, right = self.left, self.right
+        stack = []
+        current = self.root
+        while stack or current != NIL:
+            while current != NIL:
+                stack.append(current)
+                current = left[current]
+            current = stack.pop()
+            yield current
+            current = right[current]
+
+    def iter_postorder(self):
+        """Yield node indices in postorder."""
+        left, right = self.left, self.right
+        stack = []
+        current = self.root
+        last_visited = NIL
+        while stack or current != NIL:
+            while current != NIL:
+                stack.append(current)
+                current = left[current]
+            top = stack[-1]
+            if right[top] != NIL and right[top] != last_visited:
+                current = right[top]
+            else:
+                last_visited = stack.pop()
+                yield last_visited
+
+    def walk(self, order="preorder"):
+        """Yield node indices in the given order."""
+        if order == "preorder":
+            return self.iter_preorder()
+        if order == "inorder":
+            return self.iter_inorder()
+        if order == "postorder":
+            return self.iter_postorder()
+        raise ValueError(f"Unknown traversal order: {order}")
+
+    def iter_values(self, order="preorder"):
+        """Yield node values lazily in the given order."""
+        values = self.values
+        for index in self.walk(order):
+            yield values[index]
+
+    def find(self, value):
+        """Return the index of the first node (in preorder) holding ``value``, or NIL."""
+        values = self.values
+        for index in self.iter_preorder():
+            if values[index] == value:
+                return index
+        return NIL
+
+    # ---------- tree_utils operations ----------
+
+    def calculate_height(self):
+        left, right = self.left, self.right
+        height = 0
+        stack = [(self.root, 1)] if self.root != NIL else []
+        while stack:
+            index, depth = stack.pop()
+            if depth > height:
+                height = depth
+            if left[index] != NIL:
+                stack.append((left[index], depth + 1))
+            if right[index] != NIL:
+                stack.append((right[index], depth + 1))
+        return height
+
+    def find_leaf_nodes(self):
+        left, right, values = self.left, self.right, self.values
+        return [
+            values[index]
+            for index in self.iter_preorder()
+            if left[index] == NIL and right[index] == NIL
+        ]
+
+    def insert_node(self, parent_value, new_value, position):
+        parent = self.find(parent_value)
+        if parent == NIL:
+            return False
+
+        if position not in ("left", "right"):
+            return True
+
+        buffer = self.left if position == "left" else self.right
+        replaced = buffer[parent]
+        buffer[parent] = self._new_node(new_value)
+        if replaced != NIL:
+            # The old child subtree is now unreachable.
+            self._compact()
+        return True
+
+    def delete_node(self, value):
+        """Remove every subtree whose root holds ``value``; returns self."""
+        if self.root == NIL:
+            return self
+
+        values, left, right = self.values, self.left, self.right
+        if values[self.root] == value:
+            self.root = NIL
+            self._compact()
+            return self
+
+        detached = False
+        stack = [self.root]
+        while stack:
+            index = stack.pop()
+            for buffer in (left, right):
+                child = buffer[index]
+                if child == NIL:
+                    continue
+                if values[child] == value:
+                    buffer[index] = NIL
+                    detached = True
+                else:
+                    stack.append(child)
+
+        if detached:
+            self._compact()
+        return self
+
+    def update_node(self, old_value, new_value):
+        """Returns self if updated, False if the node was not found."""
+        index = self.find(old_value)
+        if index == NIL:
+            return False
+        self.values[index] = new_value
+        return self
+
+    def inorder_traversal(self):
+        return list(self.iter_values("inorder"))
+
+    def preorder_traversal(self):
+        return list(self.iter_values("preorder"))
+
+    def postorder_traversal(self):
+        return list(self.iter_values("postorder"))
+
+    def search_node(self, value):
+        return self.find(value) != NIL
@@ -0,0 +1,161 @@
+"""
+Intent parser for the rule-based chat agent.
+
+A message is tokenized in a single pass by one precompiled regex. Words are
+classified through a keyword table, and the tokens are split into clauses at
+``and`` / ``then`` / punctuation. Each clause becomes one ``Command``:
+
+    "insert 3 left of 1 and 4 right of 1"
+        -> Command("insert", value=3, parent=1, side="left")
+           Command("insert", value=4, parent=1, side="right")
+
+Grammar rules:
+
+* A clause without a verb inherits the previous clause's verb ("delete 4, 5").
+  For inserts it also inherits the parent ("insert 3 left of 1 and 4 right").
+* Question nouns (height, leaves, inorder, ...) beat a ``search`` verb that
+  has no number, so "find the height" asks for the height.
+* Keyword order within a clause does not matter.
+
+Commands that are missing arguments carry an ``error`` message instead of
+failing, so the agent can answer the rest of the message.
+"""
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+# Numbers (a leading "-" only when it is not part of a word), words, separators
+_TOKEN_RE = re.compile(r"(?P<number>(?<![\w-])-?\d+)|(?P<word>[a-z]+)|(?P<sep>[,;.&])")
+
+# word -> (kind, value)
+_KEYWORDS = {}
+for _words, _kind, _value in (
+    (("insert", "add", "put", "attach"), "verb", "insert"),
+    (("delete", "remove", "drop"), "verb", "delete"),
+    (("update", "change", "edit", "replace", "set", "rename"), "verb", "update"),
+    (("search", "find", "contains", "contain", "exists", "exist", "locate", "lookup"), "verb", "search"),
+    (("height", "depth", "tall"), "query", "height"),
+    (("leaf", "leaves"), "query", "leaves"),
+    (("inorder",), "query", "inorder"),
+    (("preorder",), "query", "preorder"),
+    (("postorder",), "query", "postorder"),
+    (("left",), "side", "left"),
+    (("right",), "side", "right"),
+    (("of", "under", "below", "beneath"), "parent", None),
+    (("and", "then", "also"), "sep", None),
+):
+    for _word in _words:
+        _KEYWORDS[_word] = (_kind, _value)
+
+MUTATING_ACTIONS = frozenset({"insert", "delete", "update"})
+
+INSERT_HELP = "Please provide the values to insert (e.g., 'Insert 8 as left child of 4')."
+DELETE_HELP = "Please specify value to delete."
+UPDATE_HELP = ("Please provide both old and new values "
+               "(e.g., 'update node 5 as 10' or 'change 5 to 10').")
+SEARCH_HELP = "Please specify the value to search for (e.g., 'search for 5')."
+
+
+@dataclass(frozen=True)
+class Command:
+    action: str
+    # insert: new value; delete / search: target; update: old value
+    value: Optional[int] = None
+    parent: Optional[int] = None
+    side: Optional[str] = None
+    new_value: Optional[int] = None
+    error: Optional[str] = None
+
+    @property
+    def mutating(self):
+        return self.action in MUTATING_ACTIONS and self.error is None
+
+
+def tokenize(message):
+    """Yield ``(kind, value)`` tokens; unknown words are dropped."""
+    for match in _TOKEN_RE.finditer((message or "").lower()):
+        kind = match.lastgroup
+        if kind == "number":
+            yield "number", int(match.group())
+        elif kind == "sep":
+            yield "sep", None
+        else:
+            keyword = _KEYWORDS.get(match.group())
+            if keyword is not None:
+                yield keyword
+
+
+def _clauses(tokens):
+    clause = []
+    for kind, value in tokens:
+        if kind == "sep":
+            if clause:
+                yield clause
+            clause = []
+        else:
+            clause.append((kind, value))
+    if clause:
+        yield clause
+
+
+def parse(message):
+    """Return the list of ``Command`` found in ``message`` (empty if none)."""
+    commands = []
+    previous_verb = None
+    previous_parent = None
+
+    for clause in _clauses(tokenize(message)):
+        verbs = [value for kind, value in clause if kind == "verb"]
+        queries = [value for kind, value in clause if kind == "query"]
+        numbers = [value for kind, value in clause if kind == "number"]
+
+        verb = verbs[0] if verbs else None
+        if queries and (verb is None or (verb == "search" and not numbers)):
+            commands.extend(Command(query) for query in dict.fromkeys(queries))
+            previous_verb = None
+            continue
+        if verb is None:
+            if not numbers or previous_verb is None:
+                continue
+            verb = previous_verb
+
+        if verb == "insert":
+            command = _insert(clause, numbers, previous_parent if previous_verb == "insert" else None)
+            if command.error is None:
+                previous_parent = command.parent
+            commands.append(command)
+        elif verb == "update":
+            if len(numbers) >= 2:
+                commands.append(Command("update", value=numbers[0], new_value=numbers[1]))
+            else:
+                commands.append(Command("update", error=UPDATE_HELP))
+        elif numbers:
+            commands.extend(Command(verb, value=number) for number in numbers)
+        else:
+            commands.append(Command(verb, error=DELETE_HELP if verb == "delete" else SEARCH_HELP))
+        previous_verb = verb
+
+    return commands
+
+
+def _insert(clause, numbers, inherited_parent):
+    """``insert <value> [left|right] [of] <parent>`` in any word order."""
+    side = next((value for kind, value in clause if kind == "side"), "right")
+
+    parent = None
+    # A number right after "of" / "under" is the parent, wherever it appears
+    for position, (kind, _) in enumerate(clause[:-1]):
+        if kind == "parent" and clause[position + 1][0] == "number":
+            parent = clause[position + 1][1]
+            break
+    values = list(numbers)
+    if parent is not None:
+        values.remove(parent)
+    elif len(values) >= 2:
+        parent = values.pop(1)
+    elif values:
+        parent = inherited_parent
+
+    if not values or parent is None:
+        return Command("insert", error=INSERT_HELP)
+    return Command("insert", value=values[0], parent=parent, side=side)
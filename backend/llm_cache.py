@@ -0,0 +1,196 @@
+"""
+Cache of LLM chat answers.
+
+A read-only question about an unchanged tree gets the same answer, so
+answers are keyed by the model, a content fingerprint of the tree and the
+normalized message. Two tiers:
+
+* memory: per process, LRU, bounded by ``LLM_CACHE_MAX_ENTRIES``
+* disk (optional): a SQLite file under ``LLM_CACHE_DIR``, shared by the
+  workers on one host and kept across restarts
+
+Entries expire after ``LLM_CACHE_TTL`` seconds in both tiers.
+
+Messages with a mutating intent (insert/delete/update, as recognized by
+``intent_parser``) bypass the cache. So does any answer where the model
+changed the tree. Mutations depend on more than the question, and replaying
+one would skip the change.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from intent_parser import MUTATING_ACTIONS, parse
+from metrics import LLM_CACHE_BYPASSED, LLM_CACHE_HITS, LLM_CACHE_MISSES
+from tree_cache import tree_cache
+
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "1000"))
+# Unset keeps the cache in memory only
+LLM_CACHE_DIR = os.environ.get("LLM_CACHE_DIR")
+
+_SPACE_RE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " \t\n?!.,;:'\""
+
+
+def normalize_message(message):
+    """Case-fold, collapse whitespace and trim surrounding punctuation."""
+    return _SPACE_RE.sub(" ", (message or "").casefold()).strip(_EDGE_PUNCTUATION)
+
+
+def tree_fingerprint(tree):
+    """
+    Content hash of a nested-dict tree: values in preorder with ``#`` for
+    empty children. Iterative, so chain-shaped trees of any depth work
+    (``json.dumps`` gives up at about a thousand levels).
+    """
+    parts = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            parts.append("#")
+            continue
+        parts.append(repr(node.get("value")))
+        stack.append(node.get("right"))
+        stack.append(node.get("left"))
+    return hashlib.blake2b(",".join(parts).encode(), digest_size=16).hexdigest()
+
+
+def is_mutating(message):
+    return any(command.action in MUTATING_ACTIONS for command in parse(message))
+
+
+class _DiskTier:
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(directory, "llm_cache.sqlite3"), check_same_thread=False, timeout=5
+        )
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS answers_expires_at ON answers (expires_at)")
+
+    def get(self, key, now):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response, expires_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= now:
+            return None
+        return row
+
+    def put(self, key, response, expires_at, now):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM answers WHERE expires_at <= ?", (now,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers (key, response, expires_at) VALUES (?, ?, ?)",
+                (key, response, expires_at),
+            )
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM answers")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class LLMResponseCache:
+    def __init__(self, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES,
+                 directory=LLM_CACHE_DIR, clock=time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (response, expires_at)
+        self._lock = threading.Lock()
+        self._disk = _DiskTier(directory) if directory else None
+
+    @property
+    def persistent(self):
+        """Whether get/put also hit the SQLite tier (blocking disk I/O)."""
+        return self._disk is not None
+
+    @staticmethod
+    def make_key(model, fingerprint, message):
+        raw = "\0".join((model, fingerprint, normalize_message(message)))
+        return hashlib.blake2b(raw.encode(), digest_size=20).hexdigest()
+
+    def get(self, key):
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                LLM_CACHE_HITS.labels(tier="memory").inc()
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+
+        if self._disk is not None:
+            row = self._disk.get(key, now)
+            if row is not None:
+                self._remember(key, row[0], row[1])
+                LLM_CACHE_HITS.labels(tier="disk").inc()
+                return row[0]
+
+        LLM_CACHE_MISSES.inc()
+        return None
+
+    def put(self, key, response):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        now = self.clock()
+        expires_at = now + self.ttl
+        self._remember(key, response, expires_at)
+        if self._disk is not None:
+            self._disk.put(key, response, expires_at, now)
+
+    def _remember(self, key, response, expires_at):
+        with self._lock:
+            self._entries[key] = (response, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def cache_key_for(tree, message, model, tree_cache_key=None):
+    """
+    The cache key for ``message`` about ``tree``, or None when the message
+    must bypass the cache. ``tree_cache_key`` (``(tree_id, version)``) lets
+    the fingerprint be computed once per tree revision.
+    """
+    if is_mutating(message):
+        LLM_CACHE_BYPASSED.inc()
+        return None
+
+    if tree_cache_key is None:
+        fingerprint = tree_fingerprint(tree)
+    else:
+        fingerprint = tree_cache.get(*tree_cache_key, "fingerprint")
+        if fingerprint is None:
+            fingerprint = tree_fingerprint(tree)
+            tree_cache.put(*tree_cache_key, "fingerprint", fingerprint, 1)
+    return LLMResponseCache.make_key(model, fingerprint, message)
+
+
+llm_cache = LLMResponseCache()
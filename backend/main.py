@@ -1,58 +1,119 @@
 import os
 from fastapi import FastAPI, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from database import engine, SessionLocal
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import engine, async_engine, get_db
 from models import Base, User, TreeSession, ChatMessage
 from schemas import (
     UserCreate,
     UserLogin,
     TreeCreate,
     TreeResponse,
+    TreeSummaryPage,
     TreeInsertRequest,
     TreeValueRequest,
     TreeUpdateNodeRequest,
     TreeSearchResponse,
+    TreeStatsResponse,
+    TreeBatchRequest,
+    TreeBatchResponse,
     ChatRequest,
     ChatResponse,
+    ChatHistoryPage,
 )
 from auth import (
-    hash_password,
-    verify_password,
     create_access_token,
     create_refresh_token,
     verify_refresh_token,
     get_current_user,
+    token_claims,
+    user_id_from_token,
+    is_admin_token,
+    require_admin,
 )
+from principal_cache import Principal
+from passwords import password_hasher, PasswordHasherBusy
+from rate_limit import RateLimiter, RateLimitRule, backend_from_env
+from metrics import current_route, observe_stage
+from profiling import request_profiler, to_collapsed
 from fastapi.security import OAuth2PasswordRequestForm
 from tree_utils import (
     calculate_height,
     find_leaf_nodes,
-    insert_node,
-    delete_node,
-    update_node,
-    inorder_traversal,
-    preorder_traversal,
-    postorder_traversal,
+    iter_values,
+    measure_tree,
+    dump_json,
+    build_balanced,
+    build_from_level_order,
+    LevelOrderBuilder,
 )
+from tree_index import TreeIndex
+from tree_cache import tree_cache
+from tree_store import save_tree_data
 from ai_agent import handle_message as ai_handle_message
-from sqlalchemy.orm.attributes import flag_modified
+from ai_agent_adapter import llm_client
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+from contextlib import asynccontextmanager
+from array import array
+import json
+import math
 import re
 import time
 import logging
-from fastapi import Request
+from fastapi import Request, Response
+import hashlib
 
 # Setup basic logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+async def _bind_route(request: Request):
+    """Expose the matched route template to stage metrics (metrics.observe_stage)."""
+    current_route.set(getattr(request.scope.get("route"), "path", "unmatched"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Stop the hashing processes so they don't outlive the server
+    password_hasher.shutdown()
+    await llm_client.aclose()
+    await async_engine.dispose()
+
+
 # Create FastAPI app instance early so middleware decorators can reference it
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, dependencies=[Depends(_bind_route)])
+
+# Rate limiting: a default budget per user (per IP when anonymous) plus
+# tighter per-route rules. Counters are shared across workers when
+# RATE_LIMIT_REDIS_URL is set.
+RATE_LIMIT = int(os.environ.get('RATE_LIMIT', '60'))  # requests
+RATE_WINDOW = int(os.environ.get('RATE_WINDOW_SECONDS', '60'))  # seconds
+AUTH_RATE_LIMIT = int(os.environ.get('AUTH_RATE_LIMIT', '10'))
+CHAT_RATE_LIMIT = int(os.environ.get('CHAT_RATE_LIMIT', '30'))
+
+rate_limiter = RateLimiter(
+    backend_from_env(),
+    default=RateLimitRule("default", RATE_LIMIT, RATE_WINDOW, per="user"),
+    rules=[
+        # Credential guessing is limited per IP
+        RateLimitRule("auth", AUTH_RATE_LIMIT, RATE_WINDOW, per="ip",
+                      methods=frozenset({"POST"}),
+                      paths=("/auth/login", "/auth/register", "/login")),
+        RateLimitRule("chat", CHAT_RATE_LIMIT, RATE_WINDOW, per="user",
+                      methods=frozenset({"POST"}), paths=("/chat",)),
+    ],
+)
+
 
-# Simple in-memory rate limiter: {ip: [timestamps]}
-RATE_LIMIT = int(__import__('os').environ.get('RATE_LIMIT', '60'))  # requests
-RATE_WINDOW = int(__import__('os').environ.get('RATE_WINDOW_SECONDS', '60'))  # seconds
-_rate_store: dict = {}
+def _bearer_token(request: Request):
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:]
+    return None
 
 
 @app.middleware("http")
@@ -62,20 +123,22 @@ async def rate_limit_middleware(request: Request, call_next):
     except Exception:
         client_ip = 'unknown'
 
-    now = time.time()
-    entry = _rate_store.get(client_ip, [])
-    # keep only timestamps inside window
-    entry = [ts for ts in entry if now - ts < RATE_WINDOW]
-    if len(entry) >= RATE_LIMIT:
-        logger.warning(f"Rate limit exceeded for {client_ip}")
-        from fastapi.responses import JSONResponse
-
-        return JSONResponse(status_code=429, content={"detail": "Too Many Requests"})
+    token = _bearer_token(request)
+    user_id = user_id_from_token(token) if token else None
 
-    entry.append(now)
-    _rate_store[client_ip] = entry
+    result = await rate_limiter.check(request.method, request.url.path, client_ip, user_id)
+    if result is not None and not result.allowed:
+        logger.warning(f"Rate limit '{result.rule}' exceeded for {user_id or client_ip}")
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Too Many Requests"},
+            headers={"Retry-After": str(max(1, math.ceil(result.retry_after)))},
+        )
 
     response = await call_next(request)
+    if result is not None:
+        response.headers["X-RateLimit-Limit"] = str(result.limit)
+        response.headers["X-RateLimit-Remaining"] = str(result.remaining)
     return response
 
 
@@ -91,17 +154,45 @@ try:
         start = time.time()
         response = await call_next(request)
         resp_time = time.time() - start
-        endpoint = request.url.path
+        # Route template, not the raw path, so /trees/1 and /trees/2 share a series
+        endpoint = getattr(request.scope.get("route"), "path", "unmatched")
         REQUEST_LATENCY.labels(endpoint=endpoint).observe(resp_time)
         REQUEST_COUNT.labels(method=request.method, endpoint=endpoint, http_status=str(response.status_code)).inc()
         return response
 
     @app.get('/metrics')
     def metrics():
-        return generate_latest()
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 except Exception:
     logger.info('prometheus_client not installed; metrics endpoint disabled')
 
+
+# Opt-in profiling (see profiling.py). Admins can profile a single request
+# with "X-Profile: 1"; the result id comes back in X-Profile-Id.
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    force_reason = None
+    if request.headers.get("x-profile") == "1":
+        token = _bearer_token(request)
+        if token and is_admin_token(token):
+            force_reason = "header"
+
+    capture = request_profiler.begin(request.method, request.url.path, force_reason)
+    if capture is None:
+        return await call_next(request)
+
+    profile_id = None
+    try:
+        response = await call_next(request)
+    finally:
+        route = getattr(request.scope.get("route"), "path", None)
+        profile_id = request_profiler.end(capture, route)
+        if profile_id is not None:
+            logger.info(f"Captured profile {profile_id} for {request.method} {request.url.path}")
+    if profile_id is not None:
+        response.headers["X-Profile-Id"] = str(profile_id)
+    return response
+
 # app already created above; configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -113,30 +204,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-After-Id", "Retry-After", "X-RateLimit-Limit", "X-RateLimit-Remaining",
+                    "X-Profile-Id"],
 )
 
 # Add exception handler for validation errors
+from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     logger.error(f"Validation error: {exc.errors()}")
-    return {"detail": exc.errors()}
+    return JSONResponse(status_code=422, content={"detail": jsonable_encoder(exc.errors())})
+
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    logger.warning(f"Password hashing saturated: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
 
 # Create tables in database
 
 if os.environ.get("RUNNING_TESTS") != "1":
     Base.metadata.create_all(bind=engine)
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @app.get("/")
 def read_root():
     return {"message": "Backend is working 🚀"}
@@ -149,29 +244,29 @@ def health_check():
 
 
 @app.post("/auth/register")
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     logger.info(f"Registration attempt: {user.email}")
     
     # Check if email already exists
-    existing_user = db.query(User).filter(User.email == user.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user.email))
 
     if existing_user:
         logger.warning(f"Registration failed: Email already registered - {user.email}")
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    # Hash password before storing
-    hashed_pw = hash_password(user.password)
+    # Hash password before storing (in the password worker pool)
+    hashed_pw = await password_hasher.hash(user.password)
 
     # Create new user
     new_user = User(email=user.email, hashed_password=hashed_pw)
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     # Issue token immediately so frontend can log user in
-    access_token = create_access_token(data={"sub": new_user.email})
-    refresh_token = create_refresh_token(data={"sub": new_user.email})
+    access_token = create_access_token(data=token_claims(new_user))
+    refresh_token = create_refresh_token(data=token_claims(new_user))
 
     return {
         "access_token": access_token,
@@ -182,25 +277,38 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
     }
 
 
+async def _check_password(db: AsyncSession, user: User, password: str):
+    """
+    Verify ``password`` for ``user``. If the stored hash predates the current
+    bcrypt cost settings, replace it with a fresh hash while we have the
+    plaintext.
+    """
+    valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if valid and new_hash is not None:
+        user.hashed_password = new_hash
+        await db.commit()
+    return valid
+
+
 @app.post("/auth/login")
-def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     """
     Simple JSON-based login to match frontend (email + password).
     """
     try:
         logger.info(f"Login attempt: {user_data.email}")
-        user = db.query(User).filter(User.email == user_data.email).first()
+        user = await db.scalar(select(User).where(User.email == user_data.email))
 
         if not user:
             logger.warning(f"Login failed: User not found - {user_data.email}")
             raise HTTPException(status_code=400, detail="Invalid credentials")
         
-        if not verify_password(user_data.password, user.hashed_password):
+        if not await _check_password(db, user, user_data.password):
             logger.warning(f"Login failed: Invalid password - {user_data.email}")
             raise HTTPException(status_code=400, detail="Invalid credentials")
 
-        access_token = create_access_token(data={"sub": user.email})
-        refresh_token = create_refresh_token(data={"sub": user.email})
+        access_token = create_access_token(data=token_claims(user))
+        refresh_token = create_refresh_token(data=token_claims(user))
         
         logger.info(f"Login successful: {user_data.email}")
 
@@ -211,7 +319,7 @@ def login(user_data: UserLogin, db: Session = Depends(get_db)):
             "email": user.email,
             "user_id": user.id,
         }
-    except HTTPException:
+    except (HTTPException, PasswordHasherBusy):
         raise
     except Exception as e:
         logger.error(f"Login error: {str(e)}")
@@ -219,113 +327,370 @@ def login(user_data: UserLogin, db: Session = Depends(get_db)):
 
 
 @app.post("/login")
-def login_form(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == form_data.username).first()
+async def login_form(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(User).where(User.email == form_data.username))
 
     if not user:
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
-    if not verify_password(form_data.password, user.hashed_password):
+    if not await _check_password(db, user, form_data.password):
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
-    access_token = create_access_token(data={"sub": user.email})
-    refresh_token = create_refresh_token(data={"sub": user.email})
+    access_token = create_access_token(data=token_claims(user))
+    refresh_token = create_refresh_token(data=token_claims(user))
 
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @app.post("/auth/refresh")
-def refresh_token_endpoint(payload: dict):
+async def refresh_token_endpoint(payload: dict):
     token = payload.get("refresh_token")
     if not token:
         raise HTTPException(status_code=400, detail="refresh_token required")
 
-    email = verify_refresh_token(token)
-    if not email:
+    claims = verify_refresh_token(token)
+    if not claims:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
 
-    access_token = create_access_token(data={"sub": email})
-    refresh_token = create_refresh_token(data={"sub": email})
+    access_token = create_access_token(data=claims)
+    refresh_token = create_refresh_token(data=claims)
 
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 @app.get("/auth/me")
-def get_me(current_user: User = Depends(get_current_user)):
+async def get_me(current_user: Principal = Depends(get_current_user)):
     return {
         "email": current_user.email,
         "id": current_user.id,
         "message": "You are authenticated 🎉",
     }
 
-@app.post("/trees", response_model=TreeResponse)
-def create_tree(tree: TreeCreate, 
-                db: Session = Depends(get_db),
-                current_user: User = Depends(get_current_user)):
-    
+def _tree_version(tree: TreeSession):
+    """Version used to key cached results derived from this tree."""
+    return tree.revision
+
+
+async def _commit_tree(db: AsyncSession, tree: TreeSession, tree_data, changes=None, summary=None):
+    """
+    Persist new tree_data, bump the revision and drop stale cached results.
+    ``changes`` (a TreeIndex change log) enables path-targeted writes, and
+    ``summary`` (``TreeIndex.measure()``) skips re-measuring the tree.
+    """
+    with observe_stage("commit"):
+        await save_tree_data(db, tree, tree_data, changes, summary)
+    tree_cache.invalidate(tree.id)
+
+
+def _recache_index(tree: TreeSession, loaded_version, index: TreeIndex):
+    """
+    Hand ``index`` back to the cache after this request committed its changes.
+
+    The index is this request's snapshot plus its own changes. It matches the
+    stored tree only if no other writer committed in between, i.e. the
+    revision moved by exactly one; otherwise it is dropped and the next
+    request rebuilds it from the database.
+    """
+    if _tree_version(tree) == loaded_version + 1:
+        tree_cache.put_index(tree.id, _tree_version(tree), index)
+
+
+async def _run_tree_op(tree: TreeSession, version, operation):
+    """
+    Check out the tree's TreeIndex and apply ``operation(index)`` to it in the
+    threadpool, so building the index or walking a large subtree never blocks
+    the event loop. Returns ``(index, result)``.
+    """
+    tree_id, tree_data = tree.id, tree.tree_data
+
+    def run():
+        index = tree_cache.take_index(tree_id, version, tree_data)
+        return index, operation(index)
+
+    with observe_stage("tree_op"):
+        return await run_in_threadpool(run)
+
+
+async def _tree_stats(tree: TreeSession):
+    """``analyze_tree`` for ``tree`` from the cache, computed in the threadpool on a miss."""
+    with observe_stage("tree_op"):
+        return await run_in_threadpool(
+            tree_cache.get_stats, tree.id, _tree_version(tree), tree.tree_data
+        )
+
+
+def _model_fields(model):
+    return {name: getattr(model, name) for name in type(model).model_fields}
+
+
+def _render(model, value):
+    # pydantic's serializer gives up on documents nested ~255 levels deep
+    # (chain-shaped trees), so only validate with it and encode with dump_json
+    if isinstance(value, list):
+        validated = [model.model_validate(item, from_attributes=True) for item in value]
+    else:
+        validated = model.model_validate(value, from_attributes=True)
+    return dump_json(validated, default=_model_fields)
+
+
+async def _json_response(model, value, headers=None):
+    """
+    Validate ``value`` (or each item of a list) as ``model`` and serialize it
+    in the threadpool.
+    """
+    body = await run_in_threadpool(_render, model, value)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def _tree_response(tree: TreeSession, headers=None):
+    """A TreeResponse for ``tree``; large trees are serialized off the event loop."""
+    return await _json_response(TreeResponse, tree, headers)
+
+
+async def _load_tree(db: AsyncSession, tree_id: int, user_id: int):
+    """The user's tree with ``tree_id``, or None."""
+    with observe_stage("db_load"):
+        return await db.scalar(select(TreeSession).where(
+            TreeSession.id == tree_id,
+            TreeSession.user_id == user_id,
+        ))
+
+
+def _tree_etag(tree_id: int, revision: int):
+    return f'"tree-{tree_id}-{revision}"'
+
+
+def _etag_matches(request: Request, etag: str):
+    """True if the request's If-None-Match header covers ``etag``."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def _tree_data_from_payload(payload: TreeCreate):
+    """Resolve tree_data, building it from level_order / sorted_values if given."""
+    try:
+        if payload.level_order is not None:
+            return build_from_level_order(payload.level_order)
+        if payload.sorted_values is not None:
+            return build_balanced(payload.sorted_values)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return payload.tree_data
+
+
+async def _save_new_tree(db: AsyncSession, name: str, tree_data, user_id: int):
+    node_count, height = await run_in_threadpool(measure_tree, tree_data)
     new_tree = TreeSession(
-        name=tree.name,
-        tree_data=tree.tree_data,
-        user_id=current_user.id
+        name=name,
+        tree_data=tree_data,
+        user_id=user_id,
+        node_count=node_count,
+        height=height,
     )
-
     db.add(new_tree)
-    db.commit()
-    db.refresh(new_tree)
+    await db.commit()
+    await db.refresh(new_tree)
+    return await _tree_response(new_tree)
+
+
+@app.post("/trees", response_model=TreeResponse)
+async def create_tree(tree: TreeCreate, 
+                db: AsyncSession = Depends(get_db),
+                current_user: Principal = Depends(get_current_user)):
+    
+    tree_data = await run_in_threadpool(_tree_data_from_payload, tree)
+    return await _save_new_tree(db, tree.name, tree_data, current_user.id)
+
+async def _iter_ndjson_lines(request: Request):
+    """Yield the complete lines of a streamed NDJSON body, one list per received chunk."""
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        if lines:
+            yield lines
+    if pending.strip():
+        yield [pending]
+
+
+def _consume_ndjson_lines(lines, consume, allow_null):
+    """Parse and check one value per non-empty line and pass it to ``consume``."""
+    for line in lines:
+        if line.strip():
+            consume(_checked_value(json.loads(line), allow_null))
+
+
+def _checked_value(value, allow_null):
+    if value is None and allow_null:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f"Expected an integer, got {value!r}")
+    return value
+
+
+@app.post("/trees/import", response_model=TreeResponse)
+async def import_tree(request: Request,
+                      name: str,
+                      format: str = Query("level_order", pattern="^(level_order|sorted)$"),
+                      db: AsyncSession = Depends(get_db),
+                      current_user: Principal = Depends(get_current_user)):
+    """
+    Create a tree from a streamed NDJSON body (one value per line).
+
+    ``level_order`` builds the tree while the body is still arriving, with
+    ``null`` lines marking gaps. ``sorted`` buffers the values in a compact
+    int64 array and builds a balanced tree. Each received chunk is parsed in
+    the threadpool, off the event loop.
+    """
+    try:
+        if format == "level_order":
+            builder = LevelOrderBuilder()
+            async for lines in _iter_ndjson_lines(request):
+                await run_in_threadpool(_consume_ndjson_lines, lines, builder.push, True)
+            tree_data = builder.finish()
+        else:
+            values = array("q")
+            async for lines in _iter_ndjson_lines(request):
+                await run_in_threadpool(_consume_ndjson_lines, lines, values.append, False)
+            tree_data = await run_in_threadpool(build_balanced, values, len(values))
+    except (ValueError, OverflowError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return await _save_new_tree(db, name, tree_data, current_user.id)
+
+
+def _user_trees_page(query, user_id: int, after_id: Optional[int], limit: Optional[int]):
+    """Keyset-paginate the select ``query`` over the user's trees, ordered by id."""
+    query = query.where(TreeSession.user_id == user_id)
+    if after_id is not None:
+        query = query.where(TreeSession.id > after_id)
+    query = query.order_by(TreeSession.id)
+    if limit is not None:
+        # One extra row tells us whether another page exists
+        query = query.limit(limit + 1)
+    return query
+
+
+def _split_page(rows, limit: Optional[int]):
+    """Return (rows on this page, cursor for the next page or None)."""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, rows[-1].id
 
-    return new_tree
 
 @app.get("/trees", response_model=list[TreeResponse])
-def get_trees(db: Session = Depends(get_db),
-              current_user: User = Depends(get_current_user)):
+async def get_trees(request: Request,
+              limit: Optional[int] = Query(None, ge=1, le=200),
+              after_id: Optional[int] = Query(None),
+              db: AsyncSession = Depends(get_db),
+              current_user: Principal = Depends(get_current_user)):
+    """
+    List the user's trees, optionally one keyset page at a time (the next
+    cursor is returned in the X-Next-After-Id header). The ETag covers every
+    (id, revision) pair, so an unchanged list is answered with 304 without
+    loading any tree_data. Use /trees/summary when tree_data is not needed.
+    """
+    versions, next_after_id = _split_page(
+        (await db.execute(_user_trees_page(
+            select(TreeSession.id, TreeSession.revision), current_user.id, after_id, limit
+        ))).all(),
+        limit,
+    )
+
+    digest = hashlib.sha1(
+        ",".join(f"{tree_id}:{revision}" for tree_id, revision in versions).encode()
+    ).hexdigest()
+    etag = f'"trees-{digest}"'
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    trees, _ = _split_page(
+        (await db.scalars(
+            _user_trees_page(select(TreeSession), current_user.id, after_id, limit)
+        )).all(),
+        limit,
+    )
 
-    trees = db.query(TreeSession).filter(
-        TreeSession.user_id == current_user.id
-    ).all()
+    headers = {"ETag": etag}
+    if next_after_id is not None:
+        headers["X-Next-After-Id"] = str(next_after_id)
+    return await _json_response(TreeResponse, trees, headers)
 
-    return trees
+
+@app.get("/trees/summary", response_model=TreeSummaryPage)
+async def get_tree_summaries(limit: int = Query(50, ge=1, le=200),
+                       after_id: Optional[int] = Query(None),
+                       db: AsyncSession = Depends(get_db),
+                       current_user: Principal = Depends(get_current_user)):
+    """
+    Keyset-paginated listing of id, name, revision, node count and height.
+    Never touches tree_data; open a tree with GET /trees/{id} to load it.
+    """
+    query = select(
+        TreeSession.id,
+        TreeSession.name,
+        TreeSession.revision,
+        TreeSession.node_count,
+        TreeSession.height,
+    )
+    rows, next_after_id = _split_page(
+        (await db.execute(_user_trees_page(query, current_user.id, after_id, limit))).all(), limit
+    )
+
+    return {"items": [row._asdict() for row in rows], "next_after_id": next_after_id}
 
 @app.get("/trees/{tree_id}", response_model=TreeResponse)
-def get_tree(tree_id: int,
-             db: Session = Depends(get_db),
-             current_user: User = Depends(get_current_user)):
+async def get_tree(tree_id: int,
+             request: Request,
+             db: AsyncSession = Depends(get_db),
+             current_user: Principal = Depends(get_current_user)):
+
+    # Cheap revision lookup first so an unchanged tree never loads tree_data
+    with observe_stage("db_load"):
+        revision = await db.scalar(select(TreeSession.revision).where(
+            TreeSession.id == tree_id,
+            TreeSession.user_id == current_user.id
+        ))
+
+    if revision is None:
+        raise HTTPException(status_code=404, detail="Tree not found")
+
+    etag = _tree_etag(tree_id, revision)
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
 
-    tree = db.query(TreeSession).filter(
-        TreeSession.id == tree_id,
-        TreeSession.user_id == current_user.id
-    ).first()
+    tree = await _load_tree(db, tree_id, current_user.id)
 
     if not tree:
         raise HTTPException(status_code=404, detail="Tree not found")
 
-    return tree
+    return await _tree_response(tree, headers={"ETag": _tree_etag(tree.id, tree.revision)})
 
 @app.delete("/trees/{tree_id}")
-def delete_tree(tree_id: int,
-                db: Session = Depends(get_db),
-                current_user: User = Depends(get_current_user)):
+async def delete_tree(tree_id: int,
+                db: AsyncSession = Depends(get_db),
+                current_user: Principal = Depends(get_current_user)):
 
-    tree = db.query(TreeSession).filter(
-        TreeSession.id == tree_id,
-        TreeSession.user_id == current_user.id
-    ).first()
+    tree = await _load_tree(db, tree_id, current_user.id)
 
     if not tree:
         raise HTTPException(status_code=404, detail="Tree not found")
 
-    db.delete(tree)
-    db.commit()
+    await db.delete(tree)
+    await db.commit()
+    tree_cache.invalidate(tree_id)
 
     return {"message": "Tree deleted successfully"}
 
 @app.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest,
-         db: Session = Depends(get_db),
-         current_user: User = Depends(get_current_user)):
+async def chat(request: ChatRequest,
+         db: AsyncSession = Depends(get_db),
+         current_user: Principal = Depends(get_current_user)):
 
-    tree = db.query(TreeSession).filter(
-        TreeSession.id == request.tree_id,
-        TreeSession.user_id == current_user.id
-    ).first()
+    tree = await _load_tree(db, request.tree_id, current_user.id)
 
     if not tree:
         raise HTTPException(status_code=404, detail="Tree not found")
@@ -334,15 +699,36 @@ def chat(request: ChatRequest,
     if len(user_message) > 1000:
         raise HTTPException(status_code=400, detail="Message too long")
 
-    # Delegate to AI agent scaffold which returns (response_text, modified, new_tree)
-    response_text, modified, new_tree = ai_handle_message(tree.tree_data, request.message)
+    # The index is cached per revision, so repeated chat turns reuse it and
+    # its change log lets mutations be written as path updates.
+    version = _tree_version(tree)
+    cache_key = (tree.id, version)
+    index = None
+    if tree.tree_data is not None:
+        with observe_stage("tree_op"):
+            index = await run_in_threadpool(tree_cache.take_index, *cache_key, tree.tree_data)
+    tree_data = index.tree if index is not None else tree.tree_data
+
+    # Delegate to AI agent scaffold which returns (response_text, modified, new_tree).
+    # The LLM call is awaited with a deadline; the tree work runs in the threadpool.
+    with observe_stage("agent"):
+        response_text, modified, new_tree = await ai_handle_message(
+            tree_data, request.message, index=index, cache_key=cache_key
+        )
 
     # If agent modified the tree, persist changes (new_tree may be updated)
+    same_tree = index is not None and index.tree is new_tree
     if modified:
-        tree.tree_data = new_tree
-        flag_modified(tree, "tree_data")
-        db.commit()
-        db.refresh(tree)
+        if same_tree:
+            await _commit_tree(db, tree, new_tree, index.drain_changes(), index.measure())
+        else:
+            await _commit_tree(db, tree, new_tree)
+
+    if same_tree:
+        if modified:
+            _recache_index(tree, version, index)
+        else:
+            tree_cache.put_index(tree.id, version, index)
 
     chat_entry = ChatMessage(
         message=request.message,
@@ -351,214 +737,286 @@ def chat(request: ChatRequest,
         tree_id=request.tree_id
     )
 
-    db.add(chat_entry)
-    db.commit()
+    with observe_stage("commit"):
+        db.add(chat_entry)
+        await db.commit()
 
     return {"response": response_text}
 
 @app.put("/trees/{tree_id}", response_model=TreeResponse)
-def update_tree(tree_id: int,
+async def update_tree(tree_id: int,
                 updated_tree: TreeCreate,
-                db: Session = Depends(get_db),
-                current_user: User = Depends(get_current_user)):
+                db: AsyncSession = Depends(get_db),
+                current_user: Principal = Depends(get_current_user)):
 
-    tree = db.query(TreeSession).filter(
-        TreeSession.id == tree_id,
-        TreeSession.user_id == current_user.id
-    ).first()
+    tree = await _load_tree(db, tree_id, current_user.id)
 
     if not tree:
         raise HTTPException(status_code=404, detail="Tree not found")
 
+    tree_data = await run_in_threadpool(_tree_data_from_payload, updated_tree)
     tree.name = updated_tree.name
-    tree.tree_data = updated_tree.tree_data
-
-    flag_modified(tree, "tree_data")
-    db.commit()
-    db.refresh(tree)
+    await _commit_tree(db, tree, tree_data)
 
-    return tree
+    return await _tree_response(tree)
 
-@app.get("/chat/history/{tree_id}")
-def get_chat_history(tree_id: int,
-                     db: Session = Depends(get_db),
-                     current_user: User = Depends(get_current_user)):
-
-    chats = db.query(ChatMessage).filter(
+@app.get("/chat/history/{tree_id}", response_model=ChatHistoryPage)
+async def get_chat_history(tree_id: int,
+                     before_id: Optional[int] = Query(None),
+                     limit: int = Query(50, ge=1, le=200),
+                     db: AsyncSession = Depends(get_db),
+                     current_user: Principal = Depends(get_current_user)):
+    """
+    Return the newest ``limit`` messages older than ``before_id``, oldest
+    first. Walk back through the history by passing ``next_before_id``.
+    """
+    query = select(ChatMessage).where(
         ChatMessage.tree_id == tree_id,
         ChatMessage.user_id == current_user.id
-    ).all()
+    )
+    if before_id is not None:
+        query = query.where(ChatMessage.id < before_id)
 
-    return chats
+    with observe_stage("db_load"):
+        chats = (await db.scalars(query.order_by(ChatMessage.id.desc()).limit(limit + 1))).all()
+    next_before_id = None
+    if len(chats) > limit:
+        chats = chats[:limit]
+        next_before_id = chats[-1].id
+
+    return {"messages": list(reversed(chats)), "next_before_id": next_before_id}
 
 
 @app.delete("/chat/history/{tree_id}")
-def clear_chat_history(tree_id: int,
-                       db: Session = Depends(get_db),
-                       current_user: User = Depends(get_current_user)):
+async def clear_chat_history(tree_id: int,
+                       db: AsyncSession = Depends(get_db),
+                       current_user: Principal = Depends(get_current_user)):
 
-    db.query(ChatMessage).filter(
+    await db.execute(delete(ChatMessage).where(
         ChatMessage.tree_id == tree_id,
         ChatMessage.user_id == current_user.id
-    ).delete()
-    db.commit()
+    ))
+    await db.commit()
 
     return {"message": "Chat history cleared"}
 
 
 @app.post("/trees/{tree_id}/insert", response_model=TreeResponse)
-def insert_node_endpoint(
+async def insert_node_endpoint(
     tree_id: int,
     payload: TreeInsertRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     """
     Insert a node into the tree under a given parent.
     If the tree is empty, create a new root node.
     """
-    tree = db.query(TreeSession).filter(
-        TreeSession.id == tree_id,
-        TreeSession.user_id == current_user.id,
-    ).first()
+    tree = await _load_tree(db, tree_id, current_user.id)
 
     if not tree:
         raise HTTPException(status_code=404, detail="Tree not found")
 
     if tree.tree_data is None:
         # if no tree yet, create root node using new_value
-        tree.tree_data = {"value": payload.new_value, "left": None, "right": None}
-        flag_modified(tree, "tree_data")
-        db.commit()
-        db.refresh(tree)
-        return tree
+        await _commit_tree(db, tree, {"value": payload.new_value, "left": None, "right": None})
+        return await _tree_response(tree)
 
     if payload.parent_value is None:
         raise HTTPException(status_code=400, detail="Parent value is required for non-empty tree")
 
-    print(f"[INSERT] Before: parent={payload.parent_value}, new={payload.new_value}, dir={payload.direction}")
-    print(f"[INSERT] Tree structure before: {tree.tree_data}")
-    
-    inserted = insert_node(tree.tree_data, payload.parent_value, payload.new_value, payload.direction)
-    
-    print(f"[INSERT] Tree structure after: {tree.tree_data}")
-    print(f"[INSERT] Inserted: {inserted}")
-    
-    if not inserted:
+    version = _tree_version(tree)
+    index, inserted = await _run_tree_op(
+        tree, version,
+        lambda index: index.insert(payload.parent_value, payload.new_value, payload.direction),
+    )
+
+    if inserted is None:
+        tree_cache.put_index(tree.id, version, index)
         raise HTTPException(status_code=400, detail="Parent node not found")
 
-    flag_modified(tree, "tree_data")
-    db.commit()
-    db.refresh(tree)
+    await _commit_tree(db, tree, index.tree, index.drain_changes(), index.measure())
+    # Render before the index (which shares tree.tree_data) is shared again
+    response = await _tree_response(tree)
+    _recache_index(tree, version, index)
 
-    return tree
+    return response
 
 
 @app.post("/trees/{tree_id}/delete", response_model=TreeResponse)
-def delete_node_endpoint(
+async def delete_node_endpoint(
     tree_id: int,
     payload: TreeValueRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     """
     Delete a node by value from the tree.
     """
-    tree = db.query(TreeSession).filter(
-        TreeSession.id == tree_id,
-        TreeSession.user_id == current_user.id,
-    ).first()
+    tree = await _load_tree(db, tree_id, current_user.id)
 
     if not tree:
         raise HTTPException(status_code=404, detail="Tree not found")
 
-    tree.tree_data = delete_node(tree.tree_data, payload.value)
-    flag_modified(tree, "tree_data")
-    db.commit()
-    db.refresh(tree)
+    version = _tree_version(tree)
+    index, detached = await _run_tree_op(tree, version, lambda index: index.delete(payload.value))
+    if not detached:
+        tree_cache.put_index(tree.id, version, index)
+        raise HTTPException(status_code=400, detail="Node not found")
 
-    return tree
+    await _commit_tree(db, tree, index.tree, index.drain_changes(), index.measure())
+    # Render before the index (which shares tree.tree_data) is shared again
+    response = await _tree_response(tree)
+    _recache_index(tree, version, index)
+
+    return response
 
 
 @app.post("/trees/{tree_id}/update", response_model=TreeResponse)
-def update_node_endpoint(
+async def update_node_endpoint(
     tree_id: int,
     payload: TreeUpdateNodeRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     """
     Update a node's value in the tree.
     """
-    tree = db.query(TreeSession).filter(
-        TreeSession.id == tree_id,
-        TreeSession.user_id == current_user.id,
-    ).first()
+    tree = await _load_tree(db, tree_id, current_user.id)
 
     if not tree:
         raise HTTPException(status_code=404, detail="Tree not found")
 
-    tree.tree_data = update_node(tree.tree_data, payload.node_id, payload.new_value)
-    flag_modified(tree, "tree_data")
-    db.commit()
-    db.refresh(tree)
+    version = _tree_version(tree)
+    index, updated = await _run_tree_op(
+        tree, version, lambda index: index.update(payload.node_id, payload.new_value)
+    )
+    if updated is None:
+        tree_cache.put_index(tree.id, version, index)
+        raise HTTPException(status_code=400, detail="Node not found")
 
-    return tree
+    await _commit_tree(db, tree, index.tree, index.drain_changes(), index.measure())
+    # Render before the index (which shares tree.tree_data) is shared again
+    response = await _tree_response(tree)
+    _recache_index(tree, version, index)
+
+    return response
+
+
+def _apply_tree_operation(index: TreeIndex, operation):
+    """Apply one batch operation to ``index``; returns the operation's result."""
+    if operation.op == "search":
+        return {"op": "search", "ok": True, "detail": None, "found": index.search(operation.value)}
+    ok, detail = _apply_tree_mutation(index, operation)
+    return {"op": operation.op, "ok": ok, "detail": detail}
+
+
+def _apply_tree_mutation(index: TreeIndex, operation):
+    """Apply one insert/delete/update to ``index``; returns (ok, detail)."""
+    if operation.op == "insert":
+        if operation.direction not in ("left", "right"):
+            return False, "direction must be 'left' or 'right'"
+        if index.tree is None:
+            index.insert_root(operation.new_value)
+            return True, None
+        if operation.parent_value is None:
+            return False, "Parent value is required for non-empty tree"
+        if index.insert(operation.parent_value, operation.new_value, operation.direction) is None:
+            return False, "Parent node not found"
+        return True, None
+
+    if operation.op == "delete":
+        if not index.delete(operation.value):
+            return False, "Node not found"
+        return True, None
+
+    if index.update(operation.node_id, operation.new_value) is None:
+        return False, "Node not found"
+    return True, None
+
+
+@app.post("/trees/{tree_id}/batch", response_model=TreeBatchResponse)
+async def batch_tree_operations(
+    tree_id: int,
+    payload: TreeBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """
+    Apply an ordered list of insert/delete/update/search operations in memory
+    and persist the result with a single commit (none if nothing changed).
+    Failed operations are reported and skipped; the rest still apply. A
+    search sees the tree as left by the operations before it.
+    """
+    tree = await _load_tree(db, tree_id, current_user.id)
+
+    if not tree:
+        raise HTTPException(status_code=404, detail="Tree not found")
+
+    def apply_all(index):
+        results = []
+        modified = False
+        for operation in payload.operations:
+            result = _apply_tree_operation(index, operation)
+            modified = modified or (result["ok"] and operation.op != "search")
+            results.append(result)
+        return results, modified
+
+    version = _tree_version(tree)
+    index, (results, modified) = await _run_tree_op(tree, version, apply_all)
+
+    if modified:
+        await _commit_tree(db, tree, index.tree, index.drain_changes(), index.measure())
+
+    # Render before the index (which shares tree.tree_data) is shared again
+    response = await _json_response(TreeBatchResponse, {"tree": tree, "results": results})
+    if modified:
+        _recache_index(tree, version, index)
+    else:
+        tree_cache.put_index(tree.id, version, index)
+
+    return response
 
 
 @app.post("/trees/{tree_id}/reset")
-def reset_tree_endpoint(
+async def reset_tree_endpoint(
     tree_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     """
     Reset a tree to empty state.
     """
-    tree = db.query(TreeSession).filter(
-        TreeSession.id == tree_id,
-        TreeSession.user_id == current_user.id,
-    ).first()
+    tree = await _load_tree(db, tree_id, current_user.id)
 
     if not tree:
         raise HTTPException(status_code=404, detail="Tree not found")
 
-    tree.tree_data = None
-    flag_modified(tree, "tree_data")
-    db.commit()
+    await _commit_tree(db, tree, None)
 
     return {"message": "Tree reset successfully"}
 
 
 @app.post("/trees/{tree_id}/search", response_model=TreeSearchResponse)
-def search_node_endpoint(
+async def search_node_endpoint(
     tree_id: int,
     payload: TreeValueRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     """
     Simple search: checks if a node with the given value exists.
     For this assignment, we treat the node_id as the node's value.
     """
-    tree = db.query(TreeSession).filter(
-        TreeSession.id == tree_id,
-        TreeSession.user_id == current_user.id,
-    ).first()
+    tree = await _load_tree(db, tree_id, current_user.id)
 
     if not tree or not tree.tree_data:
         raise HTTPException(status_code=404, detail="Tree not found")
 
     target = payload.value
-
-    def dfs(node):
-        if not node:
-            return False
-        if node.get("value") == target:
-            return True
-        return dfs(node.get("left")) or dfs(node.get("right"))
-
-    found = dfs(tree.tree_data)
+    version = _tree_version(tree)
+    index, found = await _run_tree_op(tree, version, lambda index: index.search(target))
+    tree_cache.put_index(tree.id, version, index)
 
     if not found:
         return TreeSearchResponse(found=False, node_id=None)
@@ -567,27 +1025,100 @@ def search_node_endpoint(
     return TreeSearchResponse(found=True, node_id=target)
 
 
+TRAVERSAL_STREAM_CHUNK = 1000
+
+
+def _ndjson_chunks(values):
+    """Group values into NDJSON chunks of TRAVERSAL_STREAM_CHUNK lines."""
+    lines = []
+    for value in values:
+        lines.append(json.dumps(value))
+        if len(lines) >= TRAVERSAL_STREAM_CHUNK:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _json_order_chunks(traversal_type, values):
+    """Stream ``{"type": ..., "order": [...]}`` without materialising the list."""
+    yield '{"type": %s, "order": [' % json.dumps(traversal_type)
+    separator = ""
+    for chunk in _ndjson_chunks(values):
+        yield separator + chunk.rstrip("\n").replace("\n", ",")
+        separator = ","
+    yield "]}"
+
+
 @app.get("/trees/{tree_id}/traversal")
-def get_traversal(tree_id: int,
+async def get_traversal(tree_id: int,
                   type: str = Query("inorder", pattern="^(inorder|preorder|postorder)$"),
-                  db: Session = Depends(get_db),
-                  current_user: User = Depends(get_current_user)):
+                  stream: Optional[str] = Query(None, pattern="^(ndjson|json)$"),
+                  db: AsyncSession = Depends(get_db),
+                  current_user: Principal = Depends(get_current_user)):
     """
     Return traversal order for a tree for animation on frontend.
+
+    With ``stream=ndjson`` the values are streamed one per line; with
+    ``stream=json`` the usual ``{"type", "order"}`` document is streamed as it
+    is produced. Either way the full list is never built in memory.
     """
-    tree = db.query(TreeSession).filter(
-        TreeSession.id == tree_id,
-        TreeSession.user_id == current_user.id,
-    ).first()
+    tree = await _load_tree(db, tree_id, current_user.id)
 
     if not tree or not tree.tree_data:
         raise HTTPException(status_code=404, detail="Tree not found")
 
-    if type == "inorder":
-        result = inorder_traversal(tree.tree_data)
-    elif type == "preorder":
-        result = preorder_traversal(tree.tree_data)
-    else:
-        result = postorder_traversal(tree.tree_data)
+    if stream is not None:
+        values = iter_values(tree.tree_data, type)
+        if stream == "ndjson":
+            return StreamingResponse(_ndjson_chunks(values), media_type="application/x-ndjson")
+        return StreamingResponse(_json_order_chunks(type, values), media_type="application/json")
+
+    stats = await _tree_stats(tree)
+
+    return {"type": type, "order": stats[type]}
+
+
+@app.get("/trees/{tree_id}/stats", response_model=TreeStatsResponse)
+async def get_tree_stats(tree_id: int,
+                   db: AsyncSession = Depends(get_db),
+                   current_user: Principal = Depends(get_current_user)):
+    """
+    Return height, node count, leaves, min/max and all traversals in one pass.
+    """
+    tree = await _load_tree(db, tree_id, current_user.id)
+
+    if not tree:
+        raise HTTPException(status_code=404, detail="Tree not found")
+
+    return await _tree_stats(tree)
+
+
+@app.get("/admin/profiles")
+async def list_profiles(admin: Principal = Depends(require_admin)):
+    """Captured request profiles, newest first."""
+    return {"profiles": request_profiler.list()}
 
-    return {"type": type, "order": result}
\ No newline at end of file
+
+@app.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: int,
+                      format: str = Query("speedscope", pattern="^(speedscope|collapsed)$"),
+                      admin: Principal = Depends(require_admin)):
+    """
+    Download a profile as speedscope JSON (open it at https://www.speedscope.app)
+    or as collapsed stacks for flamegraph.pl / inferno.
+    """
+    profile = request_profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    if format == "collapsed":
+        return Response(
+            to_collapsed(profile["speedscope"]),
+            media_type="text/plain",
+            headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'},
+        )
+    return JSONResponse(
+        profile["speedscope"],
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.speedscope.json"'},
+    )
@@ -0,0 +1,143 @@
+"""
+Prometheus metrics shared across backend modules.
+
+``prometheus_client`` is optional: when it is not installed every metric
+defined here is a no-op, so callers can instrument unconditionally.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:  # pragma: no cover - depends on the environment
+    Counter = Gauge = Histogram = None
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, *args, **kwargs):
+        pass
+
+    def dec(self, *args, **kwargs):
+        pass
+
+    def set(self, *args, **kwargs):
+        pass
+
+    def observe(self, *args, **kwargs):
+        pass
+
+    def set_function(self, *args, **kwargs):
+        pass
+
+
+def _metric(factory, *args, **kwargs):
+    if factory is None:
+        return _NoopMetric()
+    return factory(*args, **kwargs)
+
+
+TREE_CACHE_HITS = _metric(
+    Counter, "tree_cache_hits_total", "Derived tree result cache hits", ["kind"]
+)
+TREE_CACHE_MISSES = _metric(
+    Counter, "tree_cache_misses_total", "Derived tree result cache misses", ["kind"]
+)
+TREE_CACHE_EVICTIONS = _metric(
+    Counter, "tree_cache_evictions_total", "Derived tree result cache evictions"
+)
+
+PRINCIPAL_CACHE_HITS = _metric(
+    Counter, "principal_cache_hits_total", "Requests authenticated from the principal cache"
+)
+PRINCIPAL_CACHE_MISSES = _metric(
+    Counter, "principal_cache_misses_total", "Requests that had to verify the token and load the user"
+)
+
+LLM_CACHE_HITS = _metric(
+    Counter, "llm_cache_hits_total", "Chat answers served from the LLM response cache", ["tier"]
+)
+LLM_CACHE_MISSES = _metric(
+    Counter, "llm_cache_misses_total", "Cacheable chat messages that had to call the LLM"
+)
+LLM_CACHE_BYPASSED = _metric(
+    Counter, "llm_cache_bypassed_total", "Chat messages with a mutating intent, never cached"
+)
+
+LLM_CALLS = _metric(
+    Counter, "llm_calls_total",
+    "LLM provider calls by result (ok, error, timeout, circuit_open)", ["result"]
+)
+LLM_CALL_SECONDS = _metric(
+    Histogram, "llm_call_seconds", "LLM provider call latency, including the concurrency wait",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+LLM_CIRCUIT_OPEN = _metric(
+    Gauge, "llm_circuit_open", "1 while the LLM circuit breaker is open (chat uses the rule-based agent)"
+)
+
+PASSWORD_HASH_PENDING = _metric(
+    Gauge, "password_hash_pending", "Password hash/verify jobs queued or running"
+)
+PASSWORD_HASH_REJECTED = _metric(
+    Counter, "password_hash_rejected_total", "Password jobs refused because the pool was saturated", ["op"]
+)
+PASSWORD_HASH_SECONDS = _metric(
+    Histogram,
+    "password_hash_seconds",
+    "Password job latency including time spent queued",
+    ["op"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+RATE_LIMIT_REJECTED = _metric(
+    Counter, "rate_limit_rejected_total", "Requests rejected with 429", ["rule"]
+)
+
+DB_POOL_CHECKOUT_SECONDS = _metric(
+    Histogram,
+    "db_pool_checkout_seconds",
+    "Time to check a connection out of the pool (queue wait, connect, pre-ping)",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_POOL_CHECKOUT_TIMEOUTS = _metric(
+    Counter,
+    "db_pool_checkout_timeouts_total",
+    "Checkouts that gave up after DB_POOL_TIMEOUT seconds",
+    ["pool"],
+)
+DB_POOL_CONFIGURED_SIZE = _metric(
+    Gauge, "db_pool_configured_size", "Connections the pool keeps open", ["pool"]
+)
+DB_POOL_IN_USE = _metric(Gauge, "db_pool_connections_in_use", "Connections currently checked out", ["pool"])
+DB_POOL_OVERFLOW = _metric(
+    Gauge, "db_pool_overflow_connections", "Open connections beyond the pool size", ["pool"]
+)
+
+# Route template ("/trees/{tree_id}") of the request being handled. Set by a
+# global dependency in main, so it is known inside handlers and auth.
+current_route: ContextVar[str] = ContextVar("current_route", default="unmatched")
+
+REQUEST_STAGE_SECONDS = _metric(
+    Histogram,
+    "app_request_stage_seconds",
+    "Time spent in one stage of a request (auth, db_load, tree_op, agent, commit)",
+    ["route", "stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """Time the enclosed block as ``stage`` of the current route."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REQUEST_STAGE_SECONDS.labels(route=current_route.get(), stage=stage).observe(
+            time.perf_counter() - start
+        )
@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, Index, DateTime
 from database import Base
 from sqlalchemy import ForeignKey
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import JSON
 from sqlalchemy import Text
 from datetime import datetime, timezone
 
@@ -18,18 +19,34 @@ class TreeSession(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
-    tree_data = Column(JSONB)
+    # JSONB on Postgres, plain JSON elsewhere (SQLite in tests)
+    tree_data = Column(JSON().with_variant(JSONB(), "postgresql"))
+    # Bumped on every mutation; used for cache keys and ETags
+    revision = Column(Integer, nullable=False, default=1, server_default="1")
+    # Summary kept in sync on every write so listings never load tree_data
+    node_count = Column(Integer, nullable=False, default=0, server_default="0")
+    height = Column(Integer, nullable=False, default=0, server_default="0")
     user_id = Column(Integer, ForeignKey("users.id"))
 
     user = relationship("User")
 
+    __table_args__ = (
+        # Keyset pagination of a user's trees
+        Index("ix_tree_sessions_user_id_id", "user_id", "id"),
+    )
+
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
 
     id = Column(Integer, primary_key=True, index=True)
     message = Column(Text)
     response = Column(Text)
-    timestamp = Column(String, default=lambda: datetime.now(timezone.utc).isoformat())
+    timestamp = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
     user_id = Column(Integer, ForeignKey("users.id"))
-    tree_id = Column(Integer, ForeignKey("tree_sessions.id"))
\ No newline at end of file
+    tree_id = Column(Integer, ForeignKey("tree_sessions.id"))
+
+    __table_args__ = (
+        # Cursor pagination of one tree's history: WHERE tree_id, user_id AND id < cursor
+        Index("ix_chat_messages_tree_id_user_id_id", "tree_id", "user_id", "id"),
+    )
\ No newline at end of file
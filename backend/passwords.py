@@ -0,0 +1,120 @@
+"""
+Password hashing off the request path.
+
+bcrypt is deliberately slow (about 250ms per hash at the default cost), so
+request handlers await ``password_hasher`` instead of calling bcrypt
+directly. Jobs run in a dedicated process pool of ``PASSWORD_HASH_WORKERS``
+processes. A job never blocks the event loop or competes with tree work for
+the GIL. At most ``PASSWORD_HASH_MAX_PENDING`` jobs may be queued or running.
+Beyond that ``PasswordHasherBusy`` is raised straight away, and the API turns
+it into a 503, rather than letting logins queue behind each other.
+
+``PASSWORD_HASH_WORKERS=0`` runs jobs in the default thread pool instead.
+The sync helpers (``hash_password`` / ``verify_password``) stay for scripts
+such as ``seed.py``.
+
+This module is imported by the worker processes, so it must stay free of
+application imports (database, FastAPI, ...).
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from passlib.context import CryptContext
+
+from metrics import PASSWORD_HASH_PENDING, PASSWORD_HASH_REJECTED, PASSWORD_HASH_SECONDS
+
+# Changing the cost only affects new hashes; existing ones are upgraded on
+# the next successful login via verify_and_update().
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(
+    os.environ.get("PASSWORD_HASH_WORKERS", str(min(2, os.cpu_count() or 1)))
+)
+PASSWORD_HASH_MAX_PENDING = int(
+    os.environ.get("PASSWORD_HASH_MAX_PENDING", str(max(PASSWORD_HASH_WORKERS, 1) * 8))
+)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+def hash_password(password: str):
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update(plain_password, hashed_password):
+    """Return ``(valid, new_hash)``; ``new_hash`` is set when the cost settings changed."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when PASSWORD_HASH_MAX_PENDING jobs are already in flight."""
+
+
+class PasswordHasher:
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _get_executor(self):
+        # Created lazily so importing this module never starts processes.
+        # "spawn" avoids forking a process that already runs threads.
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def _run(self, op, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                PASSWORD_HASH_REJECTED.labels(op=op).inc()
+                raise PasswordHasherBusy(f"{self._pending} password jobs already pending")
+            self._pending += 1
+            PASSWORD_HASH_PENDING.set(self._pending)
+
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            try:
+                return await loop.run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed); start a fresh pool next time
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                raise
+        finally:
+            PASSWORD_HASH_SECONDS.labels(op=op).observe(time.perf_counter() - start)
+            with self._lock:
+                self._pending -= 1
+                PASSWORD_HASH_PENDING.set(self._pending)
+
+    async def hash(self, password: str):
+        return await self._run("hash", hash_password, password)
+
+    async def verify_and_update(self, plain_password, hashed_password):
+        return await self._run("verify", verify_and_update, plain_password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
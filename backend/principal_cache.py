@@ -0,0 +1,101 @@
+"""
+Cache of authenticated principals, keyed by access token.
+
+A verified token maps to the ``Principal`` it authenticates, so repeated
+requests with the same token skip both JWT decoding and the user lookup.
+An entry expires at the token's ``exp`` or after ``PRINCIPAL_CACHE_TTL``
+seconds, whichever is sooner. The TTL bounds how long another worker process
+can keep serving a principal after its account changed. Eviction beyond
+``PRINCIPAL_CACHE_MAX_ENTRIES`` is LRU.
+
+Call ``invalidate_user(user_id)`` whenever an account changes. ``auth`` wires
+this to the ``User`` mapper's update/delete events.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from metrics import PRINCIPAL_CACHE_HITS, PRINCIPAL_CACHE_MISSES
+
+PRINCIPAL_CACHE_TTL = float(os.environ.get("PRINCIPAL_CACHE_TTL", "300"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.environ.get("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as seen by request handlers."""
+
+    id: int
+    email: str
+
+
+class PrincipalCache:
+    def __init__(self, ttl=PRINCIPAL_CACHE_TTL, max_entries=PRINCIPAL_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # token -> (principal, expires_at)
+        self._tokens_by_user = {}  # user_id -> set of tokens
+        self._lock = threading.Lock()
+
+    def get(self, token, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    self._discard(token)
+                PRINCIPAL_CACHE_MISSES.inc()
+                return None
+            self._entries.move_to_end(token)
+        PRINCIPAL_CACHE_HITS.inc()
+        return entry[0]
+
+    def peek(self, token, now=None):
+        """Like ``get`` but without recency or hit/miss bookkeeping."""
+        now = time.time() if now is None else now
+        entry = self._entries.get(token)
+        if entry is None or entry[1] <= now:
+            return None
+        return entry[0]
+
+    def put(self, token, principal, exp, now=None):
+        """Cache ``principal`` for ``token`` until ``exp`` (epoch seconds) at the latest."""
+        now = time.time() if now is None else now
+        expires_at = min(exp, now + self.ttl)
+        if expires_at <= now or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._discard(token)
+            self._entries[token] = (principal, expires_at)
+            self._tokens_by_user.setdefault(principal.id, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        """Forget every cached token of ``user_id``."""
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._discard(token)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _discard(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_user.get(entry[0].id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry[0].id]
+
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,259 @@
+"""
+Opt-in sampling profiler for individual requests.
+
+A request is profiled when it is *forced* (an admin sends ``X-Profile: 1``,
+or ``PROFILE_ALL_REQUESTS=1``) or when it is still running after
+``PROFILE_SLOW_REQUEST_MS`` milliseconds. A slow request is sampled from
+the threshold until it finishes, which is the part worth looking at. Nothing
+is sampled, and no sampler thread runs, while no request qualifies.
+
+The sampler is a daemon thread reading ``sys._current_frames()`` every
+``PROFILE_SAMPLE_INTERVAL_MS``. It records every busy thread: the event
+loop and the worker threads that run blocking calls.
+Idle threads are skipped. Samples are process-wide, so requests running
+at the same time show up in each other's profiles.
+
+Finished profiles are kept in memory (the last ``PROFILE_MAX_STORED``) in
+the speedscope file format (https://www.speedscope.app), one sampled
+profile per thread. ``to_collapsed`` converts them for flamegraph tools.
+"""
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+PROFILE_ALL_REQUESTS = os.environ.get("PROFILE_ALL_REQUESTS", "0") in ("1", "true", "True")
+# 0 disables slow-request capture
+PROFILE_SLOW_REQUEST_MS = float(os.environ.get("PROFILE_SLOW_REQUEST_MS", "0"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_MAX_STORED = int(os.environ.get("PROFILE_MAX_STORED", "50"))
+PROFILE_MAX_DEPTH = 256
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+# Leaf frames of threads that are waiting for work rather than doing it
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+@dataclass
+class _Capture:
+    id: int
+    method: str
+    path: str
+    reason: Optional[str]
+    started: float
+    sample_from: float
+    # thread name -> Counter of stacks (tuples of frame keys, root first)
+    stacks: dict = field(default_factory=dict)
+    samples: int = 0
+
+
+def _frame_key(frame):
+    code = frame.f_code
+    return (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+
+
+def _is_idle(frame):
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES
+
+
+def _stack(frame):
+    keys = []
+    while frame is not None and len(keys) < PROFILE_MAX_DEPTH:
+        keys.append(_frame_key(frame))
+        frame = frame.f_back
+    keys.reverse()
+    return tuple(keys)
+
+
+def to_speedscope(name, stacks_by_thread, interval_ms):
+    """Build a speedscope document from ``{thread_name: Counter(stack -> count)}``."""
+    frames = []
+    frame_index = {}
+    profiles = []
+    for thread_name, stacks in sorted(stacks_by_thread.items()):
+        samples, weights = [], []
+        for stack, count in stacks.most_common():
+            indices = []
+            for key in stack:
+                if key not in frame_index:
+                    frame_index[key] = len(frames)
+                    frames.append({"name": key[0], "file": key[1], "line": key[2]})
+                indices.append(frame_index[key])
+            samples.append(indices)
+            weights.append(count * interval_ms)
+        total = sum(weights)
+        profiles.append({
+            "type": "sampled",
+            "name": thread_name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": total,
+            "samples": samples,
+            "weights": weights,
+        })
+    return {
+        "$schema": SPEEDSCOPE_SCHEMA,
+        "name": name,
+        "exporter": "agentic-tree",
+        "activeProfileIndex": 0,
+        "shared": {"frames": frames},
+        "profiles": profiles,
+    }
+
+
+def to_collapsed(document):
+    """
+    Render a speedscope document as collapsed stacks (``thread;outer;inner ms``),
+    the input format of flamegraph.pl and inferno.
+    """
+    frames = document["shared"]["frames"]
+    lines = []
+    for profile in document["profiles"]:
+        for sample, weight in zip(profile["samples"], profile["weights"]):
+            names = [profile["name"]] + [frames[index]["name"] for index in sample]
+            lines.append(f"{';'.join(names)} {round(weight)}")
+    return "\n".join(lines) + "\n"
+
+
+class RequestProfiler:
+    def __init__(self, slow_ms=PROFILE_SLOW_REQUEST_MS, interval_ms=PROFILE_SAMPLE_INTERVAL_MS,
+                 max_stored=PROFILE_MAX_STORED, profile_all=PROFILE_ALL_REQUESTS):
+        self.slow_ms = slow_ms
+        self.interval_ms = interval_ms
+        self.profile_all = profile_all
+        self._active = {}
+        self._stored = deque(maxlen=max_stored)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # ---------- request lifecycle ----------
+
+    def begin(self, method, path, force_reason=None):
+        """Register a request; returns a handle for ``end`` or None if it can never be profiled."""
+        if force_reason is None and self.profile_all:
+            force_reason = "env"
+        if force_reason is None and self.slow_ms <= 0:
+            return None
+
+        now = time.perf_counter()
+        sample_from = now if force_reason else now + self.slow_ms / 1000.0
+        capture = _Capture(next(self._ids), method, path, force_reason, now, sample_from)
+        with self._lock:
+            self._active[capture.id] = capture
+            self._ensure_thread()
+        self._wake.set()
+        return capture
+
+    def end(self, capture, route=None):
+        """Finish ``capture``; returns the stored profile id, or None if nothing was sampled."""
+        if capture is None:
+            return None
+        with self._lock:
+            # Once detached the sampler no longer writes to it (see _sample)
+            self._active.pop(capture.id, None)
+        duration_ms = (time.perf_counter() - capture.started) * 1000.0
+        if not capture.samples:
+            return None
+
+        reason = capture.reason or "slow"
+        label = f"{capture.method} {route or capture.path}"
+        profile = {
+            "id": capture.id,
+            "method": capture.method,
+            "path": capture.path,
+            "route": route,
+            "reason": reason,
+            "duration_ms": round(duration_ms, 2),
+            "samples": capture.samples,
+            "captured_at": time.time(),
+            "speedscope": to_speedscope(
+                f"{label} ({duration_ms:.0f} ms, {reason})", capture.stacks, self.interval_ms
+            ),
+        }
+        with self._lock:
+            self._stored.append(profile)
+        return capture.id
+
+    # ---------- stored profiles ----------
+
+    def list(self):
+        with self._lock:
+            stored = list(self._stored)
+        return [
+            {key: value for key, value in profile.items() if key != "speedscope"}
+            for profile in reversed(stored)
+        ]
+
+    def get(self, profile_id):
+        with self._lock:
+            for profile in self._stored:
+                if profile["id"] == profile_id:
+                    return profile
+        return None
+
+    # ---------- sampler ----------
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="request-profiler", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        interval = self.interval_ms / 1000.0
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                captures = list(self._active.values())
+            if not captures:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            now = time.perf_counter()
+            due = [capture for capture in captures if capture.sample_from <= now]
+            if not due:
+                # Sleep until the earliest request crosses the slow threshold
+                next_due = min(capture.sample_from for capture in captures)
+                self._wake.wait(max(next_due - now, interval))
+                self._wake.clear()
+                continue
+
+            self._sample(due, own_id)
+            time.sleep(interval)
+
+    def _sample(self, captures, own_id):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = {}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or _is_idle(frame):
+                continue
+            stacks[names.get(thread_id, str(thread_id))] = _stack(frame)
+        del frame
+
+        with self._lock:
+            for capture in captures:
+                if capture.id not in self._active:
+                    # end() took it while the stacks were being walked
+                    continue
+                capture.samples += 1
+                for thread_name, stack in stacks.items():
+                    capture.stacks.setdefault(thread_name, Counter())[stack] += 1
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,279 @@
+"""
+Compact tree encoding for LLM prompts.
+
+Indented nested-dict JSON spends most of its characters on keys, ``null``
+children and whitespace. The compact form writes a node as
+``value(left,right)``. A leaf is just its value, and an empty child is left
+blank:
+
+    {"value": 1, "left": {"value": 2, ...}, "right": {"value": 3, "left": None,
+     "right": {"value": 4, ...}}}
+        -> 1(2,3(,4))
+
+Token budget (``LLM_PROMPT_TOKEN_BUDGET``, 0 = unlimited): when the compact form
+of a tree does not fit, subtrees are summarized as
+``[n=<nodes> h=<height> <min>..<max>]``. The budget is spent in this order:
+
+1. the subtrees of the nodes the message mentions by value, top levels first
+2. the path from the root down to each of them
+3. the rest of the tree, top levels first
+
+A mentioned subtree the cut-down tree cannot reach (say, deep in a chain) is
+written on its own line after it, together with its depth. The root summary
+and those lines are always sent, so a budget of a few dozen tokens can be
+exceeded.
+
+Encoding goes through ``CompactTree``, so it is iterative and works for trees
+of any depth.
+"""
+import heapq
+import os
+import re
+
+from compact_tree import NIL, CompactTree
+from intent_parser import tokenize
+
+LLM_PROMPT_TOKEN_BUDGET = int(os.environ.get("LLM_PROMPT_TOKEN_BUDGET", "2000"))
+# Rough, on the safe side: digits and punctuation tokenize densely
+CHARS_PER_TOKEN = 3
+
+# A message can name many values; only the first few matches get a region
+_MAX_FOCUS_NODES = 8
+# Room for the "<value> at depth <d>: " prefix of a separate region
+_REGION_OVERHEAD = 32
+
+_TOKEN_RE = re.compile(r"\s*(?:(?P<value>-?\d+)|(?P<punct>[(),]))")
+
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def focus_values(message):
+    """The node values a message refers to (every number in it)."""
+    return {value for kind, value in tokenize(message) if kind == "number"}
+
+
+class _Subtrees:
+    """Per-node subtree size, height and value range from one postorder walk."""
+
+    __slots__ = ("values", "count", "height", "low", "high", "parent", "full_length")
+
+    def __init__(self, compact):
+        values, left, right = compact.values, compact.left, compact.right
+        size = len(compact)
+        self.values = values
+        self.count = [1] * size
+        self.height = [1] * size
+        self.low = list(values)
+        self.high = list(values)
+        self.parent = [NIL] * size
+        # Length of the fully expanded compact form
+        self.full_length = 0
+
+        count, height, low, high, parent = self.count, self.height, self.low, self.high, self.parent
+        for index in compact.iter_postorder():
+            self.full_length += len(str(values[index]))
+            children = [child for child in (left[index], right[index]) if child != NIL]
+            if children:
+                self.full_length += 3  # "(", ",", ")"
+            for child in children:
+                parent[child] = index
+                count[index] += count[child]
+                height[index] = max(height[index], height[child] + 1)
+                low[index] = min(low[index], low[child])
+                high[index] = max(high[index], high[child])
+
+    def summary(self, index):
+        if index == NIL:
+            return ""
+        if self.count[index] == 1:
+            return str(self.values[index])
+        return f"[n={self.count[index]} h={self.height[index]} {self.low[index]}..{self.high[index]}]"
+
+
+def _render(compact, expanded=None, subtrees=None, start=None):
+    """
+    Compact form of ``compact`` (or of the subtree at ``start``); nodes not
+    flagged in ``expanded`` are summarized.
+    """
+    values, left, right = compact.values, compact.left, compact.right
+    out = []
+    start = compact.root if start is None else start
+    stack = [start] if start != NIL else []
+    while stack:
+        item = stack.pop()
+        if item.__class__ is str:
+            out.append(item)
+        elif item == NIL:
+            continue
+        elif expanded is not None and not expanded[item]:
+            out.append(subtrees.summary(item))
+        else:
+            out.append(str(values[item]))
+            if left[item] != NIL or right[item] != NIL:
+                stack.extend((")", right[item], ",", left[item], "("))
+    return "".join(out)
+
+
+def encode_compact(tree):
+    """The full compact form of a nested-dict tree ("" when empty)."""
+    return _render(CompactTree.from_dict(tree))
+
+
+def decode_compact(text):
+    """Parse the compact form back into a nested-dict tree; raises ValueError."""
+    tokens = []
+    text = text.strip()
+    position = 0
+    while position < len(text):
+        match = _TOKEN_RE.match(text, position)
+        if match is None:
+            raise ValueError(f"Unexpected input at {position}: {text[position:position + 20]!r}")
+        if match.group("value") is not None:
+            tokens.append(("value", int(match.group("value"))))
+        else:
+            tokens.append(("punct", match.group("punct")))
+        position = match.end()
+    if not tokens:
+        return None
+
+    root = None
+    open_nodes = []  # [node, side] for nodes whose children are being read
+    position = 0
+    expect_child = True
+    while True:
+        if expect_child:
+            expect_child = False
+            if position < len(tokens) and tokens[position][0] == "value":
+                node = {"value": tokens[position][1], "left": None, "right": None}
+                position += 1
+                if open_nodes:
+                    open_nodes[-1][0][open_nodes[-1][1]] = node
+                else:
+                    root = node
+                if position < len(tokens) and tokens[position] == ("punct", "("):
+                    position += 1
+                    open_nodes.append([node, "left"])
+                    expect_child = True
+                    continue
+            elif not open_nodes:
+                raise ValueError("Expected a value at the start")
+        if not open_nodes:
+            break
+
+        # One child slot is done: "," moves to the right child, ")" closes the node
+        expected = "," if open_nodes[-1][1] == "left" else ")"
+        if position >= len(tokens) or tokens[position] != ("punct", expected):
+            raise ValueError(f"Expected {expected!r} at token {position}")
+        position += 1
+        if expected == ",":
+            open_nodes[-1][1] = "right"
+            expect_child = True
+        else:
+            open_nodes.pop()
+
+    if position != len(tokens):
+        raise ValueError(f"Unexpected input after the tree at token {position}")
+    return root
+
+
+def _find_focus(compact, targets):
+    values = compact.values
+    found = []
+    if targets:
+        for index in compact.iter_preorder():
+            if values[index] in targets:
+                found.append(index)
+                if len(found) == _MAX_FOCUS_NODES:
+                    break
+    return found
+
+
+def _choose_expanded(compact, subtrees, focus, budget_chars):
+    """Flags for the nodes to write out in full, spending at most ``budget_chars``."""
+    values, left, right, parent = compact.values, compact.left, compact.right, subtrees.parent
+    size = len(compact)
+    on_path = bytearray(size)
+    inside = bytearray(size)
+    expanded = bytearray(size)
+
+    for index in focus:
+        inside[index] = 1
+        index = parent[index]
+        while index != NIL and not on_path[index]:
+            on_path[index] = 1
+            index = parent[index]
+
+    def rank(index):
+        return 0 if inside[index] else 1 if on_path[index] else 2
+
+    # Focus subtrees are seeded directly, so a deep one doesn't wait for the
+    # path down to it; encode_for_prompt writes it out separately if needed.
+    root = compact.root
+    used = len(subtrees.summary(root))
+    # Reserve room in case a focus subtree needs a line of its own
+    used += sum(_REGION_OVERHEAD + len(subtrees.summary(index)) for index in focus)
+    heap = [(rank(index), 1, index) for index in [root] + focus if subtrees.count[index] > 1]
+    heapq.heapify(heap)
+    while heap:
+        _, depth, index = heapq.heappop(heap)
+        if expanded[index]:
+            continue
+        children = [child for child in (left[index], right[index]) if child != NIL]
+        cost = len(str(values[index])) - len(subtrees.summary(index))
+        if children:
+            cost += 3 + sum(len(subtrees.summary(child)) for child in children)
+        if used + cost > budget_chars:
+            continue
+        used += cost
+        expanded[index] = 1
+        for child in children:
+            if inside[index]:
+                inside[child] = 1
+            # Leaves are written out by their summary already
+            if subtrees.count[child] > 1:
+                heapq.heappush(heap, (rank(child), depth + 1, child))
+    return expanded
+
+
+def _depth_if_hidden(index, expanded, parent):
+    """Depth of ``index``, or None when every ancestor is expanded (it shows in the tree)."""
+    hidden = False
+    depth = 1
+    index = parent[index]
+    while index != NIL:
+        hidden = hidden or not expanded[index]
+        depth += 1
+        index = parent[index]
+    return depth if hidden else None
+
+
+def encode_for_prompt(tree, message, token_budget=LLM_PROMPT_TOKEN_BUDGET):
+    """
+    Return ``(text, summarized)``. ``text`` is the compact form of ``tree``,
+    cut down to ``token_budget`` around the values ``message`` mentions.
+    ``summarized`` tells whether any subtree was left out. Mentioned subtrees
+    the cut-down tree cannot reach follow it, one per line, as
+    ``<value> at depth <d>: <compact form>``.
+    """
+    compact = CompactTree.from_dict(tree)
+    if compact.root == NIL or token_budget <= 0:
+        return _render(compact), False
+
+    subtrees = _Subtrees(compact)
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    if subtrees.full_length <= budget_chars:
+        return _render(compact), False
+
+    focus = _find_focus(compact, focus_values(message))
+    expanded = _choose_expanded(compact, subtrees, focus, budget_chars)
+    lines = [_render(compact, expanded, subtrees)]
+    for index in focus:
+        depth = _depth_if_hidden(index, expanded, subtrees.parent)
+        if depth is not None:
+            lines.append(
+                f"{compact.values[index]} at depth {depth}: "
+                + _render(compact, expanded, subtrees, start=index)
+            )
+    return "\n".join(lines), True
@@ -0,0 +1,199 @@
+"""
+Sliding-window-counter rate limiting.
+
+Each key keeps two counters: requests in the current fixed window and in the
+previous one. The request rate is estimated as
+
+    previous * (1 - elapsed / window) + current
+
+which closely tracks a true sliding window in O(1) time and memory per key,
+instead of storing a timestamp per request.
+
+Counters live in a backend:
+
+* ``MemoryBackend``: per process; keys idle for two windows are evicted and
+  the total is capped at ``max_keys``.
+* ``RedisBackend``: shared by every worker, on top of a ``redis.asyncio``
+  client (``RATE_LIMIT_REDIS_URL``). Keys expire on their own.
+
+``RateLimiter`` applies a default rule to every request, plus any
+``RateLimitRule`` whose methods/paths match. A rule counts either per client
+IP or per authenticated user; user rules fall back to the IP for anonymous
+requests.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, FrozenSet, Optional, Tuple
+
+from metrics import RATE_LIMIT_REJECTED
+
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    name: str
+    limit: int
+    window: float
+    # "ip" or "user"
+    per: str = "ip"
+    # Empty means every method / every path
+    methods: FrozenSet[str] = frozenset()
+    paths: Tuple[str, ...] = ()
+
+    def matches(self, method: str, path: str):
+        if self.methods and method not in self.methods:
+            return False
+        return not self.paths or path in self.paths
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float = 0.0
+    rule: Optional[str] = field(default=None)
+
+
+def _estimate(previous, current, elapsed_fraction):
+    return previous * (1.0 - elapsed_fraction) + current
+
+
+def _retry_after(previous, current, limit, window, elapsed_fraction):
+    """Seconds until the estimate drops back below ``limit``."""
+    if current >= limit:
+        # Only the next window can help, where ``current`` becomes the
+        # decaying previous count: wait for current * (1 - f) < limit.
+        return window * (1.0 - elapsed_fraction) + window * max(0.0, 1.0 - limit / current)
+    # Wait for the previous window's weight to decay: previous * (1 - f) + current < limit
+    needed = 1.0 - (limit - current) / previous
+    return max(0.0, (needed - elapsed_fraction) * window)
+
+
+class MemoryBackend:
+    """In-process counters with idle eviction."""
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> [window_index, current, previous, window]; oldest activity first
+        self._counters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._counters)
+
+    async def hit(self, key, limit, window, now):
+        index, offset = divmod(now, window)
+        fraction = offset / window
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None:
+                entry = [index, 0, 0, window]
+                self._counters[key] = entry
+            else:
+                self._counters.move_to_end(key)
+                if entry[0] != index:
+                    # Roll forward; after more than one window everything has decayed
+                    entry[2] = entry[1] if entry[0] == index - 1 else 0
+                    entry[1] = 0
+                    entry[0] = index
+
+            previous, current = entry[2], entry[1]
+            allowed = _estimate(previous, current, fraction) < limit
+            if allowed:
+                entry[1] += 1
+            self._evict(now)
+
+        remaining = max(0, math.floor(limit - _estimate(previous, current + allowed, fraction)))
+        retry_after = 0.0 if allowed else _retry_after(previous, current, limit, window, fraction)
+        return RateLimitResult(allowed, limit, remaining, retry_after)
+
+    def _evict(self, now):
+        # Least recently used first: stop at the first key that is still live
+        while self._counters:
+            key, (index, _, _, window) = next(iter(self._counters.items()))
+            idle = now // window - index >= 2
+            if not idle and len(self._counters) <= self.max_keys:
+                break
+            del self._counters[key]
+
+
+class RedisBackend:
+    """Counters shared through Redis (``redis.asyncio`` client API)."""
+
+    def __init__(self, client, prefix="ratelimit"):
+        self.client = client
+        self.prefix = prefix
+
+    async def hit(self, key, limit, window, now):
+        index, offset = divmod(now, window)
+        fraction = offset / window
+        current_key = f"{self.prefix}:{key}:{int(index)}"
+        previous_key = f"{self.prefix}:{key}:{int(index) - 1}"
+
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.incr(current_key)
+            pipe.expire(current_key, int(math.ceil(window * 2)))
+            pipe.get(previous_key)
+            current, _, previous = await pipe.execute()
+
+        previous = int(previous or 0)
+        # ``current`` already includes this request
+        allowed = _estimate(previous, current - 1, fraction) < limit
+        if not allowed:
+            # Rejected requests do not count against the window
+            await self.client.decr(current_key)
+            current -= 1
+
+        remaining = max(0, math.floor(limit - _estimate(previous, current, fraction)))
+        retry_after = 0.0 if allowed else _retry_after(previous, current, limit, window, fraction)
+        return RateLimitResult(allowed, limit, remaining, retry_after)
+
+
+class RateLimiter:
+    def __init__(self, backend, default: Optional[RateLimitRule], rules=(),
+                 clock: Callable[[], float] = time.time):
+        self.backend = backend
+        self.default = default
+        self.rules = list(rules)
+        self.clock = clock
+
+    async def check(self, method: str, path: str, client_ip: str, user_id=None):
+        """
+        Count the request against every applicable rule. Route rules are
+        checked first, so a request they reject does not use up the default
+        budget. Returns the first rejection, otherwise the tightest result.
+        """
+        now = self.clock()
+        applicable = [rule for rule in self.rules if rule.matches(method, path)]
+        if self.default is not None:
+            applicable.append(self.default)
+
+        tightest = None
+        for rule in applicable:
+            if rule.per == "user" and user_id is not None:
+                subject = f"user:{user_id}"
+            else:
+                subject = f"ip:{client_ip}"
+            result = await self.backend.hit(f"{rule.name}:{subject}", rule.limit, rule.window, now)
+            if not result.allowed:
+                RATE_LIMIT_REJECTED.labels(rule=rule.name).inc()
+                return RateLimitResult(False, result.limit, 0, result.retry_after, rule.name)
+            if tightest is None or result.remaining < tightest.remaining:
+                tightest = RateLimitResult(True, result.limit, result.remaining, 0.0, rule.name)
+        return tightest
+
+
+def backend_from_env():
+    """RedisBackend when RATE_LIMIT_REDIS_URL is set, else a MemoryBackend."""
+    url = os.environ.get("RATE_LIMIT_REDIS_URL")
+    if not url:
+        return MemoryBackend()
+    import redis.asyncio as redis  # optional dependency, only needed for Redis
+
+    return RedisBackend(redis.from_url(url))
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, ConfigDict
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from typing import Optional, Dict, Any, List, Literal, Union, Annotated
+from datetime import datetime
 
 class UserCreate(BaseModel):
     email: str
@@ -12,36 +13,47 @@ class UserLogin(BaseModel):
 class TreeCreate(BaseModel):
     name: str
     tree_data: Optional[Dict[str, Any]] = None
+    # Alternative inputs, built server-side in O(n):
+    # heap-style level order (None marks a gap) or ascending values for a balanced tree
+    level_order: Optional[List[Optional[int]]] = None
+    sorted_values: Optional[List[int]] = None
+
+    @model_validator(mode="after")
+    def _single_source(self):
+        sources = [self.tree_data, self.level_order, self.sorted_values]
+        if sum(source is not None for source in sources) > 1:
+            raise ValueError("Provide only one of tree_data, level_order or sorted_values")
+        return self
 
 class TreeResponse(BaseModel):
     id: int
     name: str
     tree_data: Optional[Dict[str, Any]]
+    revision: Optional[int] = None
 
     model_config = ConfigDict(from_attributes=True)
 
 
-class TreeInsertRequest(BaseModel):
-    parent_value: Optional[int] = None
-    new_value: int
-    direction: str
+class TreeSummary(BaseModel):
+    id: int
+    name: str
+    revision: int
+    node_count: int
+    height: int
 
-    # basic validation
-    def validate_direction(self):
-        if self.direction not in ("left", "right"):
-            raise ValueError("direction must be 'left' or 'right'")
+    model_config = ConfigDict(from_attributes=True)
+
+
+class TreeSummaryPage(BaseModel):
+    items: List[TreeSummary]
+    # Pass as after_id to fetch the next page; None on the last page
+    next_after_id: Optional[int] = None
 
-    @classmethod
-    def __get_validators__(cls):
-        yield from super().__get_validators__()
-        yield cls._validate
 
-    @classmethod
-    def _validate(cls, values):
-        dir = values.get('direction')
-        if dir not in ("left", "right"):
-            raise ValueError("direction must be 'left' or 'right'")
-        return values
+class TreeInsertRequest(BaseModel):
+    parent_value: Optional[int] = None
+    new_value: int
+    direction: Literal["left", "right"]
 
 
 class TreeValueRequest(BaseModel):
@@ -58,9 +70,83 @@ class TreeSearchResponse(BaseModel):
     node_id: Optional[int] = None
 
 
+class TreeBatchInsert(BaseModel):
+    op: Literal["insert"]
+    parent_value: Optional[int] = None
+    new_value: int
+    direction: str
+
+
+class TreeBatchDelete(BaseModel):
+    op: Literal["delete"]
+    value: int
+
+
+class TreeBatchUpdate(BaseModel):
+    op: Literal["update"]
+    node_id: int
+    new_value: int
+
+
+class TreeBatchSearch(BaseModel):
+    op: Literal["search"]
+    value: int
+
+
+TreeBatchOperation = Annotated[
+    Union[TreeBatchInsert, TreeBatchDelete, TreeBatchUpdate, TreeBatchSearch],
+    Field(discriminator="op"),
+]
+
+
+class TreeBatchRequest(BaseModel):
+    operations: List[TreeBatchOperation] = Field(..., max_length=10000)
+
+
+class TreeBatchResult(BaseModel):
+    op: str
+    ok: bool
+    detail: Optional[str] = None
+    # Search operations only: whether the value was in the tree at that point
+    found: Optional[bool] = None
+
+
+class TreeBatchResponse(BaseModel):
+    tree: TreeResponse
+    results: List[TreeBatchResult]
+
+
+class TreeStatsResponse(BaseModel):
+    # Node values are whatever tree_data holds, not necessarily integers
+    height: int
+    node_count: int
+    leaves: List[Any]
+    min_value: Optional[Any] = None
+    max_value: Optional[Any] = None
+    preorder: List[Any]
+    inorder: List[Any]
+    postorder: List[Any]
+
+
 class ChatRequest(BaseModel):
     message: str
     tree_id: int
 
 class ChatResponse(BaseModel):
-    response: str
\ No newline at end of file
+    response: str
+
+
+class ChatMessageResponse(BaseModel):
+    id: int
+    message: Optional[str] = None
+    response: Optional[str] = None
+    timestamp: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ChatHistoryPage(BaseModel):
+    # Oldest first within the page
+    messages: List[ChatMessageResponse]
+    # Pass as before_id to fetch older messages; None when there are no more
+    next_before_id: Optional[int] = None
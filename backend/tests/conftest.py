@@ -0,0 +1,24 @@
+import os, sys, tempfile
+
+# Run the suite against a throwaway SQLite file unless a database is configured
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+)
+os.environ.setdefault("RUNNING_TESTS", "1")
+# Minimum bcrypt cost keeps the many register/login calls fast
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# The suite sends far more requests from one client than the production limits allow
+for _name in ("RATE_LIMIT", "AUTH_RATE_LIMIT", "CHAT_RATE_LIMIT"):
+    os.environ.setdefault(_name, "100000")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _create_schema():
+    from database import engine
+    from models import Base
+
+    Base.metadata.create_all(bind=engine)
+    yield
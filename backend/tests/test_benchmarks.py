@@ -0,0 +1,23 @@
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from benchmarks.bench_tree_utils import SHAPES, compare, make_report, make_tree, run
+from tree_utils import measure_tree
+
+
+def test_synthetic_shapes():
+    assert measure_tree(make_tree("balanced", 100)) == (100, 7)
+    assert measure_tree(make_tree("skewed", 100)) == (100, 100)
+    count, height = measure_tree(make_tree("random", 100))
+    assert count == 100 and 7 <= height < 100
+
+
+def test_run_and_compare_flags_regressions():
+    results = run(sizes=[10], shapes=SHAPES, repeat=1, min_time=0, log=lambda line: None)
+    ops = {entry["op"] for entry in results}
+    assert {"insert_node", "delete_node", "analyze_tree", "json_dumps", "json_loads"} <= ops
+    assert all("median_s" in entry for entry in results)
+
+    baseline = make_report([dict(entry, median_s=entry["median_s"] / 2) for entry in results])
+    rows = compare(baseline, results, threshold=1.25)
+    assert {row[4] for row in rows} == {"REGRESSION"}
+    assert {row[4] for row in compare(make_report(results), results, 1.25)} == {"ok"}
@@ -0,0 +1,61 @@
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import tree_utils as tu
+from compact_tree import CompactTree
+
+
+def _sample():
+    return {
+        "value": 4,
+        "left": {"value": 2, "left": {"value": 1, "left": None, "right": None},
+                 "right": {"value": 3, "left": None, "right": None}},
+        "right": {"value": 6, "left": None, "right": {"value": 7, "left": None, "right": None}},
+    }
+
+
+def test_round_trip_is_lossless():
+    tree = _sample()
+    assert CompactTree.from_dict(tree).to_dict() == tree
+    assert CompactTree.from_dict(None).to_dict() is None
+
+
+def test_from_dict_lays_nodes_out_in_preorder():
+    compact = CompactTree.from_dict(_sample())
+    assert compact.root == 0
+    assert list(compact.values) == tu.preorder_traversal(_sample())
+
+
+def test_operations_match_tree_utils():
+    tree = _sample()
+    compact = CompactTree.from_dict(tree)
+
+    assert compact.calculate_height() == tu.calculate_height(tree)
+    assert compact.find_leaf_nodes() == tu.find_leaf_nodes(tree)
+    assert compact.inorder_traversal() == tu.inorder_traversal(tree)
+    assert compact.preorder_traversal() == tu.preorder_traversal(tree)
+    assert compact.postorder_traversal() == tu.postorder_traversal(tree)
+    assert compact.search_node(7) and not compact.search_node(5)
+
+    assert compact.insert_node(6, 5, "left") == tu.insert_node(tree, 6, 5, "left")
+    assert compact.insert_node(2, 8, "left") == tu.insert_node(tree, 2, 8, "left")
+    assert compact.to_dict() == tree
+
+    tu.update_node(tree, 3, 30)
+    assert compact.update_node(3, 30) is compact
+    assert compact.update_node(99, 1) is False
+
+    tree = tu.delete_node(tree, 2)
+    compact.delete_node(2)
+    assert compact.to_dict() == tree
+    assert len(compact) == 4
+
+
+def test_deep_chain():
+    tree = {"value": 0, "left": None, "right": None}
+    node = tree
+    for i in range(1, 5000):
+        node["right"] = {"value": i, "left": None, "right": None}
+        node = node["right"]
+    compact = CompactTree.from_dict(tree)
+    assert compact.calculate_height() == 5000
+    assert tu.preorder_traversal(compact.to_dict()) == list(range(5000))
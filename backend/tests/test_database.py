@@ -0,0 +1,37 @@
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from database import to_async_url
+
+
+def test_to_async_url_swaps_driver():
+    assert to_async_url("postgresql://u:p@db:5432/app").drivername == "postgresql+asyncpg"
+    assert to_async_url("postgres://u:p@db/app").drivername == "postgresql+asyncpg"
+    assert to_async_url("postgresql+psycopg2://u@db/app").drivername == "postgresql+asyncpg"
+    assert str(to_async_url("sqlite:////tmp/test.db")) == "sqlite+aiosqlite:////tmp/test.db"
+    # Already-async URLs are left alone
+    assert to_async_url("postgresql+asyncpg://u@db/app").drivername == "postgresql+asyncpg"
+
+
+def test_authenticated_request_uses_one_connection():
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from database import async_engine
+    from main import app
+
+    client = TestClient(app)
+    r = client.post('/auth/register', json={"email": f"pool{os.urandom(4).hex()}@example.com", "password": "TestPass123"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    checkouts = []
+    listener = lambda *args: checkouts.append(1)
+    event.listen(async_engine.sync_engine, "checkout", listener)
+    try:
+        assert client.get('/trees/summary', headers=headers).status_code == 200
+    finally:
+        event.remove(async_engine.sync_engine, "checkout", listener)
+    assert len(checkouts) == 1
+
+    body = client.get('/metrics').text
+    assert 'db_pool_checkout_seconds_count{pool="async"}' in body
+    assert 'db_pool_connections_in_use{pool="async"}' in body
@@ -1,8 +1,9 @@
-import os, sys
+import json, os, sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "venv"))
 from fastapi.testclient import TestClient
 from main import app
+from tree_utils import build_balanced
 
 client = TestClient(app)
 
@@ -35,3 +36,442 @@ def test_register_login_create_tree_and_chat():
     assert r.status_code == 200
     resp = r.json()
     assert 'height' in resp.get('response') or 'Height' in resp.get('response') or resp.get('response')
+
+
+def _auth_headers():
+    r = client.post('/auth/register', json={"email": f"user{os.urandom(4).hex()}@example.com", "password": "TestPass123"})
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def test_mutations_persist_and_bump_revision():
+    headers = _auth_headers()
+    r = client.post('/trees', json={"name": "rev", "sorted_values": [1, 2, 3]}, headers=headers)
+    tree_id = r.json()['id']
+    assert r.json()['revision'] == 1
+
+    r = client.post(f'/trees/{tree_id}/insert', json={"parent_value": 3, "new_value": 4, "direction": "right"}, headers=headers)
+    assert r.json()['revision'] == 2
+    r = client.post(f'/trees/{tree_id}/update', json={"node_id": 1, "new_value": 0}, headers=headers)
+    r = client.post(f'/trees/{tree_id}/delete', json={"value": 3}, headers=headers)
+    assert r.json()['revision'] == 4
+
+    r = client.get(f'/trees/{tree_id}', headers=headers)
+    assert r.json()['tree_data'] == {"value": 2, "left": {"value": 0, "left": None, "right": None}, "right": None}
+    etag = r.headers['etag']
+    assert client.get(f'/trees/{tree_id}', headers={**headers, "If-None-Match": etag}).status_code == 304
+
+
+def test_path_update_statement_targets_only_changed_paths():
+    from sqlalchemy.dialects import postgresql
+    from tree_store import build_patch_statement
+
+    stmt = build_patch_statement(1, 7, [(("left", "right"), {"value": 5, "left": None, "right": None}), (("right",), None)])
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert sql.count("jsonb_set") == 2
+    assert "revision + " in sql and "RETURNING" in sql
+    # Paths are only applied to the revision they were computed against
+    assert "tree_sessions.revision = " in sql.split("WHERE", 1)[1]
+
+
+def test_tree_summary_pages_without_tree_data():
+    headers = _auth_headers()
+    ids = [
+        client.post('/trees', json={"name": f"t{i}", "sorted_values": list(range(i + 1))}, headers=headers).json()['id']
+        for i in range(3)
+    ]
+
+    r = client.get('/trees/summary?limit=2', headers=headers)
+    page = r.json()
+    assert [item['id'] for item in page['items']] == ids[:2]
+    assert page['items'][1] == {"id": ids[1], "name": "t1", "revision": 1, "node_count": 2, "height": 2}
+    assert page['next_after_id'] == ids[1]
+
+    r = client.get(f"/trees/summary?limit=2&after_id={page['next_after_id']}", headers=headers)
+    assert [item['id'] for item in r.json()['items']] == ids[2:]
+    assert r.json()['next_after_id'] is None
+
+    client.post(f'/trees/{ids[0]}/insert', json={"parent_value": 0, "new_value": 5, "direction": "left"}, headers=headers)
+    item = client.get('/trees/summary?limit=1', headers=headers).json()['items'][0]
+    assert (item['node_count'], item['height'], item['revision']) == (2, 2, 2)
+
+    r = client.get('/trees?limit=1', headers=headers)
+    assert len(r.json()) == 1 and r.headers['x-next-after-id'] == str(ids[0])
+
+
+def test_chat_history_pages_backwards():
+    headers = _auth_headers()
+    tree_id = client.post('/trees', json={"name": "chat", "sorted_values": [1, 2, 3]}, headers=headers).json()['id']
+    for i in range(5):
+        client.post('/chat', json={"tree_id": tree_id, "message": f"search {i}"}, headers=headers)
+
+    page = client.get(f'/chat/history/{tree_id}?limit=2', headers=headers).json()
+    assert [m['message'] for m in page['messages']] == ["search 3", "search 4"]
+    assert page['messages'][0]['timestamp']
+
+    seen = [m['message'] for m in page['messages']]
+    while page['next_before_id'] is not None:
+        page = client.get(f"/chat/history/{tree_id}?limit=2&before_id={page['next_before_id']}", headers=headers).json()
+        seen = [m['message'] for m in page['messages']] + seen
+    assert seen == [f"search {i}" for i in range(5)]
+
+
+def test_metrics_use_route_templates_and_stages():
+    headers = _auth_headers()
+    tree_id = client.post('/trees', json={"name": "m", "sorted_values": [1, 2, 3]}, headers=headers).json()['id']
+    client.post(f'/trees/{tree_id}/insert', json={"parent_value": 3, "new_value": 4, "direction": "right"}, headers=headers)
+    client.post('/chat', json={"tree_id": tree_id, "message": "height"}, headers=headers)
+
+    body = client.get('/metrics').text
+    assert f'endpoint="/trees/{tree_id}/insert"' not in body
+    assert 'app_request_latency_seconds_count{endpoint="/trees/{tree_id}/insert"}' in body
+    for stage in ("auth", "db_load", "tree_op", "commit"):
+        assert f'app_request_stage_seconds_count{{route="/trees/{{tree_id}}/insert",stage="{stage}"}}' in body
+    for stage in ("auth", "db_load", "tree_op", "agent", "commit"):
+        assert f'app_request_stage_seconds_count{{route="/chat",stage="{stage}"}}' in body
+
+
+def test_multi_command_chat_commits_once():
+    headers = _auth_headers()
+    tree_id = client.post('/trees', json={"name": "multi", "sorted_values": [1, 2, 3]}, headers=headers).json()['id']
+    r = client.post('/chat', json={"tree_id": tree_id, "message": "insert 4 left of 1 and 5 right of 1"}, headers=headers)
+    assert r.json()['response'].splitlines() == ["Inserted 4 as left child of 1.", "Inserted 5 as right child of 1."]
+
+    tree = client.get(f'/trees/{tree_id}', headers=headers).json()
+    assert tree['revision'] == 2
+    assert tree['tree_data']['left'] == {"value": 1, "left": {"value": 4, "left": None, "right": None},
+                                         "right": {"value": 5, "left": None, "right": None}}
+
+
+def test_tree_stats():
+    headers = _auth_headers()
+    tree_id = client.post('/trees', json={"name": "stats", "sorted_values": [1, 2, 3, 4, 5]}, headers=headers).json()['id']
+
+    r = client.get(f'/trees/{tree_id}/stats', headers=headers)
+    assert r.status_code == 200
+    assert r.json() == {
+        "height": 3, "node_count": 5, "leaves": [2, 5], "min_value": 1, "max_value": 5,
+        "preorder": [3, 1, 2, 4, 5], "inorder": [1, 2, 3, 4, 5], "postorder": [2, 1, 5, 4, 3],
+    }
+
+    # A mutation must not leave the cached stats behind
+    client.post(f'/trees/{tree_id}/delete', json={"value": 4}, headers=headers)
+    stats = client.get(f'/trees/{tree_id}/stats', headers=headers).json()
+    assert (stats['node_count'], stats['max_value'], stats['inorder']) == (3, 3, [1, 2, 3])
+
+
+def test_tree_stats_of_empty_tree():
+    headers = _auth_headers()
+    tree_id = client.post('/trees', json={"name": "empty", "tree_data": None}, headers=headers).json()['id']
+
+    r = client.get(f'/trees/{tree_id}/stats', headers=headers)
+    assert r.status_code == 200
+    assert r.json() == {
+        "height": 0, "node_count": 0, "leaves": [], "min_value": None, "max_value": None,
+        "preorder": [], "inorder": [], "postorder": [],
+    }
+    assert client.get('/trees/999999/stats', headers=headers).status_code == 404
+
+
+def test_batch_applies_operations_in_order_with_one_commit():
+    headers = _auth_headers()
+    tree_id = client.post('/trees', json={"name": "batch", "sorted_values": [1, 2, 3]}, headers=headers).json()['id']
+
+    r = client.post(f'/trees/{tree_id}/batch', json={"operations": [
+        {"op": "insert", "parent_value": 3, "new_value": 4, "direction": "right"},
+        {"op": "search", "value": 4},
+        {"op": "delete", "value": 1},
+        {"op": "search", "value": 1},
+        {"op": "delete", "value": 42},
+        {"op": "update", "node_id": 4, "new_value": 5},
+    ]}, headers=headers)
+    assert r.status_code == 200
+    body = r.json()
+    assert [(result['op'], result['ok'], result['found']) for result in body['results']] == [
+        ("insert", True, None), ("search", True, True), ("delete", True, None),
+        ("search", True, False), ("delete", False, None), ("update", True, None),
+    ]
+    assert body['results'][4]['detail'] == "Node not found"
+    assert body['tree']['revision'] == 2
+    assert body['tree']['tree_data'] == {"value": 2, "left": None, "right": {
+        "value": 3, "left": None, "right": {"value": 5, "left": None, "right": None}}}
+
+    # Persisted exactly as returned
+    stored = client.get(f'/trees/{tree_id}', headers=headers).json()
+    assert stored['tree_data'] == body['tree']['tree_data'] and stored['revision'] == 2
+
+    # A second batch is a second single revision bump
+    r = client.post(f'/trees/{tree_id}/batch', json={"operations": [
+        {"op": "insert", "parent_value": 2, "new_value": 1, "direction": "left"},
+        {"op": "insert", "parent_value": 1, "new_value": 0, "direction": "left"},
+    ]}, headers=headers)
+    assert r.json()['tree']['revision'] == 3
+
+
+def test_batch_without_changes_or_with_invalid_operation_commits_nothing():
+    headers = _auth_headers()
+    tree_id = client.post('/trees', json={"name": "batch", "sorted_values": [1, 2, 3]}, headers=headers).json()['id']
+    original = client.get(f'/trees/{tree_id}', headers=headers).json()
+
+    # A malformed operation rejects the whole batch before anything applies
+    r = client.post(f'/trees/{tree_id}/batch', json={"operations": [
+        {"op": "delete", "value": 1},
+        {"op": "rotate", "value": 2},
+    ]}, headers=headers)
+    assert r.status_code == 422
+    assert client.get(f'/trees/{tree_id}', headers=headers).json() == original
+
+    # Only failed and read-only operations: no commit, no revision bump
+    r = client.post(f'/trees/{tree_id}/batch', json={"operations": [
+        {"op": "delete", "value": 42},
+        {"op": "insert", "parent_value": 42, "new_value": 5, "direction": "left"},
+        {"op": "insert", "parent_value": 1, "new_value": 5, "direction": "up"},
+        {"op": "search", "value": 2},
+    ]}, headers=headers)
+    assert r.status_code == 200
+    assert [result['ok'] for result in r.json()['results']] == [False, False, False, True]
+    assert client.get(f'/trees/{tree_id}', headers=headers).json() == original
+
+
+def _ndjson(values):
+    return "".join(json.dumps(value) + "\n" for value in values).encode()
+
+
+def test_import_level_order_and_sorted_ndjson():
+    headers = _auth_headers()
+
+    r = client.post('/trees/import?name=lo&format=level_order',
+                    content=_ndjson([1, 2, 3, None, 4]) + b"\n  \n", headers=headers)
+    assert r.status_code == 200
+    assert r.json()['name'] == "lo"
+    assert r.json()['tree_data'] == {
+        "value": 1,
+        "left": {"value": 2, "left": None, "right": {"value": 4, "left": None, "right": None}},
+        "right": {"value": 3, "left": None, "right": None},
+    }
+
+    # Last line without a trailing newline still counts
+    r = client.post('/trees/import?name=sorted&format=sorted',
+                    content=_ndjson(range(1, 7)) + b"7", headers=headers)
+    assert r.status_code == 200
+    tree_id = r.json()['id']
+    stats = client.get(f'/trees/{tree_id}/stats', headers=headers).json()
+    assert stats['inorder'] == list(range(1, 8)) and stats['height'] == 3
+
+    item = client.get(f'/trees/summary?after_id={tree_id - 1}&limit=1', headers=headers).json()['items'][0]
+    assert (item['node_count'], item['height']) == (7, 3)
+
+
+def test_import_rejects_bad_input():
+    headers = _auth_headers()
+    before = client.get('/trees/summary', headers=headers).json()['items']
+
+    for query, body in [
+        ("format=sorted", _ndjson([1, 3, 2])),              # not ascending
+        ("format=sorted", b"1\n{oops\n3\n"),                # malformed line
+        ("format=level_order", b"1\n2\n[3]\n"),             # not an integer
+        ("format=level_order", _ndjson([1, None, None, 4])),  # child without a parent
+    ]:
+        r = client.post(f'/trees/import?name=bad&{query}', content=body, headers=headers)
+        assert r.status_code == 400, (query, body)
+        assert r.json()['detail']
+
+    assert client.get('/trees/summary', headers=headers).json()['items'] == before
+
+
+def test_traversal_streams_match_the_plain_response(monkeypatch):
+    import main
+    # Small chunks so the framing across chunk boundaries is exercised
+    monkeypatch.setattr(main, "TRAVERSAL_STREAM_CHUNK", 3)
+    headers = _auth_headers()
+    tree_id = client.post('/trees', json={"name": "stream", "sorted_values": list(range(10))}, headers=headers).json()['id']
+
+    for order in ("inorder", "preorder", "postorder"):
+        expected = client.get(f'/trees/{tree_id}/traversal?type={order}', headers=headers).json()
+        assert expected['type'] == order and sorted(expected['order']) == list(range(10))
+
+        with client.stream('GET', f'/trees/{tree_id}/traversal?type={order}&stream=ndjson', headers=headers) as r:
+            assert r.headers['content-type'] == "application/x-ndjson"
+            chunks = list(r.iter_text())
+        body = "".join(chunks)
+        assert body.endswith("\n") and body.count("\n") == 10
+        assert [json.loads(line) for line in body.splitlines()] == expected['order']
+
+        with client.stream('GET', f'/trees/{tree_id}/traversal?type={order}&stream=json', headers=headers) as r:
+            assert r.headers['content-type'] == "application/json"
+            body = "".join(r.iter_text())
+        assert json.loads(body) == expected
+
+    empty_id = client.post('/trees', json={"name": "empty", "tree_data": None}, headers=headers).json()['id']
+    assert client.get(f'/trees/{empty_id}/traversal?stream=ndjson', headers=headers).status_code == 404
+    assert client.get(f'/trees/{tree_id}/traversal?stream=xml', headers=headers).status_code == 422
+
+
+def test_tree_list_etag():
+    headers = _auth_headers()
+    tree_id = client.post('/trees', json={"name": "a", "sorted_values": [1, 2, 3]}, headers=headers).json()['id']
+
+    r = client.get('/trees', headers=headers)
+    etag = r.headers['etag']
+    assert r.status_code == 200 and [tree['id'] for tree in r.json()] == [tree_id]
+
+    r = client.get('/trees', headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 304 and r.headers['etag'] == etag and not r.content
+    assert client.get('/trees', headers={**headers, "If-None-Match": f'"other", W/{etag}'}).status_code == 304
+
+    # A mutation changes the list ETag
+    client.post(f'/trees/{tree_id}/insert', json={"parent_value": 3, "new_value": 4, "direction": "right"}, headers=headers)
+    r = client.get('/trees', headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200 and r.headers['etag'] != etag
+    mutated_etag = r.headers['etag']
+
+    # So does a new tree
+    client.post('/trees', json={"name": "b", "tree_data": None}, headers=headers)
+    r = client.get('/trees', headers={**headers, "If-None-Match": mutated_etag})
+    assert r.status_code == 200 and len(r.json()) == 2
+    assert r.headers['etag'] not in (etag, mutated_etag)
+
+    # Another user's list is unaffected by this user's trees
+    other = client.get('/trees', headers=_auth_headers())
+    assert other.json() == [] and other.headers['etag'] != r.headers['etag']
+
+
+def test_index_is_recached_only_when_no_other_writer_committed(monkeypatch):
+    import main
+    from sqlalchemy import update
+    from models import TreeSession
+    from tree_cache import tree_cache
+
+    headers = _auth_headers()
+    tree_id = client.post('/trees', json={"name": "race", "sorted_values": [1, 2, 3]}, headers=headers).json()['id']
+
+    r = client.post(f'/trees/{tree_id}/insert', json={"parent_value": 3, "new_value": 4, "direction": "right"}, headers=headers)
+    assert r.json()['revision'] == 2
+    assert tree_cache.get(tree_id, 2, "index") is not None
+
+    real_save = main.save_tree_data
+
+    async def save_after_another_writer(db, tree, *args):
+        # Another writer commits between this request's load and its save
+        await db.execute(update(TreeSession).where(TreeSession.id == tree.id)
+                         .values(revision=TreeSession.revision + 1))
+        return await real_save(db, tree, *args)
+
+    monkeypatch.setattr(main, "save_tree_data", save_after_another_writer)
+    r = client.post(f'/trees/{tree_id}/delete', json={"value": 4}, headers=headers)
+    assert r.json()['revision'] == 4
+    assert tree_cache.get(tree_id, 4, "index") is None
+    monkeypatch.undo()
+
+    # The next request rebuilds the index from the stored tree
+    r = client.post(f'/trees/{tree_id}/search', json={"value": 4}, headers=headers)
+    assert r.json()['found'] is False
+    assert tree_cache.get(tree_id, 4, "index") is not None
+
+
+def test_tree_work_runs_off_the_event_loop(monkeypatch):
+    import threading
+    import main
+    import tree_store
+    from tree_cache import tree_cache
+
+    threads = {}
+
+    def record(name, fn):
+        def wrapper(*args, **kwargs):
+            threads.setdefault(name, set()).add(threading.current_thread().name)
+            return fn(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(main, "build_balanced", record("build", main.build_balanced))
+    monkeypatch.setattr(main, "measure_tree", record("measure", main.measure_tree))
+    monkeypatch.setattr(tree_store, "measure_tree", record("measure", tree_store.measure_tree))
+    monkeypatch.setattr(tree_cache, "take_index", record("index", tree_cache.take_index))
+    monkeypatch.setattr(tree_cache, "get_stats", record("stats", tree_cache.get_stats))
+    monkeypatch.setattr(main, "_render", record("render", main._render))
+
+    headers = _auth_headers()
+    tree_id = client.post('/trees', json={"name": "offload", "sorted_values": [1, 2, 3]}, headers=headers).json()['id']
+    client.post(f'/trees/{tree_id}/insert', json={"parent_value": 3, "new_value": 4, "direction": "right"}, headers=headers)
+    client.put(f'/trees/{tree_id}', json={"name": "offload", "sorted_values": [1, 2]}, headers=headers)
+    assert client.get(f'/trees/{tree_id}/stats', headers=headers).json()['node_count'] == 2
+    assert client.get(f'/trees/{tree_id}', headers=headers).json()['tree_data']['value'] == 1
+
+    assert set(threads) == {"build", "measure", "index", "stats", "render"}
+    loop_threads = {name for name in set().union(*threads.values()) if not name.startswith("AnyIO worker")}
+    assert not loop_threads, threads
+
+
+def test_index_is_shared_again_only_after_the_response_is_rendered(monkeypatch):
+    import main
+    from tree_cache import tree_cache
+
+    headers = _auth_headers()
+    tree_id = client.post('/trees', json={"name": "render", "sorted_values": [1, 2, 3]}, headers=headers).json()['id']
+    cached_while_rendering = []
+    real_render = main._render
+
+    def render(model, value):
+        tree = value["tree"] if isinstance(value, dict) else value
+        cached_while_rendering.append(tree_cache.get(tree_id, tree.revision, "index") is not None)
+        return real_render(model, value)
+
+    monkeypatch.setattr(main, "_render", render)
+    client.post(f'/trees/{tree_id}/insert', json={"parent_value": 3, "new_value": 4, "direction": "right"}, headers=headers)
+    client.post(f'/trees/{tree_id}/update', json={"node_id": 4, "new_value": 5}, headers=headers)
+    client.post(f'/trees/{tree_id}/delete', json={"value": 5}, headers=headers)
+    client.post(f'/trees/{tree_id}/batch', json={"operations": [{"op": "search", "value": 1}]}, headers=headers)
+    r = client.post(f'/trees/{tree_id}/batch', json={"operations": [{"op": "delete", "value": 1}]}, headers=headers)
+
+    assert r.json()['tree']['revision'] == 5
+    assert cached_while_rendering == [False] * 5
+    # ...and it is handed back afterwards
+    assert tree_cache.get(tree_id, 5, "index") is not None
+
+
+def test_traversal_and_stats_of_mixed_value_tree():
+    headers = _auth_headers()
+    tree_data = {"value": 1, "left": {"value": "a", "left": None, "right": None}, "right": None}
+    tree_id = client.post('/trees', json={"name": "mixed", "tree_data": tree_data}, headers=headers).json()['id']
+
+    r = client.get(f'/trees/{tree_id}/traversal?type=preorder', headers=headers)
+    assert r.status_code == 200 and r.json() == {"type": "preorder", "order": [1, "a"]}
+
+    r = client.get(f'/trees/{tree_id}/stats', headers=headers)
+    assert r.status_code == 200
+    stats = r.json()
+    assert stats['leaves'] == ["a"] and stats['inorder'] == ["a", 1]
+    assert stats['min_value'] is None and stats['max_value'] is None
+
+
+def test_single_operations_that_change_nothing_do_not_commit():
+    headers = _auth_headers()
+    tree_id = client.post('/trees', json={"name": "noop", "sorted_values": [1, 2, 3]}, headers=headers).json()['id']
+
+    r = client.post(f'/trees/{tree_id}/delete', json={"value": 42}, headers=headers)
+    assert r.status_code == 400 and r.json()['detail'] == "Node not found"
+    r = client.post(f'/trees/{tree_id}/insert', json={"parent_value": 1, "new_value": 5, "direction": "up"}, headers=headers)
+    assert r.status_code == 422
+
+    r = client.get(f'/trees/{tree_id}', headers=headers)
+    assert r.json()['revision'] == 1 and r.json()['tree_data'] == build_balanced([1, 2, 3])
+
+
+def test_chain_shaped_trees_round_trip():
+    headers = _auth_headers()
+    depth = 600
+    chain = None
+    for value in range(depth, 0, -1):
+        chain = {"value": value, "left": None, "right": chain}
+    r = client.post('/trees', json={"name": "chain", "tree_data": chain}, headers=headers)
+    assert r.status_code == 200
+    tree_id = r.json()['id']
+
+    r = client.post(f'/trees/{tree_id}/insert', json={"parent_value": depth, "new_value": depth + 1, "direction": "left"}, headers=headers)
+    assert r.status_code == 200 and r.json()['revision'] == 2
+
+    tree = client.get(f'/trees/{tree_id}', headers=headers).json()['tree_data']
+    for _ in range(depth - 1):
+        tree = tree['right']
+    assert tree == {"value": depth, "left": {"value": depth + 1, "left": None, "right": None}, "right": None}
+    assert client.get('/trees', headers=headers).json()[0]['tree_data']['value'] == 1
+    assert client.get(f'/trees/{tree_id}/stats', headers=headers).json()['height'] == depth + 1
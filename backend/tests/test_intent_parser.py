@@ -0,0 +1,43 @@
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from intent_parser import Command, INSERT_HELP, parse
+from ai_agent import handle_rules
+from tree_utils import build_balanced, preorder_traversal
+
+
+def test_clauses_inherit_verb_and_parent():
+    assert parse("insert 3 left of 1 and 4 right of 1") == [
+        Command("insert", value=3, parent=1, side="left"),
+        Command("insert", value=4, parent=1, side="right"),
+    ]
+    assert parse("insert 3 left of 1 and 4 right") == parse("insert 3 left of 1 and 4 right of 1")
+    assert parse("delete 4, 5 then search 7") == [
+        Command("delete", value=4), Command("delete", value=5), Command("search", value=7),
+    ]
+    assert parse("change 5 to 10 and 6 to 12") == [
+        Command("update", value=5, new_value=10), Command("update", value=6, new_value=12),
+    ]
+
+
+def test_keyword_order_does_not_matter():
+    assert parse("find the height") == [Command("height")]
+    assert parse("under 2 insert 7 on the left") == [Command("insert", value=7, parent=2, side="left")]
+    assert parse("remove leaf 5") == [Command("delete", value=5)]
+    assert parse("show inorder and preorder traversal") == [Command("inorder"), Command("preorder")]
+    assert parse("insert 9") == [Command("insert", error=INSERT_HELP)]
+    assert parse("hello there") == []
+
+
+def test_agent_runs_commands_as_one_batch():
+    tree = build_balanced([1, 2, 3])
+    text, modified, new_tree = handle_rules(
+        tree, "insert 4 left of 1 and 5 right of 1, then delete 3 and what is the height"
+    )
+    assert modified
+    assert preorder_traversal(new_tree) == [2, 1, 4, 5]
+    assert text.splitlines() == [
+        "Inserted 4 as left child of 1.",
+        "Inserted 5 as right child of 1.",
+        "Deleted node 3.",
+        "The height of the tree is 3.",
+    ]
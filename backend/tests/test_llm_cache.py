@@ -0,0 +1,140 @@
+import asyncio, os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import ai_agent
+from llm_cache import LLMResponseCache, cache_key_for, tree_fingerprint
+from ai_agent_adapter import INVALID_TREE_RESPONSE
+from tree_utils import build_balanced
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_key_normalizes_message_and_tracks_tree_content():
+    tree = build_balanced([1, 2, 3])
+    key = cache_key_for(tree, "What is the height?", "m")
+    assert key == cache_key_for(build_balanced([1, 2, 3]), "  what IS the   height ", "m")
+    assert key != cache_key_for(build_balanced([1, 2, 4]), "what is the height", "m")
+    assert key != cache_key_for(tree, "what is the height", "other-model")
+    assert cache_key_for(tree, "insert 4 left of 1", "m") is None
+
+    chain = current = {"value": 0, "left": None, "right": None}
+    for value in range(1, 5000):
+        current["right"] = current = {"value": value, "left": None, "right": None}
+    assert len(tree_fingerprint(chain)) == 32
+
+
+def test_lru_ttl_and_disk_tier(tmp_path):
+    clock = Clock()
+    cache = LLMResponseCache(ttl=60, max_entries=2, directory=str(tmp_path), clock=clock)
+    cache.put("a", "answer a")
+    cache.put("b", "answer b")
+    assert cache.get("a") == "answer a"
+    cache.put("c", "answer c")  # evicts "b" from memory, the least recently used
+    assert len(cache) == 2
+
+    # A fresh process still finds "b" on disk
+    restarted = LLMResponseCache(ttl=60, max_entries=2, directory=str(tmp_path), clock=clock)
+    assert restarted.get("b") == "answer b"
+
+    clock.now += 61
+    assert cache.get("a") is None and restarted.get("c") is None
+
+
+def test_agent_serves_repeat_questions_from_cache(monkeypatch):
+    calls = []
+
+    async def fake_llm(tree, message):
+        calls.append(message)
+        if "insert" in message:
+            return "Inserted.", True, tree
+        return f"answer {len(calls)}", False, tree
+
+    monkeypatch.setattr(ai_agent, "USE_LLM", True)
+    monkeypatch.setattr(ai_agent, "_llm_adapter", fake_llm)
+    monkeypatch.setattr(ai_agent, "llm_cache", LLMResponseCache(ttl=60, max_entries=10))
+
+    tree = build_balanced([10, 20, 30])
+
+    def ask(message):
+        return asyncio.run(ai_agent.handle_message(tree, message))[0]
+
+    assert ask("what is the height") == "answer 1"
+    assert ask("What is the height?") == "answer 1"
+    ask("insert 5 left of 10")
+    ask("insert 5 left of 10")
+    assert calls == ["what is the height", "insert 5 left of 10", "insert 5 left of 10"]
+
+
+def test_agent_does_not_cache_a_failed_edit(monkeypatch):
+    calls = []
+
+    async def fake_llm(tree, message):
+        calls.append(message)
+        return INVALID_TREE_RESPONSE, False, tree
+
+    monkeypatch.setattr(ai_agent, "USE_LLM", True)
+    monkeypatch.setattr(ai_agent, "_llm_adapter", fake_llm)
+    monkeypatch.setattr(ai_agent, "_invalid_tree_response", INVALID_TREE_RESPONSE)
+    monkeypatch.setattr(ai_agent, "llm_cache", LLMResponseCache(ttl=60, max_entries=10))
+
+    tree = build_balanced([1, 2, 3])
+    for _ in range(2):
+        assert asyncio.run(ai_agent.handle_message(tree, "insert 4 right of 3")) == (INVALID_TREE_RESPONSE, False, tree)
+    assert len(calls) == 2
+
+
+def test_agent_tree_work_runs_off_the_event_loop(monkeypatch):
+    import threading
+
+    threads = []
+
+    def record(fn):
+        def wrapper(*args, **kwargs):
+            threads.append((fn.__name__, threading.current_thread() is threading.main_thread()))
+            return fn(*args, **kwargs)
+        return wrapper
+
+    async def unavailable(tree, message):
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(ai_agent, "USE_LLM", True)
+    monkeypatch.setattr(ai_agent, "_llm_adapter", unavailable)
+    monkeypatch.setattr(ai_agent, "cache_key_for", record(ai_agent.cache_key_for))
+    monkeypatch.setattr(ai_agent, "handle_rules", record(ai_agent.handle_rules))
+
+    text, modified, _ = asyncio.run(ai_agent.handle_message(build_balanced([1, 2, 3]), "what is the height"))
+    assert text == "The height of the tree is 2." and not modified
+    assert threads == [("cache_key_for", False), ("handle_rules", False)]
+
+
+def test_agent_uses_the_disk_tier_off_the_event_loop(monkeypatch, tmp_path):
+    import threading
+
+    cache = LLMResponseCache(ttl=60, max_entries=10, directory=str(tmp_path))
+    calls = []
+
+    def record(name, fn):
+        def wrapper(*args):
+            calls.append((name, threading.current_thread() is threading.main_thread()))
+            return fn(*args)
+        return wrapper
+
+    monkeypatch.setattr(cache._disk, "get", record("get", cache._disk.get))
+    monkeypatch.setattr(cache._disk, "put", record("put", cache._disk.put))
+
+    async def fake_llm(tree, message):
+        return "answer", False, tree
+
+    monkeypatch.setattr(ai_agent, "USE_LLM", True)
+    monkeypatch.setattr(ai_agent, "_llm_adapter", fake_llm)
+    monkeypatch.setattr(ai_agent, "llm_cache", cache)
+
+    tree = build_balanced([1, 2, 3])
+    assert asyncio.run(ai_agent.handle_message(tree, "what is the height"))[0] == "answer"
+    assert calls == [("get", False), ("put", False)]
+    assert not LLMResponseCache(ttl=60).persistent and cache.persistent
@@ -0,0 +1,197 @@
+import asyncio, json, os, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pytest
+from ai_agent_adapter import INVALID_TREE_RESPONSE, CircuitBreaker, LLMClient, LLMUnavailable, llm_handle_message
+from tree_utils import build_balanced
+
+
+class FakeOpenAI(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible /chat/completions endpoint."""
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.hits += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.delay)
+            if server.status != 200:
+                self.send_response(server.status)
+                self.end_headers()
+                return
+            server.prompts.append(body["messages"][-1]["content"])
+            content = server.reply or json.dumps({"response": f"echo: {body['messages'][-1]['content'][-20:]}",
+                                                  "modified": False, "tree": None})
+            payload = json.dumps({"choices": [{"message": {"role": "assistant", "content": content}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAI)
+    server.lock = threading.Lock()
+    server.hits = server.in_flight = server.max_in_flight = 0
+    server.delay, server.status = 0.0, 200
+    server.reply, server.prompts = None, []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def _client(server, **kwargs):
+    return LLMClient(base_url=f"http://127.0.0.1:{server.server_port}/v1", api_key="test", **kwargs)
+
+
+def test_handles_message_and_limits_concurrency(fake_server):
+    fake_server.delay = 0.05
+    client = _client(fake_server, max_concurrency=2)
+
+    async def go():
+        try:
+            return await asyncio.gather(*(llm_handle_message({"value": 1, "left": None, "right": None},
+                                                             f"q{i}", client=client) for i in range(6)))
+        finally:
+            await client.aclose()
+
+    results = asyncio.run(go())
+    assert all(text.startswith("echo:") and modified is False for text, modified, _ in results)
+    assert fake_server.hits == 6 and fake_server.max_in_flight == 2
+
+
+def test_timeout_fails_fast(fake_server):
+    fake_server.delay = 1.0
+    client = _client(fake_server, timeout=0.1)
+
+    async def go():
+        try:
+            await client.complete([{"role": "user", "content": "hi"}])
+        finally:
+            await client.aclose()
+
+    start = time.perf_counter()
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(go())
+    assert time.perf_counter() - start < 0.8
+
+
+def test_circuit_opens_then_recovers(fake_server):
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=lambda: now[0])
+    client = _client(fake_server, breaker=breaker)
+    fake_server.status = 500
+
+    async def call():
+        return await client.complete([{"role": "user", "content": "hi"}])
+
+    async def go():
+        outcomes = []
+        for step in range(4):
+            if step == 3:
+                # Provider is healthy again once the reset timeout has passed
+                now[0] += 31
+                fake_server.status = 200
+            try:
+                await call()
+                outcomes.append("ok")
+            except LLMUnavailable:
+                outcomes.append("unavailable")
+        await client.aclose()
+        return outcomes
+
+    outcomes = asyncio.run(go())
+    # Two failures open the circuit; the third call never reaches the server
+    assert outcomes == ["unavailable", "unavailable", "unavailable", "ok"]
+    assert fake_server.hits == 3
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_reopens_circuit():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    now[0] = 11
+    assert breaker.allow() and not breaker.allow()  # one trial at a time
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_cancelled_trial_frees_the_slot_without_a_failure(fake_server):
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    now[0] = 11
+    fake_server.delay = 0.5
+    client = _client(fake_server, breaker=breaker)
+
+    async def go():
+        trial = asyncio.create_task(client.complete([{"role": "user", "content": "hi"}]))
+        await asyncio.sleep(0.1)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        await client.aclose()
+
+    asyncio.run(go())
+    assert breaker.failures == 1 and breaker.state == "half_open"
+    assert breaker.allow()  # the next request gets the trial
+
+
+@pytest.mark.parametrize("tree", [None, 7, {"value": 4}, "2(1,3"])
+def test_edit_without_a_readable_tree_changes_nothing(fake_server, tree):
+    original = build_balanced([1, 2, 3])
+    reply = {"response": "Inserted.", "modified": True, "tree": tree}
+    if tree is None:
+        del reply["tree"]
+    fake_server.reply = json.dumps(reply)
+    client = _client(fake_server)
+
+    async def go():
+        try:
+            return await llm_handle_message(original, "insert 4 right of 3", client=client)
+        finally:
+            await client.aclose()
+
+    text, modified, new_tree = asyncio.run(go())
+    assert (text, modified) == (INVALID_TREE_RESPONSE, False)
+    assert new_tree is original and original == build_balanced([1, 2, 3])
+
+
+def test_compact_prompt_and_edits(fake_server):
+    small = build_balanced([1, 2, 3])
+    big = build_balanced(range(1, 100001))
+    fake_server.reply = json.dumps({"response": "Inserted.", "modified": True, "tree": "2(1,3(,4))"})
+    client = _client(fake_server)
+
+    async def go():
+        try:
+            edited = await llm_handle_message(small, "insert 4 right of 3", client=client)
+            with pytest.raises(LLMUnavailable):
+                # Edit requests on a summarized tree never reach the model
+                await llm_handle_message(big, "insert 0 left of 1", client=client)
+            with pytest.raises(LLMUnavailable):
+                # ...and edits it makes anyway are refused
+                await llm_handle_message(big, "what is under 7", client=client)
+            return edited
+        finally:
+            await client.aclose()
+
+    text, modified, tree = asyncio.run(go())
+    assert modified and tree == build_balanced([1, 2, 3, 4])
+    assert "\n2(1,3)\n" in fake_server.prompts[0]
+    assert len(fake_server.prompts) == 2
+    assert "[n=" in fake_server.prompts[1] and len(fake_server.prompts[1]) < 10000
@@ -0,0 +1,27 @@
+import asyncio, os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import httpx
+from benchmarks.load_test import parse_mix, percentile, run_load
+from main import app
+
+
+def test_percentile_and_mix_parsing():
+    values = list(range(1, 101))
+    assert percentile(values, 0.5) == 50 and percentile(values, 0.99) == 99
+    assert percentile([], 0.5) is None
+    assert parse_mix("tree=1,chat=0") == {"tree": 1.0, "chat": 0.0}
+
+
+def test_run_load_in_process():
+    async def go():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await run_load(client, users=2, duration=0.5, tree_size=15,
+                                  mix={"tree": 3, "chat": 1, "auth": 1})
+
+    report = asyncio.run(go())
+    assert report["config"]["active_users"] == 2
+    load = report["load"]
+    assert load["requests"] > 0 and load["errors"] == 0
+    assert set(load["ops"]) <= {"tree_get", "tree_insert", "tree_search", "tree_stats", "chat", "auth_login"}
+    assert all(row["p50_ms"] <= row["p99_ms"] <= row["max_ms"] for row in load["ops"].values())
@@ -0,0 +1,62 @@
+import asyncio, os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from passlib.context import CryptContext
+from passwords import PasswordHasher, PasswordHasherBusy, BCRYPT_ROUNDS
+
+
+def _hash_with_other_cost(password):
+    return CryptContext(schemes=["bcrypt"], bcrypt__rounds=BCRYPT_ROUNDS + 1).hash(password)
+
+
+def test_process_pool_hashes_and_flags_outdated_cost():
+    hasher = PasswordHasher(workers=1, max_pending=4)
+
+    async def run():
+        hashed = await hasher.hash("secret")
+        current = await hasher.verify_and_update("secret", hashed)
+        outdated = await hasher.verify_and_update("secret", _hash_with_other_cost("secret"))
+        wrong = await hasher.verify_and_update("nope", hashed)
+        return current, outdated, wrong
+
+    try:
+        current, outdated, wrong = asyncio.run(run())
+    finally:
+        hasher.shutdown()
+    assert current == (True, None)
+    assert outdated[0] is True and outdated[1].startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+    assert wrong == (False, None)
+    assert hasher.pending == 0
+
+
+def test_saturated_hasher_rejects_immediately():
+    hasher = PasswordHasher(workers=0, max_pending=1)
+
+    async def run():
+        return await asyncio.gather(hasher.hash("a"), hasher.hash("b"), return_exceptions=True)
+
+    first, second = asyncio.run(run())
+    assert isinstance(first, str) and isinstance(second, PasswordHasherBusy)
+    assert hasher.pending == 0
+
+
+def test_login_rehashes_and_returns_503_when_busy(monkeypatch):
+    from fastapi.testclient import TestClient
+    from database import SessionLocal
+    from main import app
+    from models import User
+    from passwords import password_hasher
+
+    client = TestClient(app)
+    email = f"pw{os.urandom(4).hex()}@example.com"
+    user_id = client.post('/auth/register', json={"email": email, "password": "TestPass123"}).json()['user_id']
+    with SessionLocal() as db:
+        db.get(User, user_id).hashed_password = _hash_with_other_cost("TestPass123")
+        db.commit()
+
+    assert client.post('/auth/login', json={"email": email, "password": "TestPass123"}).status_code == 200
+    with SessionLocal() as db:
+        assert db.get(User, user_id).hashed_password.startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+
+    monkeypatch.setattr(password_hasher, "max_pending", 0)
+    r = client.post('/auth/login', json={"email": email, "password": "TestPass123"})
+    assert r.status_code == 503 and r.headers["retry-after"] == "1"
@@ -0,0 +1,64 @@
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from principal_cache import Principal, PrincipalCache
+
+
+def test_entries_expire_with_token_and_ttl():
+    cache = PrincipalCache(ttl=60, max_entries=10)
+    alice = Principal(id=1, email="a@example.com")
+
+    cache.put("t1", alice, exp=1030, now=1000)
+    assert cache.get("t1", now=1029) == alice
+    assert cache.get("t1", now=1030) is None  # token expired
+
+    cache.put("t2", alice, exp=5000, now=1000)
+    assert cache.get("t2", now=1059) == alice
+    assert cache.get("t2", now=1060) is None  # TTL elapsed first
+    assert len(cache) == 0
+
+
+def test_lru_eviction_and_user_invalidation():
+    cache = PrincipalCache(ttl=60, max_entries=2)
+    alice, bob = Principal(1, "a@example.com"), Principal(2, "b@example.com")
+    cache.put("a1", alice, exp=2000, now=1000)
+    cache.put("b1", bob, exp=2000, now=1000)
+    cache.get("a1", now=1001)
+    cache.put("a2", alice, exp=2000, now=1001)
+    assert cache.get("b1", now=1002) is None
+
+    cache.invalidate_user(1)
+    assert cache.get("a1", now=1002) is None and cache.get("a2", now=1002) is None
+    assert len(cache) == 0
+
+
+def test_cached_token_skips_user_query_until_account_changes():
+    from fastapi.testclient import TestClient
+    from jose import jwt
+    from sqlalchemy import event
+    from auth import SECRET_KEY, ALGORITHM
+    from database import SessionLocal, async_engine
+    from main import app
+    from models import User
+
+    client = TestClient(app)
+    r = client.post('/auth/register', json={"email": f"pc{os.urandom(4).hex()}@example.com", "password": "TestPass123"})
+    token = r.json()['access_token']
+    user_id = r.json()['user_id']
+    assert jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])['uid'] == user_id
+    headers = {"Authorization": f"Bearer {token}"}
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        client.get('/auth/me', headers=headers)
+        statements.clear()
+        assert client.get('/auth/me', headers=headers).json()['id'] == user_id
+        assert statements == []
+
+        with SessionLocal() as db:
+            db.get(User, user_id).email = f"changed-{user_id}@example.com"
+            db.commit()
+        assert client.get('/auth/me', headers=headers).status_code == 401
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", listener)
@@ -0,0 +1,78 @@
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from fastapi.testclient import TestClient
+import auth
+from main import app
+from profiling import RequestProfiler, to_collapsed
+
+client = TestClient(app)
+
+
+def _spin(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_forced_capture_produces_speedscope_profile():
+    profiler = RequestProfiler(slow_ms=0, interval_ms=1)
+    capture = profiler.begin("POST", "/chat", force_reason="header")
+    _spin(0.1)
+    profile_id = profiler.end(capture, "/chat")
+
+    profile = profiler.get(profile_id)
+    assert profile["reason"] == "header" and profile["samples"] > 0
+    document = profile["speedscope"]
+    assert document["profiles"][0]["type"] == "sampled"
+    frame_names = {frame["name"] for frame in document["shared"]["frames"]}
+    assert "_spin" in frame_names
+    assert "_spin" in to_collapsed(document)
+    assert [entry["id"] for entry in profiler.list()] == [profile_id]
+
+
+def test_only_slow_requests_are_captured():
+    assert RequestProfiler(slow_ms=0).begin("GET", "/trees") is None
+
+    profiler = RequestProfiler(slow_ms=50, interval_ms=1)
+    fast = profiler.begin("GET", "/trees")
+    assert profiler.end(fast) is None
+
+    slow = profiler.begin("POST", "/trees/1/insert")
+    _spin(0.15)
+    profile_id = profiler.end(slow, "/trees/{tree_id}/insert")
+    assert profiler.get(profile_id)["reason"] == "slow"
+    assert profiler.list()[0]["route"] == "/trees/{tree_id}/insert"
+
+
+def test_profile_header_and_endpoints_are_admin_only(monkeypatch):
+    r = client.post('/auth/register', json={"email": f"admin{os.urandom(4).hex()}@example.com", "password": "TestPass123"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    r = client.get('/trees', headers={**headers, "X-Profile": "1"})
+    assert "X-Profile-Id" not in r.headers
+    assert client.get('/admin/profiles', headers=headers).status_code == 403
+
+    email = client.get('/auth/me', headers=headers).json()['email']
+    monkeypatch.setattr(auth, "ADMIN_EMAILS", frozenset({email}))
+
+    r = client.get('/trees', headers={**headers, "X-Profile": "1"})
+    profile_id = r.headers.get("X-Profile-Id")
+    # Very fast requests can finish before the first sample
+    if profile_id is not None:
+        r = client.get(f'/admin/profiles/{profile_id}', headers=headers)
+        assert r.status_code == 200 and r.json()["$schema"].startswith("https://www.speedscope.app")
+    assert client.get('/admin/profiles', headers=headers).status_code == 200
+    assert client.get('/admin/profiles/999999', headers=headers).status_code == 404
+
+
+def test_sampler_leaves_ended_captures_alone():
+    profiler = RequestProfiler(slow_ms=0, interval_ms=1)
+    capture = profiler.begin("GET", "/trees", force_reason="header")
+    _spin(0.05)
+    profile_id = profiler.end(capture)
+    samples, stacks = capture.samples, {name: dict(counts) for name, counts in capture.stacks.items()}
+
+    # A sample that was already in flight when end() detached the capture
+    profiler._sample([capture], own_id=None)
+    assert capture.samples == samples == profiler.get(profile_id)["samples"]
+    assert {name: dict(counts) for name, counts in capture.stacks.items()} == stacks
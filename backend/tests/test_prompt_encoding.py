@@ -0,0 +1,60 @@
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pytest
+from prompt_encoding import CHARS_PER_TOKEN, decode_compact, encode_compact, encode_for_prompt, focus_values
+from tree_utils import build_balanced, build_from_level_order
+
+
+def _chain(length):
+    tree = None
+    for value in range(length, 0, -1):
+        tree = {"value": value, "left": None, "right": tree}
+    return tree
+
+
+def test_compact_form_round_trips():
+    tree = build_from_level_order([1, 2, 3, None, None, None, -4])
+    assert encode_compact(tree) == "1(2,3(,-4))"
+    assert decode_compact(encode_compact(tree)) == tree
+    assert encode_compact(None) == "" and decode_compact(" ") is None
+
+    # Iterative both ways (dict == would recurse, so compare encodings)
+    text = encode_compact(_chain(20000))
+    assert encode_compact(decode_compact(text)) == text
+
+
+@pytest.mark.parametrize("text", ["1(2)", "1(2,3", "1(2,3))", "(1,2)", "1 2", "1(a,)"])
+def test_decode_rejects_malformed_input(text):
+    with pytest.raises(ValueError):
+        decode_compact(text)
+
+
+def test_small_tree_is_sent_whole():
+    tree = build_balanced(range(1, 16))
+    text, summarized = encode_for_prompt(tree, "height?", token_budget=100)
+    assert not summarized and decode_compact(text) == tree
+
+
+def test_budget_summarizes_and_keeps_the_mentioned_region():
+    tree = build_balanced(range(1, 100001))
+    budget = 500
+
+    text, summarized = encode_for_prompt(tree, "what is the height", token_budget=budget)
+    assert summarized and len(text) <= budget * CHARS_PER_TOKEN
+    assert text.startswith("50000(25000(") and "[n=" in text
+
+    text, _ = encode_for_prompt(tree, "what is under 77777", token_budget=budget)
+    assert len(text) <= budget * CHARS_PER_TOKEN
+    assert "77777(,77778)" in text
+
+
+def test_deep_region_gets_its_own_line():
+    text, summarized = encode_for_prompt(_chain(50000), "show node 40000", token_budget=200)
+    overview, region = text.split("\n")
+    assert summarized and len(text) <= 200 * CHARS_PER_TOKEN
+    assert overview == "[n=50000 h=50000 1..50000]"
+    assert region.startswith("40000 at depth 40000: 40000(,40001(,40002(")
+
+
+def test_focus_values_are_the_numbers_in_the_message():
+    assert focus_values("insert 3 left of -1, then find 12") == {3, -1, 12}
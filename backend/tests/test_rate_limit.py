@@ -0,0 +1,125 @@
+import asyncio, os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from rate_limit import MemoryBackend, RateLimiter, RateLimitRule, RedisBackend
+
+
+class FakeRedis:
+    """The slice of the redis.asyncio API that RedisBackend uses."""
+
+    def __init__(self):
+        self.data = {}
+        self.ttl = {}
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+    async def decr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) - 1
+        return self.data[key]
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def incr(self, key):
+        self.commands.append(("incr", key))
+
+    def expire(self, key, seconds):
+        self.commands.append(("expire", key, seconds))
+
+    def get(self, key):
+        self.commands.append(("get", key))
+
+    async def execute(self):
+        results = []
+        for name, key, *args in self.commands:
+            if name == "incr":
+                self.redis.data[key] = int(self.redis.data.get(key, 0)) + 1
+                results.append(self.redis.data[key])
+            elif name == "expire":
+                self.redis.ttl[key] = args[0]
+                results.append(True)
+            else:
+                value = self.redis.data.get(key)
+                results.append(None if value is None else str(value).encode())
+        return results
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _limiter(backend, clock):
+    return RateLimiter(
+        backend,
+        default=RateLimitRule("default", 4, 10, per="user"),
+        rules=[RateLimitRule("login", 2, 10, per="ip", methods=frozenset({"POST"}), paths=("/auth/login",))],
+        clock=clock,
+    )
+
+
+def _run_sliding_window(backend):
+    clock = Clock(1000.0)
+    limiter = _limiter(backend, clock)
+    check = lambda *args: asyncio.run(limiter.check(*args))
+
+    results = [check("GET", "/trees", "1.1.1.1", 7) for _ in range(5)]
+    assert [r.allowed for r in results] == [True] * 4 + [False]
+    assert results[3].remaining == 0 and results[4].rule == "default"
+    # Another user behind the same IP has its own budget
+    assert check("GET", "/trees", "1.1.1.1", 8).allowed
+
+    # Halfway into the next window the previous 4 requests weigh 2
+    clock.now = 1015.0
+    assert [check("GET", "/trees", "1.1.1.1", 7).allowed for _ in range(3)] == [True, True, False]
+
+    # Route rule applies per IP, and a rejection there leaves the default budget alone
+    assert [check("POST", "/auth/login", "2.2.2.2").allowed for _ in range(3)] == [True, True, False]
+    rejected = check("POST", "/auth/login", "2.2.2.2")
+    assert rejected.rule == "login" and 0 < rejected.retry_after <= 20
+    assert check("GET", "/trees", "2.2.2.2").remaining == 1
+
+
+def test_memory_backend_sliding_window():
+    _run_sliding_window(MemoryBackend())
+
+
+def test_redis_backend_sliding_window():
+    redis = FakeRedis()
+    _run_sliding_window(RedisBackend(redis))
+    assert redis.ttl and set(redis.ttl.values()) == {20}
+
+
+def test_memory_backend_evicts_idle_and_excess_keys():
+    backend = MemoryBackend(max_keys=3)
+    for i in range(3):
+        asyncio.run(backend.hit(f"k{i}", 5, 10, 1000.0))
+    asyncio.run(backend.hit("k3", 5, 10, 1001.0))
+    assert len(backend) == 3
+    # Two windows later every earlier key is idle and dropped
+    asyncio.run(backend.hit("fresh", 5, 10, 1021.0))
+    assert len(backend) == 1
+
+
+def test_middleware_returns_429_with_retry_after(monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+
+    monkeypatch.setattr(main, "rate_limiter", _limiter(MemoryBackend(), Clock(5000.0)))
+    client = TestClient(main.app)
+    statuses = [client.get('/health').status_code for _ in range(5)]
+    assert statuses == [200] * 4 + [429]
+    r = client.get('/health')
+    assert r.headers["retry-after"] == "10"
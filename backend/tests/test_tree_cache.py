@@ -0,0 +1,58 @@
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from tree_cache import DerivedTreeCache
+import ai_agent
+
+
+def _tree():
+    return {"value": 1, "left": {"value": 2, "left": None, "right": None}, "right": None}
+
+
+def test_entries_are_keyed_by_version_and_invalidated():
+    cache = DerivedTreeCache(max_entries=10, max_nodes=100)
+    tree = _tree()
+    stats = cache.get_stats(1, 0, tree)
+    assert cache.get_stats(1, 0, tree) is stats
+    assert cache.get(1, 1, "stats") is None
+
+    cache.invalidate(1)
+    assert cache.get(1, 0, "stats") is None and len(cache) == 0
+
+
+def test_lru_and_size_eviction():
+    cache = DerivedTreeCache(max_entries=2, max_nodes=5)
+    cache.put(1, 0, "stats", "a", 1)
+    cache.put(2, 0, "stats", "b", 1)
+    cache.get(1, 0, "stats")
+    cache.put(3, 0, "stats", "c", 1)
+    assert cache.get(2, 0, "stats") is None
+    assert cache.get(1, 0, "stats") == "a"
+
+    # 1 + 1 + 4 nodes exceeds max_nodes, so the least recently used entry goes
+    cache.put(4, 0, "stats", "d", 4)
+    assert cache.get(3, 0, "stats") is None
+    assert len(cache) == 2 and cache.get(4, 0, "stats") == "d"
+    cache.put(5, 0, "stats", "too big", 6)
+    assert cache.get(5, 0, "stats") is None
+
+
+def test_index_checkout_is_exclusive():
+    cache = DerivedTreeCache()
+    index = cache.take_index(1, 0, _tree())
+    cache.put_index(1, 0, index)
+    assert cache.take_index(1, 0, _tree()) is index
+    assert cache.take_index(1, 0, _tree()) is not index
+
+
+def test_agent_mutation_invalidates_cache(monkeypatch):
+    cache = DerivedTreeCache()
+    monkeypatch.setattr(ai_agent, "tree_cache", cache)
+    tree = _tree()
+    key = (7, 1)
+
+    text, _, _ = ai_agent.handle_rules(tree, "what is the height", cache_key=key)
+    assert "2" in text and cache.get(*key, "stats") is not None
+
+    _, modified, _ = ai_agent.handle_rules(tree, "insert 3 as left child of 2", cache_key=key)
+    assert modified
+    assert cache.get(*key, "stats") is None
@@ -0,0 +1,88 @@
+import copy
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import tree_utils as tu
+from tree_index import TreeIndex
+
+
+def _sample():
+    # value 2 appears twice; the left one comes first in preorder
+    return {
+        "value": 1,
+        "left": {"value": 3, "left": None, "right": {"value": 2, "left": None, "right": None}},
+        "right": {"value": 2, "left": {"value": 4, "left": None, "right": None}, "right": None},
+    }
+
+
+def test_lookup_matches_first_preorder_node():
+    tree = _sample()
+    index = TreeIndex(tree)
+    assert len(index) == 5
+    assert index.search(4) and not index.search(9)
+    assert index.path_of(2) == ("left", "right")
+    assert index.node_of(2) is tu.find_node(tree, 2)
+    parent, side = index.parent_of(4)
+    assert parent["value"] == 2 and side == "left"
+
+
+def test_mutations_match_tree_utils():
+    tree = _sample()
+    expected = copy.deepcopy(tree)
+    index = TreeIndex(tree)
+
+    assert index.insert(2, 7, "left") == ("left", "right", "left")
+    tu.insert_node(expected, 2, 7, "left")
+    assert tree == expected
+
+    # replacing a subtree drops its values from the index
+    assert index.insert(1, 8, "right") == ("right",)
+    tu.insert_node(expected, 1, 8, "right")
+    assert tree == expected
+    assert not index.search(4)
+
+    assert index.update(7, 9) == ("left", "right", "left")
+    tu.update_node(expected, 7, 9)
+    assert tree == expected and index.search(9) and not index.search(7)
+    assert index.update(42, 1) is None
+
+    assert index.delete(2) == [("left", "right")]
+    expected = tu.delete_node(expected, 2)
+    assert index.tree == expected
+    assert not index.search(9)
+    assert len(index) == 3
+
+    assert index.delete(1) == [()]
+    assert index.tree is None and len(index) == 0
+
+
+def test_mutations_record_changed_paths():
+    index = TreeIndex(None)
+    index.insert_root(1)
+    index.insert(1, 2, "left")
+    index.update(2, 3)
+    index.delete(3)
+    changes = index.drain_changes()
+    assert [path for path, _ in changes] == [(), ("left",), ("left", "value"), ("left",)]
+    assert changes[2][1] == 3 and changes[3][1] is None
+    assert index.changes == []
+
+
+def test_measure_tracks_mutations_without_walking_the_tree():
+    index = TreeIndex(_sample())
+    assert index.measure() == tu.measure_tree(index.tree) == (5, 3)
+
+    steps = [
+        lambda: index.insert(4, 5, "right"),   # deeper
+        lambda: index.insert(3, 6, "left"),    # same height
+        lambda: index.delete(5),               # the only deepest node goes
+        lambda: index.insert(2, 7, "left"),    # replaces the subtree under 2
+        lambda: index.update(6, 8),
+        lambda: index.delete(7),
+        lambda: index.delete(3),
+        lambda: index.delete(1),
+        lambda: index.insert_root(9),
+    ]
+    for step in steps:
+        step()
+        assert index.measure() == tu.measure_tree(index.tree)
+    assert index.measure() == (1, 1)
@@ -0,0 +1,78 @@
+import asyncio, os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from database import ASYNC_DATABASE_URL
+from models import TreeSession
+from tree_index import TreeIndex
+from tree_store import save_tree_data
+from tree_utils import build_balanced, measure_tree
+
+
+def _run(scenario):
+    async def go():
+        engine = create_async_engine(ASYNC_DATABASE_URL)
+        try:
+            sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+            return await scenario(sessions)
+        finally:
+            await engine.dispose()
+    return asyncio.run(go())
+
+
+async def _new_tree(sessions, tree_data):
+    async with sessions() as db:
+        tree = TreeSession(name="store", tree_data=tree_data, node_count=3, height=2)
+        db.add(tree)
+        await db.commit()
+        return tree.id
+
+
+def test_interleaved_writers_get_distinct_revisions():
+    async def scenario(sessions):
+        tree_id = await _new_tree(sessions, build_balanced([1, 2, 3]))
+        async with sessions() as a, sessions() as b:
+            # Both writers load revision 1 before either commits
+            tree_a = await a.get(TreeSession, tree_id)
+            tree_b = await b.get(TreeSession, tree_id)
+            assert tree_a.revision == tree_b.revision == 1
+
+            index = TreeIndex(tree_a.tree_data)
+            index.insert(3, 4, "right")
+            revision_a = await save_tree_data(a, tree_a, index.tree, index.drain_changes())
+            tree_b.name = "renamed"
+            revision_b = await save_tree_data(b, tree_b, None)
+
+        async with sessions() as db:
+            stored = await db.get(TreeSession, tree_id)
+            return revision_a, revision_b, tree_a.revision, tree_b.revision, stored
+
+    revision_a, revision_b, orm_a, orm_b, stored = _run(scenario)
+    assert (revision_a, revision_b) == (2, 3)
+    assert (orm_a, orm_b) == (2, 3)
+    assert (stored.revision, stored.name, stored.tree_data, stored.node_count) == (3, "renamed", None, 0)
+
+
+def test_conflicting_path_writes_store_the_last_writers_tree():
+    async def scenario(sessions):
+        tree_id = await _new_tree(sessions, build_balanced([1, 2, 3, 4, 5, 6, 7]))
+        async with sessions() as a, sessions() as b:
+            tree_a = await a.get(TreeSession, tree_id)
+            tree_b = await b.get(TreeSession, tree_id)
+
+            # A drops the left subtree; B, still on revision 1, edits inside it
+            index_a = TreeIndex(tree_a.tree_data)
+            index_a.delete(2)
+            await save_tree_data(a, tree_a, index_a.tree, index_a.drain_changes(), index_a.measure())
+            index_b = TreeIndex(tree_b.tree_data)
+            index_b.insert(3, 8, "right")
+            revision_b = await save_tree_data(b, tree_b, index_b.tree, index_b.drain_changes(), index_b.measure())
+
+        async with sessions() as db:
+            stored = await db.get(TreeSession, tree_id)
+            return revision_b, index_b.tree, stored
+
+    revision_b, tree_b, stored = _run(scenario)
+    # B's response describes exactly what is stored, summary included
+    assert revision_b == stored.revision == 3
+    assert stored.tree_data == tree_b
+    assert (stored.node_count, stored.height) == measure_tree(tree_b) == (8, 4)
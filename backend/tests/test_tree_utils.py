@@ -1,4 +1,4 @@
-import os, sys
+import json, os, sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "venv"))
 import tree_utils as tu
 
@@ -25,3 +25,107 @@ def test_find_leaf_nodes_and_height():
     leaves = tu.find_leaf_nodes(tree)
     assert 5 in leaves
     assert tu.calculate_height(tree) == 2
+
+
+def _chain(depth, side="left"):
+    root = {"value": 0, "left": None, "right": None}
+    node = root
+    for i in range(1, depth):
+        node[side] = {"value": i, "left": None, "right": None}
+        node = node[side]
+    return root
+
+
+def test_deep_chain_does_not_hit_recursion_limit():
+    depth = 5000
+    tree = _chain(depth)
+    assert tu.calculate_height(tree) == depth
+    assert tu.find_leaf_nodes(tree) == [depth - 1]
+    assert tu.preorder_traversal(tree) == list(range(depth))
+    assert tu.inorder_traversal(tree) == list(reversed(range(depth)))
+    assert tu.postorder_traversal(tree) == list(reversed(range(depth)))
+    assert tu.search_node(tree, depth - 1)
+    assert tu.insert_node(tree, depth - 1, -1, "right")
+    assert tu.update_node(tree, -1, -2) is tree
+    assert tu.delete_node(tree, 1) == {"value": 0, "left": None, "right": None}
+
+
+def test_traversal_generators_are_lazy_and_ordered():
+    tree = {
+        "value": 4,
+        "left": {"value": 2, "left": {"value": 1, "left": None, "right": None},
+                 "right": {"value": 3, "left": None, "right": None}},
+        "right": {"value": 6, "left": None, "right": {"value": 7, "left": None, "right": None}},
+    }
+    assert list(tu.iter_values(tree, "preorder")) == [4, 2, 1, 3, 6, 7]
+    assert list(tu.iter_values(tree, "inorder")) == [1, 2, 3, 4, 6, 7]
+    assert list(tu.iter_values(tree, "postorder")) == [1, 3, 2, 7, 6, 4]
+
+    values = tu.iter_values(tree, "inorder")
+    assert next(values) == 1
+    assert next(values) == 2
+
+
+def test_delete_and_update_semantics():
+    tree = {"value": 1, "left": {"value": 2, "left": None, "right": None},
+            "right": {"value": 2, "left": None, "right": None}}
+    assert tu.update_node(tree, 9, 10) is False
+    assert tu.delete_node(tree, 2) == {"value": 1, "left": None, "right": None}
+    assert tu.delete_node(tree, 1) is None
+
+
+def test_analyze_tree_matches_individual_helpers():
+    tree = {
+        "value": 4,
+        "left": {"value": 2, "left": {"value": 1, "left": None, "right": None},
+                 "right": {"value": 3, "left": None, "right": None}},
+        "right": {"value": 6, "left": None, "right": {"value": 9, "left": None, "right": None}},
+    }
+    stats = tu.analyze_tree(tree)
+    assert stats["height"] == tu.calculate_height(tree)
+    assert stats["node_count"] == 6
+    assert stats["leaves"] == tu.find_leaf_nodes(tree)
+    assert (stats["min_value"], stats["max_value"]) == (1, 9)
+    assert stats["preorder"] == tu.preorder_traversal(tree)
+    assert stats["inorder"] == tu.inorder_traversal(tree)
+    assert stats["postorder"] == tu.postorder_traversal(tree)
+
+    empty = tu.analyze_tree(None)
+    assert empty["height"] == 0 and empty["node_count"] == 0 and empty["min_value"] is None
+
+    mixed = tu.analyze_tree({"value": 1, "left": {"value": "a", "left": None, "right": None}, "right": None})
+    assert mixed["inorder"] == ["a", 1] and mixed["min_value"] is None and mixed["max_value"] is None
+
+
+def test_build_from_level_order_and_balanced():
+    tree = tu.build_from_level_order(iter([1, 2, 3, None, 4]))
+    assert tu.preorder_traversal(tree) == [1, 2, 4, 3]
+    assert tree["left"]["left"] is None
+    assert tu.build_from_level_order([]) is None
+
+    try:
+        tu.build_from_level_order([1, None, 3, 4])
+        assert False, "child of a gap should be rejected"
+    except ValueError:
+        pass
+
+    balanced = tu.build_balanced(range(1, 16), count=15)
+    assert tu.inorder_traversal(balanced) == list(range(1, 16))
+    assert tu.calculate_height(balanced) == 4
+
+    try:
+        tu.build_balanced([3, 1, 2])
+        assert False, "unsorted input should be rejected"
+    except ValueError:
+        pass
+
+
+def test_dump_json_handles_any_depth():
+    chain = None
+    for value in range(5000, 0, -1):
+        chain = {"value": value, "left": None, "right": chain}
+    expected = "".join('{"value": %d, "left": null, "right": ' % value for value in range(1, 5001))
+    assert tu.dump_json(chain) == expected + "null" + "}" * 5000
+
+    document = {"a": [1, 2.5, {"b": None}], "c": {}, "d": [], "e": 'quote "x"', "f": True}
+    assert tu.dump_json(document) == json.dumps(document)
@@ -0,0 +1,112 @@
+"""
+Cache of results derived from a tree (analysis, value index).
+
+Entries are keyed by ``(tree_id, tree_version, kind)`` so a stale entry can
+never be served for a newer version of the tree. Eviction is LRU, bounded
+both by entry count and by the total number of tree nodes held.
+
+Mutation paths must call ``invalidate(tree_id)`` after they change a tree.
+
+``TreeIndex`` objects are mutable, so they are checked out exclusively with
+``take_index`` and handed back with ``put_index`` once the request is done.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from metrics import TREE_CACHE_EVICTIONS, TREE_CACHE_HITS, TREE_CACHE_MISSES
+from tree_index import TreeIndex
+from tree_utils import analyze_tree
+
+TREE_CACHE_MAX_ENTRIES = int(os.environ.get("TREE_CACHE_MAX_ENTRIES", "256"))
+TREE_CACHE_MAX_NODES = int(os.environ.get("TREE_CACHE_MAX_NODES", "1000000"))
+
+
+class DerivedTreeCache:
+    def __init__(self, max_entries=TREE_CACHE_MAX_ENTRIES, max_nodes=TREE_CACHE_MAX_NODES):
+        self.max_entries = max_entries
+        self.max_nodes = max_nodes
+        self._entries = OrderedDict()  # (tree_id, version, kind) -> (value, weight)
+        self._total_weight = 0
+        self._lock = threading.Lock()
+
+    def get(self, tree_id, version, kind):
+        key = (tree_id, version, kind)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                TREE_CACHE_MISSES.labels(kind=kind).inc()
+                return None
+            self._entries.move_to_end(key)
+        TREE_CACHE_HITS.labels(kind=kind).inc()
+        return entry[0]
+
+    def put(self, tree_id, version, kind, value, weight):
+        if weight > self.max_nodes:
+            return
+        key = (tree_id, version, kind)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_weight -= previous[1]
+            self._entries[key] = (value, weight)
+            self._total_weight += weight
+            self._evict()
+
+    def pop(self, tree_id, version, kind):
+        key = (tree_id, version, kind)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                TREE_CACHE_MISSES.labels(kind=kind).inc()
+                return None
+            self._total_weight -= entry[1]
+        TREE_CACHE_HITS.labels(kind=kind).inc()
+        return entry[0]
+
+    def invalidate(self, tree_id):
+        """Drop every entry for ``tree_id``."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == tree_id]:
+                self._total_weight -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_weight = 0
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._total_weight > self.max_nodes
+        ):
+            _, (_, weight) = self._entries.popitem(last=False)
+            self._total_weight -= weight
+            TREE_CACHE_EVICTIONS.inc()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ---------- typed helpers ----------
+
+    def get_stats(self, tree_id, version, tree):
+        """Return ``analyze_tree(tree)``, computing and caching it on a miss."""
+        stats = self.get(tree_id, version, "stats")
+        if stats is None:
+            stats = analyze_tree(tree)
+            self.put(tree_id, version, "stats", stats, stats["node_count"] or 1)
+        return stats
+
+    def take_index(self, tree_id, version, tree):
+        """Check out the TreeIndex for this version (building one on a miss)."""
+        index = self.pop(tree_id, version, "index")
+        if index is None:
+            index = TreeIndex(tree)
+        return index
+
+    def put_index(self, tree_id, version, index):
+        """Return an index checked out with ``take_index``."""
+        index.drain_changes()
+        self.put(tree_id, version, "index", index, len(index) or 1)
+
+
+tree_cache = DerivedTreeCache()
@@ -0,0 +1,196 @@
+"""
+Value index for nested-dict trees.
+
+``TreeIndex`` maps every value to the node(s) holding it and records each
+node's parent, so lookups, inserts and updates no longer need a full DFS.
+Build it once per loaded tree and route every mutation through it so the
+index stays in sync with ``tree``.
+
+Every mutation also appends a ``(path, value)`` entry to ``changes`` saying
+which part of the document it rewrote, so persistence can write just that
+part (see ``tree_store``). An empty path means the whole document.
+
+The index also counts nodes per depth, so ``measure()`` returns the
+``(node_count, height)`` summary without walking the tree.
+
+Resolution matches ``tree_utils``: when a value appears more than once, the
+first node in preorder wins. A node's path is the tuple of sides ("left" /
+"right") taken from the root; preorder is exactly lexicographic path order.
+"""
+from collections import Counter
+
+from tree_utils import iter_with_depth
+
+
+class TreeIndex:
+    def __init__(self, tree):
+        self.tree = tree
+        self._by_value = {}
+        self._parent = {}
+        self._depths = Counter()  # depth -> number of nodes at that depth
+        self._height = 0
+        self.changes = []
+        if tree is not None:
+            self._add_subtree(tree, None, None, 1)
+
+    # ---------- bookkeeping ----------
+
+    def _add_subtree(self, node, parent, side, depth):
+        """Index the subtree rooted at ``node``, which sits at ``depth``."""
+        self._parent[id(node)] = (parent, side)
+        offset = depth - 1
+        for current, relative in iter_with_depth(node):
+            self._by_value.setdefault(current.get("value"), []).append(current)
+            self._depths[relative + offset] += 1
+            if relative + offset > self._height:
+                self._height = relative + offset
+            for child_side in ("left", "right"):
+                child = current.get(child_side)
+                if child is not None:
+                    self._parent[id(child)] = (current, child_side)
+
+    def _remove_subtree(self, node, depth):
+        offset = depth - 1
+        for current, relative in iter_with_depth(node):
+            self._parent.pop(id(current), None)
+            self._discard_value(current.get("value"), current)
+            self._depths[relative + offset] -= 1
+        # Only removing the deepest nodes lowers the height
+        while self._height and not self._depths[self._height]:
+            del self._depths[self._height]
+            self._height -= 1
+
+    def _discard_value(self, value, node):
+        nodes = self._by_value.get(value)
+        if not nodes:
+            return
+        for i, candidate in enumerate(nodes):
+            if candidate is node:
+                del nodes[i]
+                break
+        if not nodes:
+            del self._by_value[value]
+
+    # ---------- lookups ----------
+
+    def __len__(self):
+        return len(self._parent)
+
+    def __contains__(self, value):
+        return value in self._by_value
+
+    def measure(self):
+        """Return ``(node_count, height)``, the same as ``tree_utils.measure_tree``."""
+        return len(self), self._height
+
+    def path_to(self, node):
+        """Return the path (tuple of 'left'/'right') from the root to ``node``."""
+        sides = []
+        parent, side = self._parent[id(node)]
+        while parent is not None:
+            sides.append(side)
+            parent, side = self._parent[id(parent)]
+        return tuple(reversed(sides))
+
+    def node_of(self, value):
+        """Return the first node (in preorder) holding ``value``, or None."""
+        nodes = self._by_value.get(value)
+        if not nodes:
+            return None
+        if len(nodes) == 1:
+            return nodes[0]
+        return min(nodes, key=self.path_to)
+
+    def path_of(self, value):
+        """Return the path to the first node holding ``value``, or None."""
+        node = self.node_of(value)
+        return None if node is None else self.path_to(node)
+
+    def parent_of(self, value):
+        """Return ``(parent_node, side)`` for ``value``; parent is None for the root."""
+        node = self.node_of(value)
+        if node is None:
+            return None
+        return self._parent[id(node)]
+
+    def search(self, value):
+        return value in self._by_value
+
+    def drain_changes(self):
+        """Return and clear the change log accumulated since the last drain."""
+        changes, self.changes = self.changes, []
+        return changes
+
+    # ---------- mutations ----------
+
+    def insert_root(self, value):
+        """Create the root of an empty tree; returns its path, or None if not empty."""
+        if self.tree is not None:
+            return None
+        self.tree = {"value": value, "left": None, "right": None}
+        self._add_subtree(self.tree, None, None, 1)
+        self.changes.append(((), self.tree))
+        return ()
+
+    def insert(self, parent_value, new_value, position):
+        """
+        Attach ``new_value`` as the ``position`` child of ``parent_value``,
+        replacing any existing subtree there (same as ``tree_utils.insert_node``).
+        Returns the new node's path, or None if the parent was not found.
+        """
+        parent = self.node_of(parent_value)
+        if parent is None:
+            return None
+
+        if position not in ("left", "right"):
+            return self.path_to(parent)
+
+        path = self.path_to(parent) + (position,)
+        replaced = parent.get(position)
+        if replaced is not None:
+            self._remove_subtree(replaced, len(path) + 1)
+
+        node = {"value": new_value, "left": None, "right": None}
+        parent[position] = node
+        self._add_subtree(node, parent, position, len(path) + 1)
+        self.changes.append((path, node))
+        return path
+
+    def delete(self, value):
+        """
+        Remove every subtree whose root holds ``value``.
+        Returns the paths that were detached (``[()]`` when the root goes).
+        """
+        nodes = list(self._by_value.get(value, ()))
+        detached = []
+        for node in sorted(nodes, key=self.path_to):
+            if id(node) not in self._parent:
+                # Already removed as part of an earlier subtree.
+                continue
+            path = self.path_to(node)
+            parent, side = self._parent[id(node)]
+            if parent is None:
+                self.tree = None
+                self._by_value.clear()
+                self._parent.clear()
+                self._depths.clear()
+                self._height = 0
+                self.changes.append(((), None))
+                return [()]
+            parent[side] = None
+            self._remove_subtree(node, len(path) + 1)
+            detached.append(path)
+            self.changes.append((path, None))
+        return detached
+
+    def update(self, old_value, new_value):
+        """Change the first node holding ``old_value``; returns its path or None."""
+        node = self.node_of(old_value)
+        if node is None:
+            return None
+        self._discard_value(old_value, node)
+        node["value"] = new_value
+        self._by_value.setdefault(new_value, []).append(node)
+        path = self.path_to(node)
+        self.changes.append((path + ("value",), new_value))
+        return path
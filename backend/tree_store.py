@@ -0,0 +1,113 @@
+"""
+Persistence for ``TreeSession.tree_data``.
+
+By default a mutation rewrites the whole JSONB document. When the caller
+passes the ``TreeIndex`` change log and the database is PostgreSQL, the
+change is instead written as nested ``jsonb_set`` calls. Only the touched
+subtrees are sent, and Postgres rewrites them in place of the full document.
+Other dialects (SQLite in tests) always fall back to the full write.
+
+Set ``TREE_PATH_UPDATES=0`` to force full-document writes everywhere.
+"""
+import json
+import os
+
+from sqlalchemy import Text, cast, func, literal, update
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from starlette.concurrency import run_in_threadpool
+
+from models import TreeSession
+from tree_utils import measure_tree
+
+TREE_PATH_UPDATES = os.environ.get("TREE_PATH_UPDATES", "1") in ("1", "true", "True")
+# Past this many changes a single document write is cheaper than nested jsonb_set calls
+TREE_PATH_UPDATE_MAX_CHANGES = int(os.environ.get("TREE_PATH_UPDATE_MAX_CHANGES", "32"))
+
+
+def supports_path_updates(db: AsyncSession):
+    return TREE_PATH_UPDATES and db.get_bind().dialect.name == "postgresql"
+
+
+def _bump_revision(tree_id: int, values):
+    """
+    UPDATE setting ``values`` and incrementing the revision in the database,
+    returning the new revision. Concurrent writers each get their own.
+    """
+    return (
+        update(TreeSession)
+        .where(TreeSession.id == tree_id)
+        .values(revision=TreeSession.revision + 1, **values)
+        .returning(TreeSession.revision)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def build_patch_statement(tree_id: int, loaded_revision: int, changes, node_count=None, height=None):
+    """
+    UPDATE applying ``changes`` with nested jsonb_set and bumping the revision.
+
+    The paths in ``changes`` are only valid against the document they were
+    computed from, so the row must still be at ``loaded_revision``; when
+    another writer got there first the statement matches no row.
+    """
+    expression = TreeSession.tree_data
+    for path, value in changes:
+        expression = func.jsonb_set(
+            expression,
+            cast(literal(list(path)), ARRAY(Text)),
+            cast(literal(json.dumps(value)), JSONB),
+        )
+
+    values = {"tree_data": expression}
+    if node_count is not None:
+        values.update(node_count=node_count, height=height)
+    return _bump_revision(tree_id, values).where(TreeSession.revision == loaded_revision)
+
+
+def _can_patch(db: AsyncSession, changes):
+    if changes is None or not supports_path_updates(db):
+        return False
+    if not changes or len(changes) > TREE_PATH_UPDATE_MAX_CHANGES:
+        return False
+    # An empty path replaces the root, which is a full write anyway
+    return all(path for path, _ in changes)
+
+
+async def save_tree_data(db: AsyncSession, tree: TreeSession, tree_data, changes=None, summary=None):
+    """
+    Persist ``tree_data`` for ``tree``, bump its revision, refresh the
+    node_count/height summary and commit. Returns the new revision.
+
+    ``changes`` is a ``TreeIndex`` change log describing how ``tree_data``
+    differs from what is stored. ``summary`` is its ``(node_count, height)``
+    when the caller already knows it (``TreeIndex.measure()``); otherwise the
+    tree is walked in the threadpool to compute it. A path write only applies
+    if the row is still at the revision ``tree`` was loaded at; otherwise the
+    full document is written instead. The ORM instance is left populated with
+    the new data, so reading it afterwards does not reload the document.
+    """
+    if summary is None:
+        summary = await run_in_threadpool(measure_tree, tree_data)
+    node_count, height = summary
+
+    revision = None
+    if _can_patch(db, changes):
+        statement = build_patch_statement(tree.id, tree.revision, changes, node_count, height)
+        revision = (await db.execute(statement)).scalar_one_or_none()
+    if revision is None:
+        # Not patchable, or the stored tree moved on since it was loaded:
+        # write the whole document (last writer wins, but stays consistent)
+        statement = _bump_revision(
+            tree.id, {"tree_data": tree_data, "node_count": node_count, "height": height}
+        )
+        revision = (await db.execute(statement)).scalar_one()
+    # Other pending changes on ``tree`` (e.g. a rename) go out with the commit
+    await db.commit()
+
+    set_committed_value(tree, "tree_data", tree_data)
+    set_committed_value(tree, "revision", revision)
+    set_committed_value(tree, "node_count", node_count)
+    set_committed_value(tree, "height", height)
+    return revision
@@ -1,56 +1,173 @@
+"""
+Helpers for working with trees stored as nested dicts.
+
+A tree is either ``None`` (empty) or a node of the form
+``{"value": ..., "left": <node or None>, "right": <node or None>}``, which is
+exactly how it is persisted in ``TreeSession.tree_data``.
+
+Every helper walks the tree with an explicit stack instead of recursing, so
+arbitrarily deep (e.g. chain-shaped) trees never hit Python's recursion limit.
+The ``iter_*`` generators yield nodes lazily, which lets callers stop early
+without building a full result list.
+"""
+import json
+from collections import deque
+
+
+def iter_preorder(node):
+    """Yield nodes in preorder (node, left, right)."""
+    stack = [node] if node is not None else []
+    while stack:
+        current = stack.pop()
+        yield current
+        right = current.get("right")
+        if right is not None:
+            stack.append(right)
+        left = current.get("left")
+        if left is not None:
+            stack.append(left)
+
+
+def iter_inorder(node):
+    """Yield nodes in inorder (left, node, right)."""
+    stack = []
+    current = node
+    while stack or current is not None:
+        while current is not None:
+            stack.append(current)
+            current = current.get("left")
+        current = stack.pop()
+        yield current
+        current = current.get("right")
+
+
+def iter_postorder(node):
+    """Yield nodes in postorder (left, right, node)."""
+    stack = []
+    current = node
+    last_visited = None
+    while stack or current is not None:
+        while current is not None:
+            stack.append(current)
+            current = current.get("left")
+        top = stack[-1]
+        right = top.get("right")
+        if right is not None and right is not last_visited:
+            current = right
+        else:
+            last_visited = stack.pop()
+            yield last_visited
+
+
+def iter_with_depth(node):
+    """Yield ``(node, depth)`` pairs in preorder; the root has depth 1."""
+    stack = [(node, 1)] if node is not None else []
+    while stack:
+        current, depth = stack.pop()
+        yield current, depth
+        right = current.get("right")
+        if right is not None:
+            stack.append((right, depth + 1))
+        left = current.get("left")
+        if left is not None:
+            stack.append((left, depth + 1))
+
+
+_ORDERS = {
+    "preorder": iter_preorder,
+    "inorder": iter_inorder,
+    "postorder": iter_postorder,
+}
+
+
+def walk(node, order="preorder"):
+    """Yield nodes in the given order ('preorder', 'inorder' or 'postorder')."""
+    try:
+        iterator = _ORDERS[order]
+    except KeyError:
+        raise ValueError(f"Unknown traversal order: {order}")
+    return iterator(node)
+
+
+def iter_values(node, order="preorder"):
+    """Yield node values lazily in the given order."""
+    for current in walk(node, order):
+        yield current.get("value")
+
+
+def find_node(node, value):
+    """Return the first node (in preorder) holding ``value``, or None."""
+    for current in iter_preorder(node):
+        if current.get("value") == value:
+            return current
+    return None
+
+
 def calculate_height(node):
-    if node is None:
-        return 0
+    height = 0
+    for _, depth in iter_with_depth(node):
+        if depth > height:
+            height = depth
+    return height
 
-    left_height = calculate_height(node.get("left"))
-    right_height = calculate_height(node.get("right"))
 
-    return max(left_height, right_height) + 1
+def measure_tree(node):
+    """Return ``(node_count, height)`` in one walk."""
+    node_count = 0
+    height = 0
+    for _, depth in iter_with_depth(node):
+        node_count += 1
+        if depth > height:
+            height = depth
+    return node_count, height
 
 
 def find_leaf_nodes(node, leaves=None):
     if leaves is None:
         leaves = []
 
-    if node is None:
-        return leaves
-
-    if node.get("left") is None and node.get("right") is None:
-        leaves.append(node.get("value"))
-
-    find_leaf_nodes(node.get("left"), leaves)
-    find_leaf_nodes(node.get("right"), leaves)
+    for current in iter_preorder(node):
+        if current.get("left") is None and current.get("right") is None:
+            leaves.append(current.get("value"))
 
     return leaves
 
+
 def insert_node(node, parent_value, new_value, position):
-    if node is None:
+    parent = find_node(node, parent_value)
+    if parent is None:
         return False
 
-    if node.get("value") == parent_value:
-        if position == "left":
-            node["left"] = {"value": new_value, "left": None, "right": None}
-        elif position == "right":
-            node["right"] = {"value": new_value, "left": None, "right": None}
-        return True
+    if position == "left":
+        parent["left"] = {"value": new_value, "left": None, "right": None}
+    elif position == "right":
+        parent["right"] = {"value": new_value, "left": None, "right": None}
+    return True
 
-    return (
-        insert_node(node.get("left"), parent_value, new_value, position)
-        or insert_node(node.get("right"), parent_value, new_value, position)
-    )
 
 def delete_node(node, value):
-    if node is None:
-        return None
-
-    if node.get("value") == value:
+    """
+    Remove every subtree whose root holds ``value``.
+    Returns the new root (None if the root itself was deleted).
+    """
+    if node is None or node.get("value") == value:
         return None
 
-    node["left"] = delete_node(node.get("left"), value)
-    node["right"] = delete_node(node.get("right"), value)
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        for side in ("left", "right"):
+            child = current.get(side)
+            if child is None:
+                continue
+            if child.get("value") == value:
+                current[side] = None
+            else:
+                stack.append(child)
 
     return node
 
+
 def update_node(node, old_value, new_value):
     """
     Update a node's value in the tree.
@@ -59,29 +176,19 @@ def update_node(node, old_value, new_value):
     if node is None:
         return node
 
-    if node.get("value") == old_value:
-        node["value"] = new_value
-        return node
+    target = find_node(node, old_value)
+    if target is None:
+        return False
+
+    target["value"] = new_value
+    return node
 
-    # Try to find and update in left subtree
-    if update_node(node.get("left"), old_value, new_value):
-        return node
-    
-    # Try to find and update in right subtree
-    if update_node(node.get("right"), old_value, new_value):
-        return node
-    
-    return False
 
 def inorder_traversal(node, result=None):
     if result is None:
         result = []
 
-    if node:
-        inorder_traversal(node.get("left"), result)
-        result.append(node.get("value"))
-        inorder_traversal(node.get("right"), result)
-
+    result.extend(iter_values(node, "inorder"))
     return result
 
 
@@ -89,11 +196,7 @@ def preorder_traversal(node, result=None):
     if result is None:
         result = []
 
-    if node:
-        result.append(node.get("value"))
-        preorder_traversal(node.get("left"), result)
-        preorder_traversal(node.get("right"), result)
-
+    result.extend(iter_values(node, "preorder"))
     return result
 
 
@@ -101,11 +204,7 @@ def postorder_traversal(node, result=None):
     if result is None:
         result = []
 
-    if node:
-        postorder_traversal(node.get("left"), result)
-        postorder_traversal(node.get("right"), result)
-        result.append(node.get("value"))
-
+    result.extend(iter_values(node, "postorder"))
     return result
 
 
@@ -114,10 +213,198 @@ def search_node(node, value):
     Search for a node with the given value in the tree.
     Returns True if found, False otherwise.
     """
-    if node is None:
-        return False
+    return find_node(node, value) is not None
 
-    if node.get("value") == value:
-        return True
 
-    return search_node(node.get("left"), value) or search_node(node.get("right"), value)
\ No newline at end of file
+def analyze_tree(node):
+    """
+    Compute height, node count, leaves, min/max value and all three
+    traversal orders in a single walk of the tree.
+    """
+    stats = {
+        "height": 0,
+        "node_count": 0,
+        "leaves": [],
+        "min_value": None,
+        "max_value": None,
+        "preorder": [],
+        "inorder": [],
+        "postorder": [],
+    }
+    preorder = stats["preorder"]
+    inorder = stats["inorder"]
+    postorder = stats["postorder"]
+    leaves = stats["leaves"]
+
+    # Each node is visited three times: on entry (preorder), after its left
+    # subtree (inorder) and after its right subtree (postorder).
+    stack = [(node, 1, 0)] if node is not None else []
+    while stack:
+        current, depth, stage = stack.pop()
+        value = current.get("value")
+        left = current.get("left")
+        right = current.get("right")
+
+        if stage == 0:
+            preorder.append(value)
+            if depth > stats["height"]:
+                stats["height"] = depth
+            if left is None and right is None:
+                leaves.append(value)
+            stack.append((current, depth, 1))
+            if left is not None:
+                stack.append((left, depth + 1, 0))
+        elif stage == 1:
+            inorder.append(value)
+            stack.append((current, depth, 2))
+            if right is not None:
+                stack.append((right, depth + 1, 0))
+        else:
+            postorder.append(value)
+
+    stats["node_count"] = len(preorder)
+    if preorder:
+        try:
+            stats["min_value"] = min(preorder)
+            stats["max_value"] = max(preorder)
+        except TypeError:
+            # tree_data accepts any JSON value; mixed types have no order
+            stats["min_value"] = stats["max_value"] = None
+
+    return stats
+
+
+_MISSING = object()
+
+
+class LevelOrderBuilder:
+    """
+    Incrementally build a tree from a heap-style level-order sequence.
+
+    Position ``i`` holds the node whose children sit at ``2i + 1`` and
+    ``2i + 2``; ``None`` marks a gap. Values are fed one at a time with
+    ``push`` so the input never has to be materialised as a list.
+    """
+
+    def __init__(self):
+        self.root = None
+        self._parents = deque()
+        self._position = 0
+
+    def push(self, value):
+        node = None if value is None else {"value": value, "left": None, "right": None}
+
+        if self._position == 0:
+            self.root = node
+        else:
+            parent = self._parents[0]
+            side = "left" if self._position % 2 == 1 else "right"
+            if parent is None:
+                if node is not None:
+                    raise ValueError(
+                        f"Value {value} at position {self._position} has no parent"
+                    )
+            else:
+                parent[side] = node
+            if side == "right":
+                self._parents.popleft()
+
+        self._parents.append(node)
+        self._position += 1
+
+    def finish(self):
+        return self.root
+
+
+def build_from_level_order(values):
+    """Build a tree in O(n) from a heap-style level-order iterable (None = gap)."""
+    builder = LevelOrderBuilder()
+    for value in values:
+        builder.push(value)
+    return builder.finish()
+
+
+def build_balanced(sorted_values, count=None):
+    """
+    Build a height-balanced tree in O(n) whose inorder traversal is
+    ``sorted_values``. Values are consumed in order, so a streamed iterable
+    is fine when ``count`` is given; otherwise it is read into a list first.
+    """
+    if count is None:
+        sorted_values = list(sorted_values)
+        count = len(sorted_values)
+
+    values = iter(sorted_values)
+    previous = []
+
+    def take():
+        try:
+            value = next(values)
+        except StopIteration:
+            raise ValueError(f"Expected {count} values, got fewer")
+        if previous and value < previous[0]:
+            raise ValueError("Values must be sorted in ascending order")
+        previous[:] = [value]
+        return value
+
+    # Recursion depth is log2(count), so this stays far below the limit.
+    def build(size):
+        if size == 0:
+            return None
+        left = build((size - 1) // 2)
+        node = {"value": take(), "left": left, "right": None}
+        node["right"] = build(size - 1 - (size - 1) // 2)
+        return node
+
+    root = build(count)
+    if next(values, _MISSING) is not _MISSING:
+        raise ValueError(f"Expected {count} values, got more")
+    return root
+
+
+class _Text(str):
+    """Already-encoded JSON punctuation on the ``dump_json`` stack."""
+
+
+def dump_json(value, default=None):
+    """
+    ``json.dumps(value, default=default)`` for arbitrarily deep documents.
+
+    The C encoder recurses once per nesting level, so chain-shaped trees
+    raise RecursionError; those are encoded with an explicit stack instead.
+    """
+    try:
+        return json.dumps(value, default=default)
+    except RecursionError:
+        pass
+
+    parts = []
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if type(item) is _Text:
+            parts.append(item)
+        elif isinstance(item, dict):
+            # Push in reverse so the first entry is encoded first
+            stack.append(_Text("}"))
+            entries = list(item.items())
+            for index in range(len(entries) - 1, -1, -1):
+                key, child = entries[index]
+                stack.append(child)
+                stack.append(_Text((", " if index else "{") + json.dumps(str(key)) + ": "))
+            if not entries:
+                stack.append(_Text("{"))
+        elif isinstance(item, (list, tuple)):
+            stack.append(_Text("]"))
+            for index in range(len(item) - 1, -1, -1):
+                stack.append(item[index])
+                stack.append(_Text(", " if index else "["))
+            if not item:
+                stack.append(_Text("["))
+        elif item is None or isinstance(item, (str, int, float, bool)):
+            parts.append(json.dumps(item))
+        elif default is not None:
+            stack.append(default(item))
+        else:
+            raise TypeError(f"Object of type {type(item).__name__} is not JSON serializable")
+    return "".join(parts)
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
-import { addMessage, clearMessages, setTyping } from '../redux/chatSlice';
+import { addMessage, clearMessages, setMessages, prependMessages, setTyping } from '../redux/chatSlice';
 import { chatAPI, treeAPI } from '../services/api';
 import { formatTime, convertTreeToFlowData } from '../utils/treeUtils';
 import { setTreeVisualization } from '../redux/treeSlice';
@@ -15,7 +15,16 @@ import '../styles/chat-panel.css';
  * - Auto-scroll to latest message
  * - Export chat as JSON
  * - Clear chat history
+ * - Load saved history page by page
  */
+
+// Each stored exchange becomes a user message followed by the bot reply
+const historyToMessages = (records) =>
+  records.flatMap((record) => [
+    { id: `${record.id}-q`, text: record.message, sender: 'user', timestamp: record.timestamp },
+    { id: `${record.id}-a`, text: record.response, sender: 'bot', timestamp: record.timestamp },
+  ]);
+
 function ChatPanel() {
   const dispatch = useDispatch();
   const { selectedTree } = useSelector((state) => state.tree);
@@ -23,6 +32,8 @@ function ChatPanel() {
 
   const [inputValue, setInputValue] = useState('');
   const [loading, setLoading] = useState(false);
+  const [nextBeforeId, setNextBeforeId] = useState(null);
+  const [loadingHistory, setLoadingHistory] = useState(false);
   const messagesEndRef = useRef(null);
 
   // Auto-scroll to latest message
@@ -34,6 +45,42 @@ function ChatPanel() {
     scrollToBottom();
   }, [messages, typing]);
 
+  // Load the most recent page of history whenever the selected tree changes
+  useEffect(() => {
+    dispatch(clearMessages());
+    setNextBeforeId(null);
+    if (!selectedTree) return undefined;
+
+    let cancelled = false;
+    chatAPI
+      .getChatHistory(selectedTree.id)
+      .then((page) => {
+        if (cancelled) return;
+        dispatch(setMessages(historyToMessages(page.messages)));
+        setNextBeforeId(page.next_before_id);
+      })
+      .catch((err) => console.error('Failed to load chat history:', err));
+
+    return () => {
+      cancelled = true;
+    };
+  }, [selectedTree?.id, dispatch]);
+
+  // ==================== LOAD EARLIER MESSAGES ====================
+  const handleLoadEarlier = async () => {
+    if (!selectedTree || nextBeforeId == null) return;
+    setLoadingHistory(true);
+    try {
+      const page = await chatAPI.getChatHistory(selectedTree.id, nextBeforeId);
+      dispatch(prependMessages(historyToMessages(page.messages)));
+      setNextBeforeId(page.next_before_id);
+    } catch (err) {
+      console.error('Failed to load earlier messages:', err);
+    } finally {
+      setLoadingHistory(false);
+    }
+  };
+
   // Refresh tree visualization after chat-based operations
   const refreshTreeVisualization = async () => {
     if (!selectedTree) return;
@@ -98,6 +145,7 @@ function ChatPanel() {
     try {
       await chatAPI.clearChat(selectedTree.id);
       dispatch(clearMessages());
+      setNextBeforeId(null);
     } catch (error) {
       console.error('Error clearing chat:', error);
       alert('Failed to clear chat');
@@ -166,6 +214,16 @@ function ChatPanel() {
         </div>
       ) : (
         <div className="chat-messages">
+          {nextBeforeId != null && (
+            <button
+              className="chat-header-btn"
+              onClick={handleLoadEarlier}
+              disabled={loadingHistory}
+            >
+              {loadingHistory ? 'Loading…' : 'Load earlier messages'}
+            </button>
+          )}
+
           {/* Render all messages */}
           {messages.map((message) => (
             <div key={message.id} className={`chat-message ${message.sender}`}>
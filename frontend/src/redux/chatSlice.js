@@ -32,6 +32,10 @@ const chatSlice = createSlice({
     setMessages: (state, action) => {
       state.messages = action.payload;
     },
+    // Insert an older page of history above the current messages
+    prependMessages: (state, action) => {
+      state.messages = [...action.payload, ...state.messages];
+    },
     // Loading and error states
     setLoading: (state, action) => {
       state.loading = action.payload;
@@ -47,6 +51,7 @@ export const {
   setTyping,
   clearMessages,
   setMessages,
+  prependMessages,
   setLoading,
   setError,
 } = chatSlice.actions;
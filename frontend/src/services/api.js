@@ -97,8 +97,18 @@ export const authAPI = {
 // ==================== TREE ENDPOINTS ====================
 
 export const treeAPI = {
-  // Get all saved trees
-  getTrees: () => apiCall('/trees', { method: 'GET' }),
+  // Get all saved trees as summaries (no tree_data), following every page
+  getTrees: async () => {
+    const trees = [];
+    let afterId = null;
+    do {
+      const cursor = afterId === null ? '' : `&after_id=${afterId}`;
+      const page = await apiCall(`/trees/summary?limit=200${cursor}`, { method: 'GET' });
+      trees.push(...page.items);
+      afterId = page.next_after_id;
+    } while (afterId !== null && afterId !== undefined);
+    return trees;
+  },
 
   // Create new tree
   createTree: (name) =>
@@ -174,9 +184,12 @@ export const chatAPI = {
       body: JSON.stringify({ tree_id: treeId, message }),
     }),
 
-  // Get chat history
-  getChatHistory: (treeId) =>
-    apiCall(`/chat/history/${treeId}`, { method: 'GET' }),
+  // Get one page of chat history (newest first page; pass beforeId for older)
+  getChatHistory: (treeId, beforeId = null, limit = 50) => {
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (beforeId != null) params.set('before_id', String(beforeId));
+    return apiCall(`/chat/history/${treeId}?${params}`, { method: 'GET' });
+  },
 
   // Clear chat history
   clearChat: (treeId) =>